@@ -5,7 +5,7 @@ from django.test import TestCase, Client
 
 class StaticURLTests(TestCase):
     def setUp(self):
-        super().setUpClass()
+        super().setUp()
         self.guest_client = Client()
 
     def test_about_pages(self):
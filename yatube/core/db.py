@@ -0,0 +1,22 @@
+"""Настройка соединений SQLite при открытии.
+
+Прагмы из settings.SQLITE_PRAGMAS выполняются для каждого нового
+соединения (сигнал connection_created). journal_mode=WAL сохраняется
+в файле базы, остальные прагмы действуют только в своём соединении.
+"""
+from django.conf import settings
+
+# Как у Django: модуль sqlite3 ждёт блокировку 5 секунд.
+CONNECT_TIMEOUT = 5.0
+
+
+def pragma_statements(pragmas):
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(settings.SQLITE_PRAGMAS):
+            cursor.execute(statement)
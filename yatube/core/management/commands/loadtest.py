@@ -0,0 +1,291 @@
+import http.client
+import json
+import multiprocessing
+import random
+import threading
+import time
+from collections import defaultdict
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode, urlsplit
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.test import Client
+from django.urls import reverse
+
+from core.utils import percentile
+from posts.models import Group, Post, User
+
+
+DEFAULT_MIX = (
+    'index=40,group_posts=15,profile=15,follow_index=10,'
+    'post_create=5,add_comment=10,profile_follow=5'
+)
+
+
+def _path(name, **kwargs):
+    return reverse(f'posts:{name}', kwargs=kwargs)
+
+
+# Имя маршрута -> (нужна ли авторизация, построитель запроса).
+# Построитель получает выборку данных и генератор случайных чисел и
+# возвращает метод, путь и тело запроса.
+SCENARIOS = {
+    'index': (False, lambda data, rng: ('GET', _path('index'), None)),
+    'group_posts': (False, lambda data, rng: (
+        'GET', _path('group_posts', slug=rng.choice(data['slugs'])), None)),
+    'profile': (False, lambda data, rng: (
+        'GET', _path('profile', username=rng.choice(data['usernames'])),
+        None)),
+    'post_detail': (False, lambda data, rng: (
+        'GET', _path('post_detail', post_id=rng.choice(data['post_ids'])),
+        None)),
+    'follow_index': (True, lambda data, rng: (
+        'GET', _path('follow_index'), None)),
+    'post_create': (True, lambda data, rng: (
+        'POST', _path('post_create'),
+        urlencode({'text': f'Пост нагрузочного теста {rng.random()}'}))),
+    'add_comment': (True, lambda data, rng: (
+        'POST',
+        _path('add_comment', post_id=rng.choice(data['post_ids'])),
+        urlencode({'text': f'Комментарий нагрузки {rng.random()}'}))),
+    'profile_follow': (True, lambda data, rng: (
+        'GET',
+        _path('profile_follow', username=rng.choice(data['usernames'])),
+        None)),
+}
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise CommandError(
+                f'Неизвестный сценарий {name!r}, '
+                f'доступны: {", ".join(SCENARIOS)}')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def summarize(samples, duration):
+    """Сводка по замерам (имя маршрута, задержка в секундах, статус).
+
+    Статус None означает сетевую ошибку; ошибкой считается и любой
+    ответ с кодом 400 и выше.
+    """
+    groups = defaultdict(list)
+    for sample in samples:
+        groups[sample[0]].append(sample)
+        groups['total'].append(sample)
+
+    summary = {}
+    for name, group in sorted(groups.items()):
+        latencies = sorted(latency * 1000 for _, latency, _ in group)
+        errors = sum(
+            1 for _, _, status in group if status is None or status >= 400)
+        summary[name] = {
+            'requests': len(group),
+            'errors': errors,
+            'error_rate': round(errors / len(group), 4),
+            'throughput_rps': round(len(group) / duration, 2),
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies), 2),
+                'p50': round(percentile(latencies, 0.50), 2),
+                'p95': round(percentile(latencies, 0.95), 2),
+                'p99': round(percentile(latencies, 0.99), 2),
+                'max': round(latencies[-1], 2),
+            },
+        }
+    return summary
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(server):
+    connections.close_all()
+    server.serve_forever()
+
+
+def start_server(workers, port=0):
+    """Запускает yatube.wsgi в workers процессах на общем сокете.
+
+    Возвращает адрес сервера и список процессов.
+    """
+    from yatube.wsgi import application
+
+    server = ThreadingWSGIServer(
+        ('127.0.0.1', port), QuietWSGIRequestHandler)
+    server.set_app(application)
+    # Соединения с базой не должны переживать fork.
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=_serve, args=(server,), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    address = server.server_address
+    server.server_close()
+    return address, processes
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест: поднимает yatube.wsgi в нескольких процессах и '
+        'гоняет смешанный трафик, считая задержки и ошибки по маршрутам. '
+        'Пишущие сценарии создают посты, комментарии и подписки в '
+        'текущей базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность замера в секундах.')
+        parser.add_argument(
+            '--warmup', type=float, default=2,
+            help='Прогрев в секундах, не входит в статистику.')
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Количество процессов сервера.')
+        parser.add_argument(
+            '--target',
+            help='Адрес уже запущенного сервера вместо локального.')
+        parser.add_argument(
+            '--mix', default=DEFAULT_MIX,
+            help='Веса сценариев: имя=вес через запятую.')
+        parser.add_argument(
+            '--sessions', type=int, default=50,
+            help='Сколько пользователей авторизовать для сценариев.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Куда записать JSON отчёт.')
+
+    def handle(self, *args, **options):
+        weights = parse_mix(options['mix'])
+        data = self.sample_data(options['sessions'])
+
+        processes = []
+        if options['target']:
+            target = urlsplit(options['target'])
+            address = (target.hostname, target.port or 80)
+        else:
+            address, processes = start_server(options['workers'])
+        try:
+            samples = self.run(address, weights, data, options)
+        finally:
+            for process in processes:
+                process.terminate()
+                process.join()
+
+        summary = summarize(samples, options['duration'])
+        self.print_summary(summary)
+        if options['output']:
+            report = {
+                'config': {
+                    name: options[name] for name in (
+                        'concurrency', 'duration', 'warmup', 'workers',
+                        'sessions', 'seed')
+                },
+                'mix': weights,
+                'urls': summary,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=4, sort_keys=True)
+
+    def sample_data(self, sessions):
+        data = {
+            'slugs': list(
+                Group.objects.values_list('slug', flat=True)[:1000]),
+            'usernames': list(
+                User.objects.values_list('username', flat=True)[:1000]),
+            'post_ids': list(Post.objects.values_list('id', flat=True)[:1000]),
+            'sessions': [],
+        }
+        if not all(data[key] for key in ('slugs', 'usernames', 'post_ids')):
+            raise CommandError(
+                'В базе нет групп, пользователей или постов: '
+                'заполните её командой seed_yatube.')
+
+        for user in User.objects.all()[:sessions]:
+            client = Client()
+            client.force_login(user)
+            request = HttpRequest()
+            csrf_token = get_token(request)
+            cookie = '; '.join((
+                f'{settings.SESSION_COOKIE_NAME}='
+                f'{client.cookies[settings.SESSION_COOKIE_NAME].value}',
+                f'{settings.CSRF_COOKIE_NAME}={request.META["CSRF_COOKIE"]}',
+            ))
+            data['sessions'].append(
+                {'Cookie': cookie, 'X-CSRFToken': csrf_token})
+        return data
+
+    def run(self, address, weights, data, options):
+        samples = []
+        started = time.monotonic()
+        measure_from = started + options['warmup']
+        deadline = measure_from + options['duration']
+
+        def worker(seed):
+            rng = random.Random(seed)
+            names, name_weights = list(weights), list(weights.values())
+            while time.monotonic() < deadline:
+                name = rng.choices(names, name_weights)[0]
+                auth, build = SCENARIOS[name]
+                method, path, body = build(data, rng)
+                headers = {}
+                if auth:
+                    headers.update(rng.choice(data['sessions']))
+                if body is not None:
+                    headers['Content-Type'] = (
+                        'application/x-www-form-urlencoded')
+                request_started = time.monotonic()
+                try:
+                    connection = http.client.HTTPConnection(
+                        *address, timeout=60)
+                    connection.request(method, path, body, headers)
+                    response = connection.getresponse()
+                    response.read()
+                    status = response.status
+                    connection.close()
+                except (OSError, http.client.HTTPException):
+                    status = None
+                if request_started >= measure_from:
+                    samples.append(
+                        (name, time.monotonic() - request_started, status))
+
+        threads = [
+            threading.Thread(target=worker, args=(options['seed'] + index,))
+            for index in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples
+
+    def print_summary(self, summary):
+        self.stdout.write(
+            f'{"маршрут":<16}{"запросов":>10}{"ошибок":>9}{"rps":>9}'
+            f'{"p50":>9}{"p95":>9}{"p99":>9}')
+        for name, stats in summary.items():
+            latency = stats['latency_ms']
+            self.stdout.write(
+                f'{name:<16}{stats["requests"]:>10}'
+                f'{stats["error_rate"]:>9.2%}{stats["throughput_rps"]:>9}'
+                f'{latency["p50"]:>9}{latency["p95"]:>9}{latency["p99"]:>9}')
@@ -0,0 +1,152 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import CONNECT_TIMEOUT, pragma_statements
+from core.utils import percentile
+
+
+SCHEMA = (
+    'CREATE TABLE post ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, author_id INTEGER NOT NULL, '
+    'pub_date REAL NOT NULL, text TEXT NOT NULL)',
+    'CREATE INDEX post_author_pub_date ON post (author_id, pub_date DESC)',
+)
+READ_SQL = (
+    'SELECT id, text FROM post WHERE author_id = ? '
+    'ORDER BY pub_date DESC LIMIT 10')
+WRITE_SQL = 'INSERT INTO post (author_id, pub_date, text) VALUES (?, ?, ?)'
+AUTHORS = 100
+
+
+def dash(value):
+    # Перцентиля нет, если на стороне не было ни одной операции.
+    return '-' if value is None else value
+
+
+def prepare(path, rows):
+    connection = sqlite3.connect(path)
+    with connection:
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.executemany(WRITE_SQL, (
+            (index % AUTHORS, time.time() - index, f'Пост {index}')
+            for index in range(rows)))
+    connection.close()
+
+
+def run_worker(path, pragmas, kind, seed, deadline):
+    """Читает или пишет до deadline в своём соединении.
+
+    Возвращает задержки успешных операций и число ошибок «locked».
+    """
+    rng = random.Random(seed)
+    connection = sqlite3.connect(
+        path, timeout=CONNECT_TIMEOUT, isolation_level=None)
+    for statement in pragma_statements(pragmas):
+        connection.execute(statement)
+    samples = []
+    errors = 0
+    while time.monotonic() < deadline:
+        author_id = rng.randrange(AUTHORS)
+        started = time.monotonic()
+        try:
+            if kind == 'read':
+                connection.execute(READ_SQL, (author_id,)).fetchall()
+            else:
+                connection.execute('BEGIN')
+                connection.execute(
+                    WRITE_SQL, (author_id, time.time(), 'Новый пост'))
+                connection.execute('COMMIT')
+        except sqlite3.OperationalError as error:
+            if 'locked' not in str(error):
+                raise
+            errors += 1
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            continue
+        samples.append(time.monotonic() - started)
+    connection.close()
+    return samples, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite при параллельных чтениях '
+        'и записях с настройками по умолчанию и с SQLITE_PRAGMAS. '
+        'Работает на временной базе, рабочую не трогает.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument(
+            '--duration', type=float, default=5,
+            help='Длительность каждого прогона в секундах.')
+        parser.add_argument(
+            '--rows', type=int, default=20000,
+            help='Сколько строк положить в базу перед прогоном.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Куда записать JSON отчёт.')
+
+    def handle(self, *args, **options):
+        report = {}
+        for name, pragmas in (
+                ('default', {}), ('tuned', settings.SQLITE_PRAGMAS)):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'benchmark.sqlite3')
+                prepare(path, options['rows'])
+                report[name] = self.run(path, pragmas, options)
+
+        self.stdout.write(
+            f'{"режим":<10}{"чтений/с":>12}{"записей/с":>12}{"locked":>9}'
+            f'{"p99 чт, мс":>13}{"p99 зп, мс":>13}')
+        for name, result in report.items():
+            self.stdout.write(
+                f'{name:<10}{result["reads_per_second"]:>12}'
+                f'{result["writes_per_second"]:>12}'
+                f'{result["locked_errors"]:>9}'
+                f'{dash(result["read_p99_ms"]):>13}'
+                f'{dash(result["write_p99_ms"]):>13}')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=4, sort_keys=True)
+
+    def run(self, path, pragmas, options):
+        latencies = {'read': [], 'write': []}
+        locked = []
+        deadline = time.monotonic() + options['duration']
+
+        def worker(kind, seed):
+            samples, errors = run_worker(path, pragmas, kind, seed, deadline)
+            latencies[kind].extend(samples)
+            locked.append(errors)
+
+        threads = [
+            threading.Thread(
+                target=worker, args=(kind, options['seed'] + index))
+            for index, kind in enumerate(
+                ['read'] * options['readers']
+                + ['write'] * options['writers'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        result = {'locked_errors': sum(locked)}
+        for kind, samples in latencies.items():
+            samples.sort()
+            result[f'{kind}s'] = len(samples)
+            result[f'{kind}s_per_second'] = round(
+                len(samples) / options['duration'], 1)
+            p99 = percentile(samples, 0.99)
+            result[f'{kind}_p99_ms'] = (
+                None if p99 is None else round(p99 * 1000, 2))
+        return result
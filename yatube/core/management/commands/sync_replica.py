@@ -0,0 +1,55 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db import CONNECT_TIMEOUT
+from core.routers import mark_replica_synced
+
+
+def copy_database(source, target):
+    """Копирует базу source в файл target через SQLite backup API.
+
+    Копия делается за один шаг, поэтому читатели реплики видят либо
+    прежнее, либо новое состояние целиком.
+    """
+    source_connection = sqlite3.connect(source, timeout=CONNECT_TIMEOUT)
+    target_connection = sqlite3.connect(target, timeout=CONNECT_TIMEOUT)
+    try:
+        source_connection.backup(target_connection)
+    finally:
+        target_connection.close()
+        source_connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в файл реплики для чтения '
+        '(settings.REPLICA_DATABASE). С --interval повторяет копирование.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', default=settings.DATABASES['default']['NAME'])
+        parser.add_argument('--target', default=settings.REPLICA_DATABASE)
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Пауза между копиями в секундах; 0 — скопировать один раз.')
+
+    def handle(self, *args, **options):
+        if not options['target']:
+            raise CommandError(
+                'Реплика не настроена: задайте REPLICA_DATABASE '
+                'или --target.')
+        while True:
+            started = time.monotonic()
+            # Копия содержит всё, что закоммичено до её начала.
+            synced_at = time.time()
+            copy_database(options['source'], options['target'])
+            mark_replica_synced(synced_at)
+            self.stdout.write(
+                f'Реплика {options["target"]} обновлена за '
+                f'{(time.monotonic() - started) * 1000:.0f} мс')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
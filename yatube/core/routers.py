@@ -0,0 +1,132 @@
+"""Чтение с реплики, запись в основную базу.
+
+ReplicaMiddleware открывает на время запроса состояние маршрутизации и
+разрешает чтение с реплики только для страниц из REPLICA_READ_VIEWS.
+Всё остальное — запись, фоновые задачи, команды — работает с default.
+Как только в запросе что-то записано, дальнейшие чтения тоже идут
+в default, а пользователь закрепляется за основной базой cookie
+REPLICA_PIN_COOKIE на REPLICA_PIN_SECONDS секунд: так он сразу видит
+свой пост или комментарий, даже если реплика отстаёт. Записи, которые
+ReplicaRouter не видит (очередь записей, шарды постов), отмечают запрос
+через mark_written.
+
+Страница, собранная по отстающей реплике, попала бы в кэши и ETag под
+текущим поколением и пережила бы cookie. Поэтому sync_replica запоминает,
+когда снята копия, и страница читается с реплики, только если её данные
+(REPLICA_PAGE_MODIFIED) не менялись после этого. Ленту подписок в
+REPLICA_READ_VIEWS не включаем: она зависит от подписок пользователя,
+а он до SessionMiddleware ещё не известен.
+"""
+import contextvars
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import Resolver404, resolve
+from django.utils.module_loading import import_string
+
+
+# Сессии всегда читаются из default: новая сессия после входа могла
+# ещё не доехать до реплики.
+PRIMARY_APPS = {'sessions'}
+SAFE_METHODS = ('GET', 'HEAD')
+
+_state = contextvars.ContextVar('db_routing', default=None)
+
+REPLICA_SYNCED_KEY = 'core:replica:synced'
+
+
+def mark_replica_synced(timestamp):
+    """Запоминает время, на которое реплика совпадает с default."""
+    cache.set(REPLICA_SYNCED_KEY, timestamp, timeout=None)
+
+
+def replica_synced_at():
+    # Неизвестное время копии — реплика отстаёт от всего.
+    return cache.get(REPLICA_SYNCED_KEY, 0)
+
+
+def mark_written():
+    """Отмечает текущий запрос как пишущий, если запись прошла мимо
+    ReplicaRouter.db_for_write.
+    """
+    state = _state.get()
+    if state is not None:
+        state.wrote = True
+
+
+class RoutingState:
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (
+            state is None
+            or not state.use_replica
+            or state.wrote
+            or model._meta.app_label in PRIMARY_APPS
+        ):
+            return None
+        return settings.REPLICA_DATABASE_ALIAS
+
+    def db_for_write(self, model, **hints):
+        mark_written()
+        # Без явного ответа Django пишет туда, откуда объект прочитан,
+        # то есть в реплику.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — копия default, объекты из них можно связывать.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == settings.REPLICA_DATABASE_ALIAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """Направляет чтения страниц из REPLICA_READ_VIEWS на реплику.
+
+    Должна стоять до SessionMiddleware, чтобы сохранение сессии тоже
+    считалось записью.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(self.use_replica(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS, httponly=True)
+        return response
+
+    def use_replica(self, request):
+        if settings.REPLICA_DATABASE_ALIAS is None:
+            return False
+        if request.method not in SAFE_METHODS:
+            return False
+        if settings.REPLICA_PIN_COOKIE in request.COOKIES:
+            return False
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        if match.view_name not in settings.REPLICA_READ_VIEWS:
+            return False
+        modified = import_string(settings.REPLICA_PAGE_MODIFIED)(
+            match.view_name, match.kwargs)
+        return modified is None or modified <= replica_synced_at()
@@ -0,0 +1,48 @@
+"""Фоновые задачи в пуле потоков процесса.
+
+Задача ставится в очередь после коммита текущей транзакции, поэтому видит
+записанные ею строки; если транзакция откатилась, задача не выполняется.
+При BACKGROUND_TASKS_ASYNC = False задачи выполняются сразу и синхронно:
+так удобнее в тестах и в management-командах.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_TASKS_WORKERS,
+                thread_name_prefix='yatube-task')
+    return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой', func)
+    finally:
+        # У каждого потока своё соединение с базой: не оставляем его
+        # открытым между задачами.
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    if not settings.BACKGROUND_TASKS_ASYNC:
+        func(*args, **kwargs)
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(_run, func, args, kwargs))
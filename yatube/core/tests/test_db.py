@@ -0,0 +1,45 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+
+class SqlitePragmasTest(TestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connection_is_configured(self):
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('cache_size'), -20000)
+        self.assertEqual(self.pragma('temp_store'), 2)
+
+
+class SqliteBenchmarkCommandTest(SimpleTestCase):
+
+    def test_reports_both_modes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            call_command(
+                'sqlite_benchmark', readers=2, writers=1, duration=0.2,
+                rows=100, output=path, stdout=StringIO())
+            with open(path, encoding='utf-8') as report_file:
+                report = json.load(report_file)
+        self.assertEqual(set(report), {'default', 'tuned'})
+        for result in report.values():
+            self.assertGreater(result['reads'], 0)
+            self.assertGreater(result['writes'], 0)
+
+    def test_summary_without_readers(self):
+        stdout = StringIO()
+        call_command(
+            'sqlite_benchmark', readers=0, writers=1, duration=0.1,
+            rows=10, stdout=stdout)
+        self.assertIn(' -', stdout.getvalue())
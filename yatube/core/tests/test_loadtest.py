@@ -0,0 +1,42 @@
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+
+from core.management.commands.loadtest import parse_mix, summarize
+from core.utils import percentile
+
+
+class LoadTestReportTest(SimpleTestCase):
+
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.50), 50)
+        self.assertEqual(percentile(values, 0.95), 95)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.99), 7)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_summarize_counts_errors_per_url(self):
+        samples = [
+            ('index', 0.010, 200),
+            ('index', 0.030, 200),
+            ('index', 0.020, 500),
+            ('add_comment', 0.050, 302),
+            ('add_comment', 0.070, None),
+        ]
+        summary = summarize(samples, duration=2)
+
+        self.assertEqual(summary['index']['requests'], 3)
+        self.assertEqual(summary['index']['errors'], 1)
+        self.assertEqual(summary['index']['throughput_rps'], 1.5)
+        self.assertEqual(summary['index']['latency_ms']['p50'], 20)
+        self.assertEqual(summary['add_comment']['errors'], 1)
+        self.assertEqual(summary['total']['requests'], 5)
+        self.assertEqual(summary['total']['error_rate'], 0.4)
+        self.assertEqual(summary['total']['latency_ms']['max'], 70)
+
+    def test_parse_mix(self):
+        self.assertEqual(
+            parse_mix('index=3, follow_index=1'),
+            {'index': 3, 'follow_index': 1})
+        with self.assertRaises(CommandError):
+            parse_mix('unknown=1')
@@ -0,0 +1,163 @@
+"""Бюджеты производительности для всех страниц posts, about и users.
+
+Для каждого маршрута на заполненной базе измеряются количество SQL
+запросов, суммарное время в базе и время рендеринга шаблонов. Результаты
+сравниваются с performance_budget.json; превышение любого показателя
+роняет тест. Если задана переменная окружения PERFORMANCE_REPORT,
+измерения дополнительно пишутся в JSON-файл по этому пути.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.template.base import Template
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from about import urls as about_urls
+from posts import urls as posts_urls
+from posts.models import ChunkedUpload, Comment, Follow, Group, Post
+from users import urls as users_urls
+from yatube.settings import MAX_POST_ON_PAGE
+
+
+User = get_user_model()
+
+BUDGET_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'performance_budget.json')
+
+URLCONFS = (posts_urls, about_urls, users_urls)
+
+
+@contextmanager
+def render_timer():
+    """Считает время верхнеуровневых вызовов Template.render.
+
+    Вложенные шаблоны (include, extends) входят во время внешнего.
+    """
+    timings = {'render': 0.0}
+    original_render = Template.render
+    depth = 0
+
+    def render(self, context):
+        nonlocal depth
+        depth += 1
+        started = time.perf_counter()
+        try:
+            return original_render(self, context)
+        finally:
+            depth -= 1
+            if depth == 0:
+                timings['render'] += time.perf_counter() - started
+
+    with mock.patch.object(Template, 'render', render):
+        yield timings
+
+
+def url_names():
+    for urlconf in URLCONFS:
+        for pattern in urlconf.urlpatterns:
+            yield f'{urlconf.app_name}:{pattern.name}', pattern
+
+
+class PerformanceBudgetTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.author = User.objects.create_user(
+            username='author', first_name='Имя', last_name='Фамилия')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.groups = [
+            Group.objects.create(
+                title=f'Группа {index}', slug=f'group-{index}')
+            for index in range(3)
+        ]
+        users = [cls.author, cls.reader] + [
+            User.objects.create_user(username=f'user{index}')
+            for index in range(5)
+        ]
+        for index in range(MAX_POST_ON_PAGE * 3):
+            cls.post = Post.objects.create(
+                author=users[index % len(users)],
+                group=cls.groups[index % len(cls.groups)],
+                text=f'Тестовый пост {index}')
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.groups[0], text='Пост с обсуждением')
+        for index, user in enumerate(users * 3):
+            Comment.objects.create(
+                post=cls.post, author=user, text=f'Комментарий {index}')
+        for user in users[1:]:
+            Follow.objects.create(user=cls.author, author=user)
+            Follow.objects.create(user=user, author=cls.author)
+
+        cls.url_kwargs = {
+            'slug': cls.groups[0].slug,
+            'username': cls.author.username,
+            'post_id': cls.post.id,
+            'upload_id': ChunkedUpload.objects.create(
+                user=cls.author, file_name='photo.jpg', size=1024).pk,
+        }
+        # Подписка на самого себя ничего не делает: подписываемся на другого.
+        cls.url_kwargs_overrides = {
+            'posts:profile_follow': {'username': cls.reader.username},
+            'posts:profile_unfollow': {'username': cls.reader.username},
+        }
+
+        with open(BUDGET_PATH, encoding='utf-8') as budget_file:
+            cls.budget = json.load(budget_file)
+
+    def reverse(self, url_name, pattern):
+        overrides = self.url_kwargs_overrides.get(url_name, {})
+        kwargs = {
+            name: overrides.get(name, self.url_kwargs[name])
+            for name in pattern.pattern.converters
+        }
+        return reverse(url_name, kwargs=kwargs)
+
+    def measure(self, url):
+        client = Client()
+        client.force_login(self.author)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            with render_timer() as timings:
+                response = client.get(url)
+        return response, {
+            'queries': len(queries),
+            'db_ms': round(
+                sum(float(query['time']) for query in queries) * 1000, 2),
+            'render_ms': round(timings['render'] * 1000, 2),
+        }
+
+    def test_budget_covers_every_url(self):
+        self.assertEqual(
+            set(self.budget),
+            {url_name for url_name, _ in url_names()},
+            'performance_budget.json не совпадает со списком маршрутов')
+
+    def test_urls_fit_budget(self):
+        report = {}
+        for url_name, pattern in url_names():
+            url = self.reverse(url_name, pattern)
+            with self.subTest(url_name=url_name, url=url):
+                response, measured = self.measure(url)
+                report[url_name] = measured
+                self.assertLess(response.status_code, 400)
+                budget = self.budget[url_name]
+                for metric, value in measured.items():
+                    self.assertLessEqual(
+                        value, budget[metric],
+                        f'{url_name}: {metric} = {value}, '
+                        f'бюджет {budget[metric]}')
+
+        report_path = os.environ.get('PERFORMANCE_REPORT')
+        if report_path:
+            with open(report_path, 'w', encoding='utf-8') as report_file:
+                json.dump(report, report_file, indent=4, sort_keys=True)
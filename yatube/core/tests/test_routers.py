@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+
+from core.routers import (
+    ReplicaMiddleware, ReplicaRouter, mark_replica_synced, replica_synced_at)
+from core.write_queue import run_write
+from posts.cache import INDEX, bump_generations, page_modified
+from posts.models import Post
+from posts.sharding import ShardRouter
+
+
+@override_settings(REPLICA_DATABASE_ALIAS='replica')
+class ReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        cache.clear()
+        page_modified('posts:index', {})
+        mark_replica_synced(time.time())
+
+    def handle(self, request, write=False):
+        """Прогоняет запрос через middleware и запоминает базы чтения."""
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(Post))
+            if write:
+                self.router.db_for_write(Post)
+                reads.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        response = ReplicaMiddleware(view)(request)
+        return reads, response
+
+    def test_read_view_uses_replica(self):
+        reads, response = self.handle(self.factory.get(reverse('posts:index')))
+        self.assertEqual(reads, ['replica'])
+        self.assertNotIn('primary_pin', response.cookies)
+
+    def test_write_pins_user_to_primary(self):
+        reads, response = self.handle(
+            self.factory.get(reverse('posts:index')), write=True)
+        self.assertEqual(reads, ['replica', None])
+        self.assertEqual(response.cookies['primary_pin']['max-age'], 10)
+
+        request = self.factory.get(reverse('posts:index'))
+        request.COOKIES['primary_pin'] = '1'
+        reads, response = self.handle(request)
+        self.assertEqual(reads, [None])
+
+    def test_other_requests_use_primary(self):
+        requests = {
+            'запись': self.factory.post(reverse('posts:index')),
+            'не из REPLICA_READ_VIEWS': self.factory.get(
+                reverse('posts:post_create')),
+            'неизвестный путь': self.factory.get('/missing/'),
+            'лента подписок': self.factory.get(reverse('posts:follow_index')),
+        }
+        for name, request in requests.items():
+            with self.subTest(name):
+                self.assertEqual(self.handle(request)[0], [None])
+
+    def test_writes_past_replica_router_pin_user(self):
+        def queued(request):
+            run_write(Post.objects.create, text='Пост')
+
+        def sharded(request):
+            ShardRouter().db_for_write(Post, instance=Post(author_id=1))
+
+        with override_settings(
+                WRITE_QUEUE_ENABLED=True, POST_SHARDS=['shard_a'],
+                POST_SHARD_BUCKETS=4), \
+                mock.patch('core.write_queue.get_write_queue'):
+            for name, write in (('очередь', queued), ('шард', sharded)):
+                with self.subTest(name):
+                    def view(request):
+                        write(request)
+                        reads.append(self.router.db_for_read(Post))
+                        return HttpResponse()
+
+                    reads = []
+                    response = ReplicaMiddleware(view)(
+                        self.factory.get(reverse('posts:index')))
+                    self.assertEqual(reads, [None])
+                    self.assertIn('primary_pin', response.cookies)
+
+    def test_sessions_and_background_use_primary(self):
+        def view(request):
+            reads.append(self.router.db_for_read(Session))
+            return HttpResponse()
+
+        reads = []
+        ReplicaMiddleware(view)(self.factory.get(reverse('posts:index')))
+        self.assertEqual(reads, [None])
+        self.assertIsNone(self.router.db_for_read(Post))
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+
+    def test_replica_is_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+        self.assertIsNone(self.router.allow_migrate('default', 'posts'))
+
+    def test_page_changed_after_sync_uses_primary(self):
+        bump_generations(INDEX)
+        reads, _ = self.handle(self.factory.get(reverse('posts:index')))
+        self.assertEqual(reads, [None])
+        reads, _ = self.handle(self.factory.get(reverse('about:author')))
+        self.assertEqual(reads, ['replica'])
+
+        mark_replica_synced(time.time())
+        reads, _ = self.handle(self.factory.get(reverse('posts:index')))
+        self.assertEqual(reads, ['replica'])
+
+    @override_settings(REPLICA_DATABASE_ALIAS=None)
+    def test_disabled_without_replica(self):
+        reads, _ = self.handle(self.factory.get(reverse('posts:index')))
+        self.assertEqual(reads, [None])
+
+
+class SyncReplicaCommandTest(SimpleTestCase):
+
+    def test_copies_database(self):
+        cache.clear()
+        started = time.time()
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'source.sqlite3')
+            target = os.path.join(directory, 'target.sqlite3')
+            connection = sqlite3.connect(source)
+            with connection:
+                connection.execute('CREATE TABLE item (id INTEGER)')
+                connection.execute('INSERT INTO item VALUES (1)')
+            call_command(
+                'sync_replica', source=source, target=target,
+                stdout=StringIO())
+            with connection:
+                connection.execute('INSERT INTO item VALUES (2)')
+            connection.close()
+            call_command(
+                'sync_replica', source=source, target=target,
+                stdout=StringIO())
+
+            replica = sqlite3.connect(target)
+            rows = replica.execute(
+                'SELECT id FROM item ORDER BY id').fetchall()
+            replica.close()
+        self.assertEqual(rows, [(1,), (2,)])
+        self.assertGreaterEqual(replica_synced_at(), started)
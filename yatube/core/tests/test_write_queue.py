@@ -0,0 +1,149 @@
+import threading
+from unittest import mock
+
+from django.db import IntegrityError, OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core.write_queue import (
+    WriteQueue, WriteTimeout, get_write_queue, run_write)
+from posts.cache import get_generations, post_scope
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class WriteQueueTest(TransactionTestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        # Большая задержка, чтобы все задания теста попали в одну пачку.
+        self.queue = WriteQueue(max_batch=100, max_delay=0.2)
+        self.addCleanup(self.queue.stop)
+
+    def comment(self, index):
+        return Comment(
+            post=self.post, author=self.author, text=f'Комментарий {index}')
+
+    def test_concurrent_writes_share_a_transaction(self):
+        errors = []
+
+        def write(index):
+            try:
+                self.queue.run(self.comment(index).save)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [
+            threading.Thread(target=write, args=(index,))
+            for index in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Comment.objects.count(), 10)
+        self.assertLess(self.queue.batches, 10)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 10)
+
+    def test_failed_job_does_not_roll_back_batch(self):
+        reader = User.objects.create_user(username='reader')
+        first = self.queue.submit(
+            Follow.objects.create, user=reader, author=self.author)
+        broken = self.queue.submit(
+            Group.objects.create, title='Группа', slug=None)
+        last = self.queue.submit(self.comment(0).save)
+
+        self.assertIsInstance(first.result(), Follow)
+        with self.assertRaises(IntegrityError):
+            broken.result()
+        last.result()
+        self.assertEqual(self.queue.batches, 1)
+        self.assertTrue(
+            Follow.objects.filter(user=reader, author=self.author).exists())
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertFalse(Group.objects.exists())
+
+    def test_failed_transaction_fails_every_job(self):
+        with mock.patch('core.write_queue.transaction') as transaction:
+            transaction.atomic.side_effect = OperationalError('locked')
+            futures = [
+                self.queue.submit(self.comment(index).save)
+                for index in range(3)]
+            for future in futures:
+                with self.assertRaises(OperationalError):
+                    future.result(timeout=5)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_timed_out_job_is_cancelled(self):
+        queue = WriteQueue(max_batch=1, max_delay=0, timeout=0.1)
+        self.addCleanup(queue.stop)
+        # Первая пачка держит писателя, пока запрос не отвалится.
+        release = threading.Event()
+        queue.submit(release.wait, 5)
+        with self.assertRaises(WriteTimeout):
+            queue.run(self.comment(0).save)
+        release.set()
+        queue.stop()
+        self.assertFalse(Comment.objects.exists())
+
+    def test_cache_is_invalidated_after_commit(self):
+        scope = post_scope(self.post.id)
+        before = get_generations([scope])[scope]
+        seen = []
+
+        def save():
+            self.comment(0).save()
+            seen.append(get_generations([scope])[scope])
+
+        self.queue.run(save)
+        self.assertEqual(seen, [before])
+        self.assertNotEqual(get_generations([scope])[scope], before)
+
+
+@override_settings(WRITE_QUEUE_ENABLED=True)
+class WriteQueueViewsTest(TransactionTestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        self.client.force_login(self.reader)
+
+    def tearDown(self):
+        get_write_queue().stop()
+
+    def test_comment_is_committed_before_response(self):
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            {'text': 'Комментарий'})
+        self.assertTrue(Comment.objects.filter(
+            post=self.post, author=self.reader).exists())
+
+    @mock.patch('posts.views.run_write', side_effect=WriteTimeout)
+    def test_write_timeout_keeps_comment_form(self, run_write):
+        response = self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            {'text': 'Несохранённый комментарий'})
+        self.assertEqual(response.status_code, 503)
+        self.assertContains(
+            response, 'Несохранённый комментарий', status_code=503)
+        self.assertContains(response, 'alert-danger', status_code=503)
+
+        response = self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'author'}))
+        self.assertEqual(response.status_code, 503)
+
+    def test_follow_is_committed_before_response(self):
+        self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'author'}))
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.author).exists())
+
+
+class WriteQueueDisabledTest(TestCase):
+
+    def test_runs_in_request_thread(self):
+        self.assertEqual(run_write(threading.get_ident), threading.get_ident())
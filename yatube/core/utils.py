@@ -0,0 +1,10 @@
+"""Вспомогательные функции management-команд приложения core."""
+import math
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль по методу ближайшего ранга."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
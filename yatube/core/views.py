@@ -1,4 +1,9 @@
 from django.shortcuts import render
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+
+# Год: дольше браузеры всё равно не хранят.
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
 
 
 def page_not_found(request, exception):
@@ -15,3 +20,11 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def serve_immutable(request, path, document_root=None):
+    """Раздаёт файл, содержимое которого по этому адресу не меняется."""
+    response = serve(request, path, document_root)
+    patch_cache_control(
+        response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
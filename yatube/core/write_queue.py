@@ -0,0 +1,158 @@
+"""Очередь записей: мелкие вставки коммитятся пачками.
+
+Один поток-писатель забирает задания из очереди и выполняет их в общей
+транзакции: пачка закрывается, когда набралось WRITE_QUEUE_MAX_BATCH
+заданий или прошло WRITE_QUEUE_MAX_DELAY секунд с первого. Каждое задание
+выполняется в своей точке сохранения, поэтому ошибка одного не откатывает
+остальные. Запрос ждёт, пока пачка с его заданием будет закоммичена, и
+получает результат задания или его исключение. Так блокировка записи
+и fsync достаются одной транзакции на много запросов. Не дождавшись
+коммита за WRITE_QUEUE_TIMEOUT секунд, запрос получает WriteTimeout,
+а его задание, если оно ещё не начато, отменяется.
+
+При WRITE_QUEUE_ENABLED = False задания выполняются сразу в потоке запроса.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+from core.routers import mark_written
+
+
+_STOP = object()
+
+
+class WriteTimeout(Exception):
+    """Пачка с заданием не закоммичена за отведённое время."""
+
+
+class WriteQueue:
+
+    def __init__(self, max_batch, max_delay, timeout=None):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        # Число закоммиченных пачек: для мониторинга и тестов.
+        self.batches = 0
+        self._jobs = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Ставит задание в очередь и возвращает его Future."""
+        future = Future()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop, name='yatube-write-queue',
+                    daemon=True)
+                self._thread.start()
+        self._jobs.put((future, func, args, kwargs))
+        return future
+
+    def run(self, func, *args, **kwargs):
+        """Выполняет задание и ждёт коммита его пачки.
+
+        Если пачка не закоммичена за timeout секунд, бросает WriteTimeout.
+        Ещё не начатое задание при этом отменяется: после ответа об ошибке
+        оно уже не выполнится. Начатое может закоммититься позже.
+        """
+        future = self.submit(func, *args, **kwargs)
+        try:
+            return future.result(self.timeout)
+        except TimeoutError as error:
+            future.cancel()
+            raise WriteTimeout(
+                'Запись не подтверждена за отведённое время.') from error
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._jobs.put(_STOP)
+            thread.join()
+
+    def _take_batch(self):
+        batch = [self._jobs.get()]
+        deadline = time.monotonic() + self.max_delay
+        while batch[-1] is not _STOP and len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._jobs.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._take_batch()
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            close_old_connections()
+            if batch:
+                self._commit(batch)
+            if stop:
+                connections.close_all()
+                return
+
+    def _run_jobs(self, batch):
+        """Выполняет задания в точках сохранения; возвращает их исходы."""
+        outcomes = []
+        for future, func, args, kwargs in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with transaction.atomic():
+                    outcomes.append((future, func(*args, **kwargs), None))
+            except Exception as error:
+                outcomes.append((future, None, error))
+        return outcomes
+
+    def _commit(self, batch):
+        try:
+            with transaction.atomic():
+                outcomes = self._run_jobs(batch)
+        except Exception as error:
+            # Транзакция не открылась или не закоммитилась: ошибку
+            # получают все ждущие задания пачки, а не только выполненные.
+            for future, _, _, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.batches += 1
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteQueue(
+                settings.WRITE_QUEUE_MAX_BATCH,
+                settings.WRITE_QUEUE_MAX_DELAY,
+                settings.WRITE_QUEUE_TIMEOUT)
+    return _write_queue
+
+
+def run_write(func, *args, **kwargs):
+    """Выполняет запись через очередь (если она включена) и ждёт коммита."""
+    if not settings.WRITE_QUEUE_ENABLED:
+        return func(*args, **kwargs)
+    # Поток очереди не видит состояние маршрутизации запроса.
+    mark_written()
+    return get_write_queue().run(func, *args, **kwargs)
@@ -0,0 +1,178 @@
+"""Кэшированные списки последних постов авторов.
+
+Используются при FOLLOW_FEED_BACKEND = 'merge'. Для каждого автора
+в кэше лежит пара (complete, entries): entries — до
+AUTHOR_TIMELINE_LENGTH ключей (pub_date, id) его последних постов по
+убыванию, complete — все ли посты автора в них попали. Лента подписок
+собирается слиянием списков авторов через кучу, посты страницы читаются
+одним запросом по id. Ключ списка включает поколение автора
+(posts.cache.author_posts_scope): публикация или удаление поста после
+коммита увеличивает его, и список строится заново при следующем чтении.
+Список не правится на месте: читатель, построивший его по базе до
+коммита, положит его под старым поколением, которое уже не читается.
+"""
+import heapq
+from itertools import dropwhile, islice, takewhile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils.functional import cached_property
+
+from . import sharding
+from .cache import author_posts_scope, get_generations
+from .models import Post
+from .paginators import seek
+
+
+KEY_PREFIX = 'posts:author_timeline:'
+# Сколько авторов перестраивать одним запросом.
+BUILD_CHUNK_SIZE = 500
+
+
+def enabled():
+    return (
+        settings.FOLLOW_FEED_BACKEND == 'merge'
+        and not sharding.enabled())
+
+
+def _key(author_id, generation):
+    return f'{KEY_PREFIX}{author_id}:{generation}'
+
+
+def build(author_ids):
+    """Строит списки авторов по базе: один запрос на BUILD_CHUNK_SIZE авторов.
+    """
+    length = settings.AUTHOR_TIMELINE_LENGTH
+    entries = {author_id: [] for author_id in author_ids}
+    for start in range(0, len(author_ids), BUILD_CHUNK_SIZE):
+        ranked = Post.objects.filter(
+            author_id__in=author_ids[start:start + BUILD_CHUNK_SIZE],
+        ).annotate(position=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )).order_by().values('id', 'author_id', 'pub_date', 'position')
+        sql, params = ranked.query.sql_with_params()
+        # Условие на оконную функцию возможно только во внешнем запросе.
+        posts = Post.objects.raw(
+            f'SELECT id, author_id, pub_date FROM ({sql}) ranked '
+            f'WHERE position <= %s', (*params, length + 1))
+        for post in posts:
+            entries[post.author_id].append((post.pub_date, post.id))
+    timelines = {}
+    for author_id, keys in entries.items():
+        keys.sort(reverse=True)
+        timelines[author_id] = (len(keys) <= length, keys[:length])
+    return timelines
+
+
+def load(author_ids):
+    """Списки авторов из кэша; недостающие строятся и кладутся в кэш."""
+    # Поколения читаются до базы: список, построенный по данным до
+    # коммита записи, ляжет под уже устаревшим поколением.
+    generations = get_generations(
+        [author_posts_scope(author_id) for author_id in author_ids])
+    keys = {
+        author_id: _key(author_id, generations[author_posts_scope(author_id)])
+        for author_id in author_ids}
+    found = cache.get_many(list(keys.values()))
+    timelines = {
+        author_id: found[key] for author_id, key in keys.items()
+        if key in found}
+    missing = [
+        author_id for author_id in author_ids if author_id not in timelines]
+    if missing:
+        built = build(missing)
+        cache.set_many(
+            {keys[author_id]: value for author_id, value in built.items()},
+            settings.AUTHOR_TIMELINE_TIMEOUT)
+        timelines.update(built)
+    return timelines
+
+
+class MergedTimeline:
+    """Лента постов нескольких авторов для пагинаторов.
+
+    author_ids — id авторов (можно ленивым QuerySet), posts — QuerySet,
+    которым загружаются посты выбранной страницы. Если страница уходит
+    дальше, чем покрывают неполные списки, она читается из базы.
+    """
+    ordered = True
+
+    def __init__(self, author_ids, posts):
+        self.author_ids = author_ids
+        self.posts = posts
+
+    @cached_property
+    def timelines(self):
+        return load(list(self.author_ids))
+
+    @cached_property
+    def threshold(self):
+        """Ключ, начиная с которого слияние списков может пропустить посты.
+        """
+        return max((
+            entries[-1] for complete, entries in self.timelines.values()
+            if not complete
+        ), default=None)
+
+    def count(self):
+        if self.threshold is None:
+            return sum(
+                len(entries) for _, entries in self.timelines.values())
+        return Post.objects.filter(author_id__in=list(self.timelines)).count()
+
+    def __getitem__(self, index):
+        return self.seek()[index]
+
+    def seek(self, pub_date=None, pk=None, descending=True):
+        return MergedSlice(self, pub_date, pk, descending)
+
+
+class MergedSlice:
+    """Посты ленты за позицией (pub_date, pk), выбираемые срезом."""
+
+    def __init__(self, timeline, pub_date, pk, descending):
+        self.timeline = timeline
+        self.cursor = None if pub_date is None else (pub_date, pk)
+        self.descending = descending
+
+    def _merge(self):
+        cursor = self.cursor
+        streams = []
+        for _, entries in self.timeline.timelines.values():
+            if self.descending:
+                if cursor is not None:
+                    entries = dropwhile(lambda key: key >= cursor, entries)
+            else:
+                entries = reversed(list(
+                    takewhile(lambda key: key > cursor, entries)))
+            streams.append(entries)
+        return heapq.merge(*streams, reverse=self.descending)
+
+    def _keys(self, stop):
+        threshold = self.timeline.threshold
+        if threshold is None:
+            return list(islice(self._merge(), stop))
+        if self.descending:
+            keys = list(islice(
+                takewhile(lambda key: key >= threshold, self._merge()), stop))
+            if stop is not None and len(keys) == stop:
+                return keys
+        elif self.cursor >= threshold:
+            return list(islice(self._merge(), stop))
+        pub_date, pk = self.cursor or (None, None)
+        return list(seek(
+            Post.objects.filter(author_id__in=list(self.timeline.timelines)),
+            pub_date, pk, self.descending,
+        ).values_list('pub_date', 'id')[:stop])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        post_ids = [
+            post_id for _, post_id in self._keys(index.stop)[index]]
+        posts = self.timeline.posts.in_bulk(post_ids)
+        return [posts[post_id] for post_id in post_ids if post_id in posts]
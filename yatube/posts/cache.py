@@ -0,0 +1,147 @@
+"""Поколения кэша лент.
+
+Каждая область (вся лента, группа, профиль, пост, подписки пользователя)
+имеет свой счётчик поколения. Номер поколения входит в ключи кэша, поэтому
+после увеличения счётчика старые записи просто перестают читаться и
+доживают свой TTL; сбрасывать их по одной не нужно. Рядом со счётчиком
+хранится время последнего изменения области для заголовка Last-Modified.
+"""
+import time
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+GENERATION_PREFIX = 'posts:generation:'
+MODIFIED_PREFIX = 'posts:modified:'
+
+# Область, общая для всех лент: меняется вместе с любой группой.
+GROUPS = 'groups'
+INDEX = 'index'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def profile_scope(username):
+    return f'profile:{username}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def follower_scope(user_id):
+    # Подписки пользователя и его лента: меняется и тогда, когда фоновая
+    # задача дописала в неё пост (posts.timeline).
+    return f'follower:{user_id}'
+
+
+def author_scope(user_id):
+    # Имя и фамилия автора в карточках его постов.
+    return f'author:{user_id}'
+
+
+def author_posts_scope(user_id):
+    # Кэшированный список последних постов автора (posts.author_timelines).
+    return f'author_posts:{user_id}'
+
+
+def _initial_generation():
+    # Счётчик, вытесненный из кэша, не должен вернуться к уже
+    # использованному значению, поэтому начинаем с текущего времени.
+    return int(time.time() * 1000)
+
+
+def get_scope_state(scopes):
+    """Возвращает поколения и время изменения областей.
+
+    Оба значения читаются одним запросом к кэшу. Для области, которой ещё
+    нет в кэше, временем изменения считается текущий момент.
+    """
+    generation_keys = {scope: GENERATION_PREFIX + scope for scope in scopes}
+    modified_keys = {scope: MODIFIED_PREFIX + scope for scope in scopes}
+    found = cache.get_many(
+        list(generation_keys.values()) + list(modified_keys.values()))
+    generations = {}
+    modified = {}
+    for scope in scopes:
+        generation = found.get(generation_keys[scope])
+        if generation is None:
+            generation = _initial_generation()
+            if not cache.add(
+                    generation_keys[scope], generation, timeout=None):
+                generation = cache.get(generation_keys[scope], generation)
+        generations[scope] = generation
+
+        timestamp = found.get(modified_keys[scope])
+        if timestamp is None:
+            timestamp = time.time()
+            cache.add(modified_keys[scope], timestamp, timeout=None)
+        modified[scope] = timestamp
+    return generations, modified
+
+
+def get_generations(scopes):
+    """Возвращает номера поколений областей одним запросом к кэшу."""
+    return get_scope_state(scopes)[0]
+
+
+def bump_generations(*scopes):
+    for scope in scopes:
+        key = GENERATION_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_generation(), timeout=None)
+    now = time.time()
+    cache.set_many(
+        {MODIFIED_PREFIX + scope: now for scope in scopes}, timeout=None)
+
+
+def bump_generations_on_commit(*scopes, using=None):
+    """bump_generations после коммита транзакции базы using.
+
+    Читатель, пришедший между увеличением поколения и коммитом, увидел бы
+    старые данные и закэшировал их под новым поколением. Вне транзакции
+    поколения увеличиваются сразу.
+    """
+    transaction.on_commit(partial(bump_generations, *scopes), using=using)
+
+
+def generations_key(scopes, *parts):
+    """Строка для ключа кэша: поколения областей и прочие параметры."""
+    generations = get_generations(scopes)
+    return ';'.join(
+        [f'{scope}={generations[scope]}' for scope in scopes]
+        + [str(part) for part in parts])
+
+
+def page_scopes(view_name, kwargs):
+    """Области, от которых зависит страница, или None, если она не кэшируется.
+
+    Страница поста включает INDEX: на ней выводится число постов автора,
+    а любая публикация или удаление поста меняет поколение INDEX.
+    """
+    if view_name == 'posts:index':
+        return [GROUPS, INDEX]
+    if view_name == 'posts:follow_index':
+        return [GROUPS, INDEX]
+    if view_name == 'posts:group_posts':
+        return [GROUPS, group_scope(kwargs['slug'])]
+    if view_name == 'posts:profile':
+        return [GROUPS, profile_scope(kwargs['username'])]
+    if view_name == 'posts:post_detail':
+        return [GROUPS, INDEX, post_scope(kwargs['post_id'])]
+    return None
+
+
+def page_modified(view_name, kwargs):
+    """Время изменения данных страницы для core.routers; None — не кэшируется.
+    """
+    scopes = page_scopes(view_name, kwargs)
+    if scopes is None:
+        return None
+    return max(get_scope_state(scopes)[1].values())
@@ -0,0 +1,154 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются сигналами из posts.signals одним UPDATE с F()
+выражением, поэтому параллельные записи не теряют приращений. Массовые
+вставки (bulk_create) сигналов не отправляют: после них, как и для
+исправления расхождений, вызывается reconcile (команда reconcile_counters).
+При шардировании (posts.sharding) число постов пользователей и групп
+считается по всем шардам в Python: подзапрос не может читать другую базу.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, When
+from django.db.models.functions import Coalesce
+
+from . import sharding
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def count_of(queryset, field, outer_field='pk'):
+    """Подзапрос: число строк queryset, у которых field = outer_field."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef(outer_field)}).order_by().values(
+            field).annotate(count=Count('pk')).values('count')), 0)
+
+
+def _increment(queryset, **deltas):
+    return queryset.update(**{
+        field: F(field) + delta for field, delta in deltas.items()})
+
+
+def create_user_stats(user_id):
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id)], ignore_conflicts=True)
+
+
+def change_user(user_id, **deltas):
+    # Строки счётчиков может не быть: её целиком посчитает user_stats.
+    _increment(UserStats.objects.filter(user_id=user_id), **deltas)
+
+
+def change_follow(user_id, author_id, delta):
+    """Меняет счётчики подписок обеих сторон одним UPDATE."""
+    UserStats.objects.filter(
+        user_id__in=[user_id, author_id],
+    ).update(
+        followers_count=F('followers_count') + Case(
+            When(user_id=author_id, then=delta), default=0),
+        following_count=F('following_count') + Case(
+            When(user_id=user_id, then=delta), default=0),
+    )
+
+
+def change_post(post_id, **deltas):
+    _increment(Post.objects.for_post(post_id), **deltas)
+
+
+def change_group(group_id, **deltas):
+    _increment(Group.objects.filter(pk=group_id), **deltas)
+
+
+def user_stats(user):
+    """Счётчики пользователя (лучше загрузить их select_related('stats')).
+
+    Строка счётчиков создаётся и считается при первом обращении.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        reconcile_users([user.pk])
+        return UserStats.objects.get(user=user)
+
+
+def _reconcile(queryset, **actual):
+    """Исправляет поля, разошедшиеся с actual; возвращает число строк."""
+    drift = Q()
+    for field in actual:
+        drift |= ~Q(**{field: F(f'actual_{field}')})
+    drifted = queryset.annotate(**{
+        f'actual_{field}': expression
+        for field, expression in actual.items()
+    }).filter(drift)
+    return queryset.filter(pk__in=drifted.values('pk')).update(**actual)
+
+
+def reconcile_users(user_ids=None):
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    UserStats.objects.bulk_create([
+        UserStats(user_id=user_id)
+        for user_id in users.filter(
+            stats__isnull=True).values_list('pk', flat=True)
+    ], ignore_conflicts=True)
+    stats = UserStats.objects.all()
+    if user_ids is not None:
+        stats = stats.filter(user_id__in=user_ids)
+    follow_counts = {
+        'followers_count': count_of(Follow.objects, 'author', 'user_id'),
+        'following_count': count_of(Follow.objects, 'user', 'user_id'),
+    }
+    if not sharding.enabled():
+        return _reconcile(
+            stats,
+            posts_count=count_of(Post.objects, 'author', 'user_id'),
+            **follow_counts)
+    posts = Post.objects.all()
+    if user_ids is not None:
+        posts = posts.filter(author_id__in=user_ids)
+    return _reconcile(stats, **follow_counts) + _reconcile_sharded(
+        stats, 'user_id', posts, 'author_id')
+
+
+def _reconcile_sharded(queryset, key_field, posts, post_field):
+    """Исправляет posts_count по числу постов во всех шардах."""
+    actual = Counter()
+    for alias in settings.POST_SHARDS:
+        actual.update(dict(
+            posts.using(alias).order_by().values_list(post_field).annotate(
+                count=Count('pk'))))
+    drifted = []
+    for row in queryset.only(key_field, 'posts_count'):
+        posts_count = actual[getattr(row, key_field)]
+        if row.posts_count != posts_count:
+            row.posts_count = posts_count
+            drifted.append(row)
+    queryset.model.objects.bulk_update(drifted, ['posts_count'])
+    return len(drifted)
+
+
+def reconcile_posts():
+    return sum(
+        _reconcile(
+            Post.objects.using(alias),
+            comments_count=count_of(Comment.objects, 'post'))
+        for alias in settings.POST_SHARDS or [None]
+    )
+
+
+def reconcile_groups():
+    if sharding.enabled():
+        return _reconcile_sharded(
+            Group.objects.all(), 'pk', Post.objects.all(), 'group_id')
+    return _reconcile(
+        Group.objects.all(), posts_count=count_of(Post.objects, 'group'))
+
+
+def reconcile():
+    """Пересчитывает все счётчики; возвращает число исправленных строк."""
+    return {
+        'users': reconcile_users(),
+        'posts': reconcile_posts(),
+        'groups': reconcile_groups(),
+    }
@@ -1,12 +1,30 @@
 from django import forms
+from django.conf import settings
 
 from .models import Comment, Post
 
 
+class UploadedImageField(forms.ImageField):
+    """Картинка, которую уже проверил posts.uploads.ImageUploadHandler."""
+
+    def to_python(self, data):
+        error = getattr(data, 'upload_error', None)
+        if error:
+            raise forms.ValidationError(error, code='upload')
+        image = super().to_python(data)
+        if image is not None:
+            width, height = image.image.size
+            if width * height > settings.POST_UPLOAD_MAX_PIXELS:
+                raise forms.ValidationError(
+                    'Слишком большая картинка.', code='pixels')
+        return image
+
+
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
+        field_classes = {'image': UploadedImageField}
         lables = {
             'text': 'Текст поста',
             'group': 'Group'
@@ -0,0 +1,36 @@
+"""Обработка картинок постов при загрузке.
+
+Исходник сразу приводится к одному виду: не больше POST_IMAGE_MAX_SIZE
+по большей стороне, WebP без EXIF, ICC и XMP. Варианты для srcset по
+ширине создаются из него фоном (posts.thumbnails, POST_THUMBNAILS).
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+
+
+def normalize(file):
+    """Возвращает картинку file, пересохранённую в WebP.
+
+    Поворот из EXIF применяется к пикселям до того, как метаданные
+    отбрасываются. У анимированных картинок остаётся первый кадр.
+    """
+    file.seek(0)
+    with Image.open(file) as source:
+        image = ImageOps.exif_transpose(source)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+    max_size = settings.POST_IMAGE_MAX_SIZE
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    content = BytesIO()
+    # Метаданные не передаются в save, поэтому в файл не попадают.
+    image.save(content, 'WEBP', quality=settings.POST_IMAGE_QUALITY)
+    name = os.path.splitext(os.path.basename(file.name))[0]
+    return ContentFile(content.getvalue(), name=f'{name}.webp')
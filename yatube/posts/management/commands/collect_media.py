@@ -0,0 +1,241 @@
+import os
+import shutil
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from posts import uploads
+from posts.models import ChunkedUpload, Post
+from posts.utils import chunks
+
+
+def walk(root, directory):
+    """Файлы каталога directory внутри root: (имя от root, DirEntry).
+
+    Обходит дерево стеком, не собирая списки файлов. Скрытые файлы —
+    недописанные загрузки posts.storage — пропускаются.
+    """
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, current))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                name = f'{current}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry
+
+
+def upload_id(name):
+    """id докачиваемой загрузки по имени файла её кусков или None."""
+    stem, extension = os.path.splitext(name)
+    if extension != '.part':
+        return None
+    try:
+        return uuid.UUID(stem)
+    except ValueError:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет или переносит в карантин картинки постов, на которые не '
+        'ссылается ни один пост, записи key-value store sorl о них с их '
+        'миниатюрами, файлы миниатюр без записей и брошенные докачиваемые '
+        'загрузки. Файлы и имена из базы обрабатываются пачками, в памяти '
+        'не больше одной пачки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько файлов или записей проверять одним запросом.')
+        parser.add_argument(
+            '--min-age', type=float, default=24,
+            help='Не трогать файлы и загрузки моложе стольких часов: их '
+                 'пост может ещё сохраняться.')
+        parser.add_argument(
+            '--quarantine',
+            help='Переносить картинки-сироты в этот каталог, а не удалять. '
+                 'Миниатюры удаляются всегда: их можно создать заново.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, ничего не меняя.')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.quarantine = options['quarantine']
+        self.dry_run = options['dry_run']
+        self.max_mtime = time.time() - options['min_age'] * 60 * 60
+        self.max_created = timezone.now() - timedelta(
+            hours=options['min_age'])
+        self.aliases = settings.POST_SHARDS or [DEFAULT_DB_ALIAS]
+        storage = Post._meta.get_field('image').storage
+        self.report('Картинки', self.collect_images(storage))
+        if isinstance(default.kvstore, cached_db_kvstore.KVStore):
+            self.report('Записи миниатюр', self.collect_records())
+        else:
+            self.stdout.write('Key-value store sorl не в базе: пропущен.')
+        if hasattr(default.storage, 'path'):
+            self.report('Файлы миниатюр', self.collect_thumbnails())
+        self.report('Докачиваемые загрузки', self.collect_uploads())
+
+    def report(self, title, batches):
+        """Выводит скорость по ходу прохода и итог."""
+        started = time.monotonic()
+        seen = found = size = 0
+        for batch_seen, batch_found, batch_size in batches:
+            seen += batch_seen
+            found += batch_found
+            size += batch_size
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'{title}: просмотрено {seen} ({seen / elapsed:.0f}/с), '
+                f'сирот {found}', ending='\r')
+        action = 'найдено' if self.dry_run else 'убрано'
+        self.stdout.write('')
+        self.stdout.write(
+            f'{title}: просмотрено {seen}, {action} {found} '
+            f'({filesizeformat(size)}) за '
+            f'{time.monotonic() - started:.1f} с')
+
+    def referenced(self, names):
+        found = set()
+        for alias in self.aliases:
+            found.update(Post.objects.using(alias).filter(
+                image__in=names).values_list('image', flat=True))
+        return found
+
+    def is_old(self, entry):
+        return entry.stat(follow_symlinks=False).st_mtime < self.max_mtime
+
+    def collect_images(self, storage):
+        """Файлы картинок, на которые не ссылается ни один шард."""
+        directory = Post._meta.get_field('image').upload_to.rstrip('/')
+        files = walk(storage.location, directory)
+        for batch in chunks(files, self.batch_size):
+            referenced = self.referenced([name for name, _ in batch])
+            orphans = [
+                (name, entry) for name, entry in batch
+                if name not in referenced and self.is_old(entry)]
+            size = sum(entry.stat().st_size for _, entry in orphans)
+            if not self.dry_run:
+                for name, entry in orphans:
+                    self.remove(name, entry.path)
+            yield len(batch), len(orphans), size
+
+    def remove(self, name, path):
+        if self.quarantine:
+            target = os.path.join(self.quarantine, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(path, target)
+        else:
+            os.remove(path)
+
+    def collect_records(self):
+        """Записи sorl о картинках-сиротах вместе с их миниатюрами."""
+        prefix = add_prefix('', 'thumbnails')
+        records = KVStore.objects.filter(
+            key__startswith=prefix).order_by('key').values_list(
+            'key', flat=True)
+        last = ''
+        while True:
+            keys = list(records.filter(key__gt=last)[:self.batch_size])
+            if not keys:
+                return
+            last = keys[-1]
+            sources = [
+                deserialize_image_file(value)
+                for value in KVStore.objects.filter(key__in=[
+                    add_prefix(key[len(prefix):]) for key in keys
+                ]).values_list('value', flat=True)]
+            referenced = self.referenced([source.name for source in sources])
+            orphans = [
+                source for source in sources
+                if source.name not in referenced]
+            if not self.dry_run:
+                for source in orphans:
+                    default.kvstore.delete(source)
+            yield len(keys), len(orphans), 0
+
+    def collect_thumbnails(self):
+        """Файлы миниатюр, о которых нет записи в key-value store."""
+        storage = default.storage
+        files = walk(
+            storage.location, sorl_settings.THUMBNAIL_PREFIX.rstrip('/'))
+        for batch in chunks(files, self.batch_size):
+            keys = {
+                add_prefix(ImageFile(name, storage).key): (name, entry)
+                for name, entry in batch}
+            known = set(KVStore.objects.filter(
+                key__in=list(keys)).values_list('key', flat=True))
+            orphans = [
+                entry for key, (_, entry) in keys.items()
+                if key not in known and self.is_old(entry)]
+            size = sum(entry.stat().st_size for entry in orphans)
+            if not self.dry_run:
+                for entry in orphans:
+                    os.remove(entry.path)
+            yield len(batch), len(orphans), size
+
+    def collect_uploads(self):
+        """Брошенные докачиваемые загрузки и файлы кусков без записей.
+
+        Загрузка, начатая раньше --min-age, так и не прикреплена к посту:
+        release удаляет её сразу после сохранения поста.
+        """
+        stale = ChunkedUpload.objects.filter(
+            created__lt=self.max_created).order_by('pk')
+        last = None
+        while True:
+            batch = stale if last is None else stale.filter(pk__gt=last)
+            batch = list(batch[:self.batch_size])
+            if not batch:
+                break
+            last = batch[-1].pk
+            if not self.dry_run:
+                for upload in batch:
+                    uploads.discard(upload)
+            yield len(batch), len(batch), sum(
+                upload.offset for upload in batch)
+
+        try:
+            entries = os.scandir(settings.POST_UPLOAD_DIR)
+        except FileNotFoundError:
+            return
+        with entries:
+            files = (
+                entry for entry in entries
+                if entry.is_file(follow_symlinks=False))
+            for batch in chunks(files, self.batch_size):
+                ids = [upload_id(entry.name) for entry in batch]
+                known = set(ChunkedUpload.objects.filter(
+                    pk__in=[pk for pk in ids if pk is not None],
+                ).values_list('pk', flat=True))
+                orphans = [
+                    entry for pk, entry in zip(ids, batch)
+                    if pk is not None and pk not in known
+                    and self.is_old(entry)]
+                size = sum(entry.stat().st_size for entry in orphans)
+                if not self.dry_run:
+                    for entry in orphans:
+                        os.remove(entry.path)
+                yield len(batch), len(orphans), size
@@ -0,0 +1,108 @@
+import logging
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+from posts.utils import chunks
+
+
+logger = logging.getLogger(__name__)
+
+
+def image_names():
+    """Пары (шард, имя картинки) постов, каждая картинка один раз за шард."""
+    for alias in settings.POST_SHARDS or [None]:
+        names = Post.objects.using(alias).exclude(image='').order_by(
+            'image').values_list('image', flat=True).distinct()
+        for name in names.iterator():
+            yield alias, name
+
+
+def store_size(alias, name):
+    """Записывает размеры картинки постам, загруженным до image_width."""
+    size = thumbnails.source_size(name)
+    if size:
+        Post.objects.using(alias).filter(
+            image=name, image_width=None,
+        ).update(image_width=size[0], image_height=size[1])
+
+
+def generate_batch(images, force):
+    """Создаёт миниатюры пачки картинок; возвращает (готово, ошибок).
+
+    Страницы с постами, получившими миниатюры, сбрасываются из кэша.
+    """
+    done = errors = 0
+    created = []
+    for alias, name in images:
+        try:
+            if thumbnails.generate(name, force):
+                created.append(name)
+            store_size(alias, name)
+        except Exception:
+            logger.exception('Не удалось создать миниатюры %s', name)
+            errors += 1
+        else:
+            done += 1
+    if created:
+        thumbnails.bump_image_pages(created)
+    return done, errors
+
+
+def _generate_batch(args):
+    return generate_batch(*args)
+
+
+def _close_connections():
+    # Соединения родителя не должны использоваться после fork.
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт миниатюры settings.POST_THUMBNAILS для всех картинок '
+        'постов в пуле процессов и заполняет Post.image_width и '
+        'image_height, где их нет. Готовые миниатюры пропускаются, '
+        'если не указан --force.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=multiprocessing.cpu_count(),
+            help='Процессов в пуле; 0 — всё в текущем процессе.')
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Сколько картинок отдавать процессу за раз.')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Удалить и создать заново существующие миниатюры.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        batches = (
+            (batch, options['force'])
+            for batch in chunks(image_names(), options['batch_size']))
+        done = errors = 0
+        for batch_done, batch_errors in self.run(batches, options['workers']):
+            done += batch_done
+            errors += batch_errors
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'Картинок: {done} ({done / max(elapsed, 1e-6):.1f}/с), '
+                f'ошибок: {errors}', ending='\r')
+        self.stdout.write('')
+        self.stdout.write(f'Готово картинок: {done}, ошибок: {errors}')
+
+    def run(self, batches, workers):
+        if not workers:
+            for batch in batches:
+                yield generate_batch(*batch)
+            return
+        _close_connections()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(workers, initializer=_close_connections) as pool:
+            yield from pool.imap_unordered(_generate_batch, batches)
@@ -0,0 +1,107 @@
+import csv
+import sys
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters, timeline
+from posts.cache import bump_generations, follower_scope, profile_scope
+from posts.models import Follow, User
+
+
+# Сколько имён искать одним запросом: держимся под лимитом
+# параметров запроса SQLite.
+LOOKUP_CHUNK_SIZE = 900
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует подписки из CSV со строками «подписчик,автор» '
+        '(имена пользователей или id с --ids). Пачки вставляются '
+        'в отдельных транзакциях, существующие подписки пропускаются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV-файл или - для stdin.')
+        parser.add_argument('--ids', action='store_true',
+                            help='В файле id пользователей, а не имена.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            self.import_rows(csv.reader(sys.stdin), options)
+            return
+        with open(options['path'], newline='', encoding='utf-8') as source:
+            self.import_rows(csv.reader(source), options)
+
+    def import_rows(self, rows, options):
+        rows = (row for row in rows if len(row) >= 2)
+        processed = skipped = 0
+        users = set()
+        authors = set()
+        while True:
+            batch = list(islice(rows, options['batch_size']))
+            if not batch:
+                break
+            keys = {key.strip() for row in batch for key in row[:2]}
+            user_ids = self.resolve(keys, options['ids'])
+            follows = {}
+            for row in batch:
+                user_id = user_ids.get(row[0].strip())
+                author_id = user_ids.get(row[1].strip())
+                if user_id is None or author_id is None \
+                        or user_id == author_id:
+                    skipped += 1
+                    continue
+                follows[user_id, author_id] = Follow(
+                    user_id=user_id, author_id=author_id)
+            with transaction.atomic():
+                Follow.objects.bulk_create(
+                    follows.values(), ignore_conflicts=True)
+            users.update(user_id for user_id, _ in follows)
+            authors.update(author_id for _, author_id in follows)
+            processed += len(batch)
+            self.stdout.write(f'Обработано строк: {processed}', ending='\r')
+        self.stdout.write('')
+
+        # bulk_create не отправляет сигналы: пересчитываем счётчики,
+        # сбрасываем кэш профилей и лент подписок и пересобираем
+        # материализованные ленты сами.
+        self.refresh(users, authors)
+        if timeline.enabled():
+            for user_id in users:
+                timeline.rebuild(user_id)
+        self.stdout.write(
+            f'Строк: {processed}, пропущено: {skipped}, '
+            f'подписчиков: {len(users)}')
+
+    def refresh(self, users, authors):
+        """Пересчитывает счётчики и сбрасывает кэш затронутых пользователей.
+        """
+        touched = sorted(users | authors)
+        for start in range(0, len(touched), LOOKUP_CHUNK_SIZE):
+            chunk = touched[start:start + LOOKUP_CHUNK_SIZE]
+            counters.reconcile_users(chunk)
+            usernames = User.objects.filter(
+                pk__in=chunk).values_list('username', flat=True)
+            # Профили показывают число подписчиков и подписок.
+            bump_generations(
+                *(profile_scope(username) for username in usernames),
+                *(follower_scope(user_id) for user_id in chunk
+                  if user_id in users))
+
+    def resolve(self, keys, by_id):
+        """Словарь «значение из файла» -> id существующего пользователя."""
+        if by_id:
+            keys = {key for key in keys if key.isdigit()}
+            lookup, field = 'id__in', 'id'
+        else:
+            lookup, field = 'username__in', 'username'
+        keys = list(keys)
+        resolved = {}
+        for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+            chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+            for value, user_id in User.objects.filter(
+                    **{lookup: chunk}).values_list(field, 'id'):
+                resolved[str(value)] = user_id
+        return resolved
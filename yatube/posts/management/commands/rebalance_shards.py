@@ -0,0 +1,139 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from posts import sharding
+from posts.cache import GROUPS, INDEX, bump_generations
+from posts.models import Comment, Post, PostRedirect, TimelineEntry
+from posts.utils import chunks
+
+
+def delete_rows(alias, model, field, values):
+    """Удаляет строки без сигналов: счётчики при переносе не меняются."""
+    connection = connections[alias]
+    ops = connection.ops
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {ops.quote_name(model._meta.db_table)} '
+            f'WHERE {ops.quote_name(field)} IN ({placeholders})', values)
+
+
+class Command(BaseCommand):
+    help = (
+        'Раскладывает посты и их комментарии по шардам settings.POST_SHARDS. '
+        'Посты, созданные до шардирования (id без корзины автора), '
+        'сначала получают новые id, а старые адреса постов '
+        'перенаправляются на новые. Пока пост не перенесён, он не виден '
+        'в своём новом шарде, поэтому команду лучше запускать при '
+        'остановленной записи.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', nargs='*', default=[],
+            help='Дополнительные базы, из которых забрать посты, например '
+                 'шард, убранный из POST_SHARDS.')
+        # Не больше лимита параметров запроса SQLite (999).
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать посты, которые нужно перенести.')
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Шардирование выключено: задайте POST_SHARDS.')
+        self.batch_size = options['batch_size']
+        aliases = dict.fromkeys(
+            [*settings.POST_SHARDS, DEFAULT_DB_ALIAS, *options['source']])
+        totals = defaultdict(int)
+        scans = {alias: self.scan(alias) for alias in aliases}
+        legacy_ids = [
+            pk for legacy, _ in scans.values() for pk, _ in legacy]
+        if legacy_ids and not options['dry_run']:
+            # Старые id остаются в ссылках: новые id постов должны быть
+            # больше, иначе редирект увёл бы на чужой пост.
+            sharding.reserve_post_ids(max(legacy_ids))
+        for alias, (legacy, misplaced) in scans.items():
+            moved = sum(len(post_ids) for post_ids in misplaced.values())
+            self.stdout.write(
+                f'{alias}: новых id {len(legacy)}, к переносу {moved}')
+            if options['dry_run']:
+                continue
+            new_ids = {}
+            for batch in chunks(legacy, self.batch_size):
+                new_ids.update(self.renumber(alias, batch))
+            for target, post_ids in misplaced.items():
+                post_ids = [new_ids.get(pk, pk) for pk in post_ids]
+                for batch in chunks(post_ids, self.batch_size):
+                    posts, comments = self.move(alias, target, batch)
+                    totals['posts'] += posts
+                    totals['comments'] += comments
+            totals['renumbered'] += len(new_ids)
+        if any(totals.values()):
+            # Лента любой страницы зависит от GROUPS.
+            bump_generations(GROUPS, INDEX)
+        self.stdout.write(
+            f'Новых id: {totals["renumbered"]}, перенесено постов: '
+            f'{totals["posts"]}, комментариев: {totals["comments"]}')
+
+    def scan(self, alias):
+        """Посты базы без корзины в id и посты, которым место в другом шарде.
+        """
+        legacy = []
+        misplaced = defaultdict(list)
+        posts = Post.objects.using(alias).order_by().values_list(
+            'pk', 'author_id')
+        for pk, author_id in posts.iterator():
+            if pk % settings.POST_SHARD_BUCKETS != sharding.bucket_of(
+                    author_id):
+                legacy.append((pk, author_id))
+            target = sharding.shard_for_author(author_id)
+            if target != alias:
+                misplaced[target].append(pk)
+        return legacy, misplaced
+
+    def renumber(self, alias, posts):
+        """Выдаёт постам id с корзиной автора; возвращает {старый: новый}.
+
+        Старый id запоминается в PostRedirect; редиректы, которые вели
+        на него после прошлых запусков, переводятся на новый id.
+        """
+        new_ids = {}
+        with transaction.atomic(using=alias):
+            for pk, author_id in posts:
+                new_id = sharding.allocate_post_id(author_id)
+                Post.objects.using(alias).filter(pk=pk).update(id=new_id)
+                for model in (Comment, TimelineEntry):
+                    model.objects.using(alias).filter(post_id=pk).update(
+                        post_id=new_id)
+                PostRedirect.objects.filter(new_id=pk).update(new_id=new_id)
+                new_ids[pk] = new_id
+            PostRedirect.objects.bulk_create([
+                PostRedirect(old_id=old_id, new_id=new_id)
+                for old_id, new_id in new_ids.items()
+            ], ignore_conflicts=True)
+        return new_ids
+
+    def move(self, source, target, post_ids):
+        posts = list(Post.objects.using(source).filter(pk__in=post_ids))
+        comments = list(
+            Comment.objects.using(source).filter(post_id__in=post_ids))
+        for comment in comments:
+            # id комментариев уникальны только внутри шарда.
+            comment.pk = None
+        # Сначала пишем в новый шард, потом удаляем из старого: после сбоя
+        # повторный запуск перенесёт те же посты ещё раз без потерь.
+        with transaction.atomic(using=target):
+            delete_rows(target, Comment, 'post_id', post_ids)
+            Post.objects.using(target).bulk_create(
+                posts, ignore_conflicts=True)
+            Comment.objects.using(target).bulk_create(comments)
+        with transaction.atomic(using=source):
+            for model, field in (
+                    (TimelineEntry, 'post_id'),
+                    (Comment, 'post_id'),
+                    (Post, 'id')):
+                delete_rows(source, model, field, post_ids)
+        return len(posts), len(comments)
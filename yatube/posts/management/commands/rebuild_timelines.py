@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает материализованные ленты подписок: нужна после '
+        'переключения FOLLOW_FEED_BACKEND на timeline, массовой загрузки '
+        'данных или смены TIMELINE_FANOUT_MAX_FOLLOWERS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, nargs='+',
+            help='id пользователей; по умолчанию все, у кого есть подписки.')
+        parser.add_argument(
+            '--trim-only', action='store_true',
+            help='Только обрезать ленты до TIMELINE_MAX_LENGTH.')
+
+    def handle(self, *args, **options):
+        user_ids = options['users']
+        if user_ids is None:
+            if not options['trim_only']:
+                TimelineEntry.objects.exclude(
+                    user__in=Follow.objects.values('user')).delete()
+            user_ids = list(Follow.objects.order_by('user_id').values_list(
+                'user_id', flat=True).distinct())
+
+        action = timeline.trim if options['trim_only'] else timeline.rebuild
+        for user_id in user_ids:
+            action(user_id)
+        self.stdout.write(f'Обработано лент: {len(user_ids)}')
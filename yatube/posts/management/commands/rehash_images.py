@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.template.defaultfilters import filesizeformat
+from sorl.thumbnail import default
+
+from posts import thumbnails
+from posts.cache import GROUPS, INDEX, bump_generations
+from posts.models import Post
+from posts.storage import HASHED_NAME
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов, загруженные до posts.storage, в '
+        'хранилище по содержимому: файл получает имя по SHA-256, '
+        'одинаковые файлы становятся одним. Старый файл и его миниатюры '
+        'удаляются, когда на него не остаётся ссылок ни в одном шарде.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько имён файлов читать из базы за раз.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать картинки со старыми именами.')
+
+    def handle(self, *args, **options):
+        self.storage = Post._meta.get_field('image').storage
+        self.aliases = settings.POST_SHARDS or [DEFAULT_DB_ALIAS]
+        self.totals = dict.fromkeys(
+            ('files', 'duplicates', 'posts', 'errors', 'freed'), 0)
+        for alias in self.aliases:
+            for batch in self.legacy_names(alias, options['batch_size']):
+                if options['dry_run']:
+                    self.totals['files'] += len(batch)
+                    continue
+                for name in batch:
+                    self.rehash(alias, name)
+        if self.totals['posts']:
+            # Лента любой страницы зависит от GROUPS.
+            bump_generations(GROUPS, INDEX)
+        totals = self.totals
+        self.stdout.write(
+            f'Картинок: {totals["files"]}, дубликатов: '
+            f'{totals["duplicates"]}, постов: {totals["posts"]}, '
+            f'ошибок: {totals["errors"]}, освобождено: '
+            f'{filesizeformat(totals["freed"])}')
+
+    def legacy_names(self, alias, batch_size):
+        """Пачки имён картинок шарда, ещё не названных по содержимому."""
+        names = Post.objects.using(alias).exclude(image='').exclude(
+            image__regex=rf'{HASHED_NAME}$',
+        ).order_by('image').values_list('image', flat=True).distinct()
+        last = ''
+        while True:
+            batch = list(names.filter(image__gt=last)[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last = batch[-1]
+
+    def rehash(self, alias, name):
+        try:
+            with self.storage.open(name) as file:
+                size = file.size
+                new_name = self.storage.hashed_name(name, file)
+                duplicate = self.storage.exists(new_name)
+                if not duplicate:
+                    self.storage.save(name, file)
+        except OSError as error:
+            self.stderr.write(f'{name}: {error}')
+            self.totals['errors'] += 1
+            return
+        self.totals['files'] += 1
+        self.totals['duplicates'] += duplicate
+        self.totals['posts'] += Post.objects.using(alias).filter(
+            image=name).update(image=new_name)
+        if not any(
+                Post.objects.using(other).filter(image=name).exists()
+                for other in self.aliases):
+            source = thumbnails.source_file(name)
+            default.kvstore.delete_thumbnails(source)
+            default.kvstore.delete(source)
+            self.storage.delete(name)
+            if duplicate:
+                self.totals['freed'] += size
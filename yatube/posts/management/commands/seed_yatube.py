@@ -0,0 +1,263 @@
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from posts import counters
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import chunks
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Отключает auto_now_add, чтобы bulk_create сохранил наши даты."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def skewed_index(rng, size, skew):
+    """Индекс от 0 до size - 1 со степенным распределением.
+
+    Чем больше skew, тем сильнее выборка смещена к первым индексам:
+    при skew=3 на первый 1% индексов приходится около пятой части выборок.
+    """
+    return int(size * rng.random() ** skew)
+
+
+def max_id(model):
+    return model.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+
+def id_range(model, after):
+    """Диапазон id строк, вставленных после строки с id = after.
+
+    Строки одной вставки получают id подряд, но не обязательно начиная
+    с after + 1: счётчик AUTOINCREMENT не откатывается после удалений.
+    """
+    bounds = model.objects.filter(id__gt=after).aggregate(
+        first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return range(0)
+    return range(bounds['first'], bounds['last'] + 1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу большим объёмом правдоподобных данных '
+        'для нагрузочного тестирования.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--follows', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--images', type=int, default=0,
+            help='Сколько разных картинок сгенерировать в MEDIA_ROOT.')
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.1,
+            help='Доля постов с картинкой (при --images > 0).')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--skew', type=float, default=3.0,
+            help='Степень перекоса активности авторов и подписок.')
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределить публикации.')
+        parser.add_argument(
+            '--password', default='password',
+            help='Пароль всех созданных пользователей.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        self.now = timezone.now()
+        self.period = timedelta(days=options['days']).total_seconds()
+
+        users = self.seed_users(options['users'], options['password'])
+        groups = self.seed_groups(options['groups'])
+        images = self.seed_images(options['images'])
+        posts = self.seed_posts(
+            options['posts'], users, groups, images, options['image_ratio'])
+        self.seed_follows(options['follows'], users)
+        self.seed_comments(options['comments'], users, posts)
+        # bulk_create не отправляет сигналы, которые ведут счётчики.
+        counters.reconcile()
+
+    def random_date(self):
+        return self.now - timedelta(seconds=self.rng.random() * self.period)
+
+    def bulk_insert(self, model, objects, total):
+        """Вставляет объекты пачками, каждую пачку в своей транзакции.
+
+        Возвращает диапазон id, занятых новыми строками.
+        """
+        last_id = max_id(model)
+        started = time.monotonic()
+        inserted = 0
+        for chunk in chunks(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(chunk)
+            inserted += len(chunk)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{model.__name__}: {inserted}/{total} '
+                f'({inserted / max(elapsed, 1e-6):.0f} строк/с)',
+                ending='\r')
+        self.stdout.write('')
+        return id_range(model, last_id)
+
+    def seed_users(self, count, password):
+        offset = max_id(User)
+        password = make_password(password)
+        users = (
+            User(
+                username=f'seed{offset + index}',
+                first_name=f'Имя{index}',
+                last_name=f'Фамилия{index}',
+                password=password)
+            for index in range(count)
+        )
+        return self.bulk_insert(User, users, count)
+
+    def seed_groups(self, count):
+        offset = max_id(Group)
+        groups = (
+            Group(
+                title=f'Сообщество {offset + index}',
+                slug=f'seed-group-{offset + index}',
+                description=f'Описание сообщества {offset + index}')
+            for index in range(count)
+        )
+        return self.bulk_insert(Group, groups, count)
+
+    def seed_images(self, count):
+        if not count:
+            return []
+        from PIL import Image
+
+        storage = Post._meta.get_field('image').storage
+        names = []
+        for index in range(count):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            content = BytesIO()
+            Image.new('RGB', (1280, 720), color).save(content, 'JPEG')
+            names.append(storage.save(
+                f'posts/seed_{index}.jpg', ContentFile(content.getvalue())))
+        return names
+
+    def seed_posts(self, count, users, groups, images, image_ratio):
+        if not users:
+            return range(0)
+
+        def posts():
+            for index in range(count):
+                group = None
+                if groups and self.rng.random() < 0.7:
+                    group = groups[skewed_index(self.rng, len(groups), 2)]
+                image = ''
+                if images and self.rng.random() < image_ratio:
+                    image = self.rng.choice(images)
+                yield Post(
+                    text=f'Пост номер {index}. ' * self.rng.randint(1, 20),
+                    pub_date=self.random_date(),
+                    author_id=users[
+                        skewed_index(self.rng, len(users), self.skew)],
+                    group_id=group,
+                    image=image)
+
+        with explicit_dates(Post._meta.get_field('pub_date')):
+            return self.bulk_insert(Post, posts(), count)
+
+    def seed_follows(self, count, users):
+        if len(users) < 2:
+            return range(0)
+        # Пара (user, author) кодируется одним int: так множество
+        # на миллионы подписок помещается в память.
+        stride = users.stop
+        existing = set()
+        followed = Counter()
+        for user, author in Follow.objects.filter(
+                user__gte=users.start, user__lt=users.stop,
+                author__gte=users.start, author__lt=users.stop,
+        ).values_list('user_id', 'author_id'):
+            existing.add(user * stride + author)
+            followed[user] += 1
+        free = {user: len(users) - 1 - followed[user] for user in users}
+        quotas = self.follow_quotas(count, free)
+        count = sum(quota for _, quota in quotas)
+
+        def follows():
+            for user, quota in quotas:
+                for author in self.sample_authors(
+                        user, quota, free[user], users, stride, existing):
+                    yield Follow(user_id=user, author_id=author)
+
+        return self.bulk_insert(Follow, follows(), count)
+
+    def follow_quotas(self, count, free):
+        """Сколько подписок оформить каждому пользователю.
+
+        Пользователи с меньшим числом свободных авторов разбираются
+        первыми, остаток делится поровну между следующими: так набирается
+        min(count, сумма free) подписок, и никому не достаётся больше,
+        чем у него свободных авторов.
+        """
+        order = sorted(free, key=lambda user: (free[user], self.rng.random()))
+        quotas = []
+        for index, user in enumerate(order):
+            quota = min(free[user], -(-count // (len(order) - index)))
+            count -= quota
+            quotas.append((user, quota))
+        self.rng.shuffle(quotas)
+        return quotas
+
+    def sample_authors(self, user, quota, free, users, stride, existing):
+        """quota разных авторов, на которых user ещё не подписан."""
+        if quota > free // 2:
+            # Нужна большая часть свободных авторов: выбор с повторными
+            # попытками здесь почти всегда промахивается.
+            candidates = [
+                author for author in users
+                if author != user and user * stride + author not in existing]
+            return self.rng.sample(candidates, quota)
+        chosen = set()
+        while len(chosen) < quota:
+            author = users[skewed_index(self.rng, len(users), self.skew)]
+            if author != user and user * stride + author not in existing:
+                chosen.add(author)
+        return sorted(chosen)
+
+    def seed_comments(self, count, users, posts):
+        if not users or not posts:
+            return range(0)
+
+        def comments():
+            for index in range(count):
+                # Свежие посты обсуждают активнее старых.
+                post = posts[-1 - skewed_index(self.rng, len(posts), 2)]
+                yield Comment(
+                    text=f'Комментарий номер {index}',
+                    created=self.random_date(),
+                    author_id=self.rng.choice(users),
+                    post_id=post)
+
+        with explicit_dates(Comment._meta.get_field('created')):
+            return self.bulk_insert(Comment, comments(), count)
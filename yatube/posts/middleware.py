@@ -0,0 +1,81 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from django.utils.translation import get_language_from_request
+
+from .cache import generations_key, page_scopes
+
+
+class AnonymousPageCacheMiddleware:
+    """Кэширует целые страницы лент и постов для анонимных читателей.
+
+    Ключ строится из пути, параметров запроса, языка и поколений областей
+    страницы (posts.cache.page_scopes). Запросы с cookie сессии, CSRF или
+    сообщений идут мимо кэша: такой пользователь может видеть
+    персональную страницу. Попадание в кэш не обращается к базе данных.
+    Middleware должна стоять до SessionMiddleware.
+    """
+    BYPASS_COOKIES = ('messages',)
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.bypass_cookies = {
+            settings.SESSION_COOKIE_NAME,
+            settings.CSRF_COOKIE_NAME,
+            *self.BYPASS_COOKIES,
+        }
+
+    def __call__(self, request):
+        cache_key = self.get_cache_key(request)
+        if cache_key is None:
+            return self.get_response(request)
+
+        response = cache.get(cache_key)
+        if response is not None:
+            response = get_conditional_response(
+                request,
+                etag=response.get('ETag'),
+                last_modified=parse_http_date_safe(
+                    response.get('Last-Modified', '')),
+                response=response)
+            response['X-Page-Cache'] = 'hit'
+            return response
+
+        response = self.get_response(request)
+        if request.method == 'GET' and self.is_cacheable(response):
+            cache.set(
+                cache_key, response, settings.ANONYMOUS_PAGE_CACHE_TIMEOUT)
+        response['X-Page-Cache'] = 'miss'
+        return response
+
+    def get_cache_key(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        if self.bypass_cookies.intersection(request.COOKIES):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        scopes = page_scopes(match.view_name, match.kwargs)
+        if scopes is None:
+            return None
+        query = sorted(request.GET.lists())
+        url = hashlib.md5(
+            f'{request.path}?{query}'.encode()).hexdigest()
+        return 'posts:page:' + hashlib.md5(generations_key(
+            scopes, url, get_language_from_request(request),
+            settings.PAGE_CACHE_VERSION,
+        ).encode()).hexdigest()
+
+    def is_cacheable(self, response):
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and 'private' not in response.get('Cache-Control', '')
+        )
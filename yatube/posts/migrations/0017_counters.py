@@ -0,0 +1,72 @@
+# Generated by Django 2.2.6 on 2026-10-18 20:30
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count_of(queryset, field, outer_field='pk'):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef(outer_field)}).order_by().values(
+            field).annotate(count=Count('pk')).values('count')), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    UserStats = apps.get_model('posts', 'UserStats')
+    # Шарды постов (posts.sharding) мигрируются той же миграцией.
+    db_alias = schema_editor.connection.alias
+
+    Group.objects.using(db_alias).update(
+        posts_count=count_of(Post.objects, 'group'))
+    Post.objects.using(db_alias).update(
+        comments_count=count_of(Comment.objects, 'post'))
+    UserStats.objects.using(db_alias).bulk_create([
+        UserStats(user_id=user_id)
+        for user_id in User.objects.using(db_alias).values_list(
+            'pk', flat=True)
+    ])
+    UserStats.objects.using(db_alias).update(
+        posts_count=count_of(Post.objects, 'author', 'user_id'),
+        followers_count=count_of(Follow.objects, 'author', 'user_id'),
+        following_count=count_of(Follow.objects, 'user', 'user_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0016_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.6 on 2026-10-18 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_post_image_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostRedirect',
+            fields=[
+                ('old_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('new_id', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name_plural': 'Перенаправления постов',
+            },
+        ),
+    ]
@@ -1,17 +1,48 @@
-
 from __future__ import annotations
-from django.db import models
+
+import os
+import uuid
+
+from django.conf import settings
+from django.db import connections, models, router
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth import get_user_model
+from django.core.files.images import get_image_dimensions
+
+from . import images, sharding
+from .storage import image_storage
 
 
 User = get_user_model()
 
 
-class Group(models.Model):
+class CountersMixin:
+    """Не перезаписывает счётчики при сохранении загруженного объекта.
+
+    Счётчики меняет только posts.counters через UPDATE с F(): значение
+    в памяти к моменту save() могло устареть.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Group(CountersMixin, models.Model):
 
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Постов')
+
+    counter_fields = ('posts_count',)
 
     class Meta:
         default_related_name = 'groups'
@@ -21,7 +52,31 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class ShardedQuerySet(models.QuerySet):
+
+    def create(self, **kwargs):
+        if self._db is None and sharding.enabled():
+            # QuerySet.create сохранил бы объект в self.db; шард по самому
+            # объекту выбирает ShardRouter.
+            obj = self.model(**kwargs)
+            obj.save(force_insert=True)
+            return obj
+        return super().create(**kwargs)
+
+
+class PostQuerySet(ShardedQuerySet):
+    """Запросы к шарду, в котором лежат нужные посты (posts.sharding)."""
+
+    def for_author(self, author_id):
+        return self.using(sharding.shard_for_author(author_id)).filter(
+            author_id=author_id)
+
+    def for_post(self, post_id):
+        return self.using(sharding.shard_for_post(post_id)).filter(
+            pk=post_id)
+
+
+class Post(CountersMixin, models.Model):
 
     text = models.TextField(
         verbose_name='Текст поста', help_text='Введите текст поста')
@@ -29,6 +84,9 @@ class Post(models.Model):
     pub_date = models.DateTimeField(
         auto_now_add=True, verbose_name='Дата публикации')
 
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Дата изменения')
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -44,17 +102,133 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=image_storage,
         blank=True
     )
+    # Размеры исходной картинки: при рендеринге файл не открывается.
+    image_width = models.PositiveIntegerField(
+        null=True, editable=False, verbose_name='Ширина картинки')
+    image_height = models.PositiveIntegerField(
+        null=True, editable=False, verbose_name='Высота картинки')
+
+    comments_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Комментариев')
+
+    counter_fields = ('comments_count',)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         default_related_name = 'posts'
         verbose_name_plural = 'Посты'
+        # Направления совпадают с ORDER BY лент: индекс читается
+        # по порядку и сортировка не нужна.
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'),
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date_idx'),
+            # Поиск постов по файлу: rehash_images, collect_media.
+            models.Index(fields=['image'], name='post_image_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.text
 
+    def save(self, *args, **kwargs):
+        if self.pk is None and sharding.enabled():
+            # Корзина шарда входит в id, поэтому id выдаётся до вставки.
+            self.pk = sharding.allocate_post_id(self.author_id)
+            kwargs['force_insert'] = True
+        if not self.image:
+            self.image_width = self.image_height = None
+        elif not self.image._committed:
+            # Новая картинка ещё в памяти или во временном файле загрузки.
+            self.image = images.normalize(self.image)
+            self.image_width, self.image_height = get_image_dimensions(
+                self.image)
+        super().save(*args, **kwargs)
+
+
+class PostIdSequence(models.Model):
+    """Общий для всех шардов счётчик id постов (posts.sharding)."""
+
+    class Meta:
+        verbose_name_plural = 'Счётчик id постов'
+
+
+class PostRedirect(models.Model):
+    """Прежний id поста, сменённый командой rebalance_shards.
+
+    Старые ссылки /posts/<old_id>/ перенаправляются на new_id.
+    """
+    old_id = models.BigIntegerField(primary_key=True)
+    new_id = models.BigIntegerField()
+
+    class Meta:
+        verbose_name_plural = 'Перенаправления постов'
+
+
+class ChunkedUpload(models.Model):
+    """Докачиваемая загрузка картинки поста (posts.uploads).
+
+    Присланные куски лежат в файле path, offset — сколько байт получено.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='uploads'
+    )
+    file_name = models.CharField('Имя файла', max_length=255)
+    size = models.PositiveIntegerField('Размер')
+    offset = models.PositiveIntegerField('Получено байт', default=0)
+    sha256 = models.CharField('SHA-256', max_length=64, blank=True)
+    created = models.DateTimeField('Начата', auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'Докачиваемые загрузки'
+
+    def __str__(self) -> str:
+        return f'{self.file_name}: {self.offset}/{self.size}'
+
+    @property
+    def path(self):
+        return os.path.join(settings.POST_UPLOAD_DIR, f'{self.pk}.part')
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые поддерживает posts.counters."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0, verbose_name='Постов')
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписчиков')
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписок')
+
+    class Meta:
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self) -> str:
+        return str(self.user_id)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -73,14 +247,77 @@ class Comment(models.Model):
     created = models.DateTimeField(
         auto_now_add=True, verbose_name='Дата публикации комментария')
 
+    objects = ShardedQuerySet.as_manager()
+
     class Meta:
+        ordering = ['created', 'id']
         default_related_name = 'comments'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.text
 
 
+class FollowManager(models.Manager):
+    """Подписка и отписка одним запросом без гонок.
+
+    Повторная подписка не создаёт дубликат: вставку отбрасывает уникальное
+    ограничение unique_follow. Сигналы post_save и post_delete отправляются
+    вручную и только если строка действительно добавлена или удалена.
+    """
+
+    def _db_for_write(self):
+        # self.db — база для чтения, она может оказаться репликой.
+        return self._db or router.db_for_write(self.model)
+
+    def follow(self, user_id, author_id):
+        """Подписывает пользователя; возвращает True, если подписки не было.
+        """
+        using = self._db_for_write()
+        connection = connections[using]
+        ops = connection.ops
+        table = ops.quote_name(self.model._meta.db_table)
+        sql = (
+            f'{ops.insert_statement(ignore_conflicts=True)} {table} '
+            f'({ops.quote_name("user_id")}, {ops.quote_name("author_id")}) '
+            f'VALUES (%s, %s) {ops.ignore_conflicts_suffix_sql(True)}')
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user_id, author_id])
+            if cursor.rowcount != 1:
+                return False
+            pk = ops.last_insert_id(
+                cursor, self.model._meta.db_table, self.model._meta.pk.column)
+        follow = self.model(pk=pk, user_id=user_id, author_id=author_id)
+        follow._state.adding = False
+        follow._state.db = using
+        post_save.send(
+            sender=self.model, instance=follow, created=True,
+            update_fields=None, raw=False, using=using)
+        return True
+
+    def unfollow(self, user_id, author_id):
+        """Отписывает пользователя; возвращает True, если подписка была."""
+        using = self._db_for_write()
+        connection = connections[using]
+        ops = connection.ops
+        sql = (
+            f'DELETE FROM {ops.quote_name(self.model._meta.db_table)} '
+            f'WHERE {ops.quote_name("user_id")} = %s '
+            f'AND {ops.quote_name("author_id")} = %s')
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user_id, author_id])
+            if cursor.rowcount == 0:
+                return False
+        follow = self.model(user_id=user_id, author_id=author_id)
+        post_delete.send(sender=self.model, instance=follow, using=using)
+        return True
+
+
 class Follow(models.Model):
     user = models.ForeignKey(
         User,
@@ -95,9 +332,51 @@ class Follow(models.Model):
         related_name='following'
     )
 
+    objects = FollowManager()
+
     class Meta:
         default_related_name = 'follow'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'),
+        ]
 
     def __str__(self) -> str:
         return self.user.username
+
+
+class TimelineEntry(models.Model):
+    """Строка материализованной ленты подписок пользователя.
+
+    pub_date копируется из поста, чтобы лента читалась по индексу
+    (user, pub_date, post) без соединения с таблицей постов.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Читатель',
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='timeline_entries'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user_id}: {self.post_id}'
@@ -0,0 +1,211 @@
+import base64
+import binascii
+from collections.abc import Sequence
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(post):
+    """Упаковывает позицию поста в ленте (pub_date, id) в непрозрачный токен.
+    """
+    raw = f'{post.pub_date.isoformat()}|{post.pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает пару (pub_date, id), закодированную в токене."""
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(token)
+    if pub_date is None:
+        raise InvalidCursor(token)
+    return pub_date, pk
+
+
+def seek(queryset, pub_date=None, pk=None, descending=True, id_field='id'):
+    """Строки queryset за позицией (pub_date, pk) в порядке обхода ленты.
+
+    Без позиции — с начала ленты. id_field — поле, которое хранит id поста
+    (например, post_id у строк материализованной ленты).
+    """
+    if descending:
+        if pub_date is not None:
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, **{f'{id_field}__lt': pk}))
+        return queryset.order_by('-pub_date', f'-{id_field}')
+    queryset = queryset.filter(
+        Q(pub_date__gt=pub_date)
+        | Q(pub_date=pub_date, **{f'{id_field}__gt': pk}))
+    return queryset.order_by('pub_date', id_field)
+
+
+class CursorPage(Sequence):
+    """Страница ленты, построенная по курсору.
+
+    Повторяет интерфейс django.core.paginator.Page в той части, которой
+    пользуются шаблоны, но не знает ни номера страницы, ни их количества.
+    """
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return encode_cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        return encode_cursor(self.object_list[0])
+
+
+class CursorPaginator:
+    """Keyset-пагинация ленты постов по (pub_date, id).
+
+    Каждая страница выбирается одним запросом с условием по ключу
+    сортировки и LIMIT, поэтому стоимость не зависит от глубины страницы,
+    а COUNT(*) не выполняется вовсе.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу после (или перед) курсором.
+
+        Некорректный курсор, как и в Paginator.get_page, приводит
+        к первой странице.
+        """
+        try:
+            if before:
+                return self._page_before(*decode_cursor(before))
+            if after:
+                return self._page_after(*decode_cursor(after))
+        except InvalidCursor:
+            pass
+        return self._first_page()
+
+    def _seek(self, pub_date=None, pk=None, descending=True):
+        # Источник с методом seek (например, posts.timeline.Timeline)
+        # выбирает объекты сам.
+        source_seek = getattr(self.object_list, 'seek', None)
+        if source_seek is not None:
+            return source_seek(pub_date, pk, descending)
+        return seek(self.object_list, pub_date, pk, descending)
+
+    def _fetch(self, *args, **kwargs):
+        return list(self._seek(*args, **kwargs)[:self.per_page + 1])
+
+    def _first_page(self):
+        rows = self._fetch()
+        return CursorPage(
+            rows[:self.per_page], self,
+            has_next=len(rows) > self.per_page, has_previous=False)
+
+    def _page_after(self, pub_date, pk):
+        rows = self._fetch(pub_date, pk)
+        return CursorPage(
+            rows[:self.per_page], self,
+            has_next=len(rows) > self.per_page, has_previous=True)
+
+    def _page_before(self, pub_date, pk):
+        rows = self._fetch(pub_date, pk, descending=False)
+        if not rows:
+            return self._first_page()
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return CursorPage(
+            rows, self, has_next=True, has_previous=has_previous)
+
+
+class WindowedPage(Page):
+
+    @property
+    def page_window(self):
+        return self.paginator.get_elided_page_range(self.number)
+
+
+class WindowedPaginator(Paginator):
+    """Paginator, который отдаёт шаблону только окно номеров страниц.
+
+    В окно попадают первые и последние on_ends страниц и по on_each_side
+    страниц вокруг текущей, пропуски обозначаются ELLIPSIS. Размер
+    разметки не зависит от количества страниц.
+    """
+    ELLIPSIS = '…'
+    on_each_side = 2
+    on_ends = 1
+
+    def __init__(self, *args, count=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Известное заранее число объектов (например, из счётчика)
+        # избавляет от COUNT(*).
+        if count is not None:
+            self.count = count
+
+    def _get_page(self, *args, **kwargs):
+        return WindowedPage(*args, **kwargs)
+
+    def get_elided_page_range(self, number=1, on_each_side=None,
+                              on_ends=None):
+        if on_each_side is None:
+            on_each_side = self.on_each_side
+        if on_ends is None:
+            on_ends = self.on_ends
+        number = self.validate_number(number)
+        num_pages = self.num_pages
+
+        window = []
+        if number > on_each_side + on_ends + 1:
+            window.extend(range(1, on_ends + 1))
+            window.append(self.ELLIPSIS)
+            window.extend(range(number - on_each_side, number + 1))
+        else:
+            window.extend(range(1, number + 1))
+
+        if number < num_pages - on_each_side - on_ends:
+            window.extend(range(number + 1, number + on_each_side + 1))
+            window.append(self.ELLIPSIS)
+            window.extend(range(num_pages - on_ends + 1, num_pages + 1))
+        else:
+            window.extend(range(number + 1, num_pages + 1))
+        return window
@@ -0,0 +1,241 @@
+"""Шардирование постов и комментариев по автору.
+
+POST_SHARDS — алиасы баз из DATABASES; пустой список выключает
+шардирование. Автор попадает в корзину author_id % POST_SHARD_BUCKETS,
+корзина — в шард POST_SHARDS[bucket % len(POST_SHARDS)]. Посты автора
+лежат в шарде его корзины, комментарии — в шарде своего поста.
+Пользователи, группы, подписки и счётчики пользователей остаются
+в default.
+
+Номер корзины входит в id поста (id % POST_SHARD_BUCKETS), поэтому пост
+по id читается из одного шарда. Уникальность id во всех шардах
+обеспечивает общий счётчик PostIdSequence в default. При изменении числа
+шардов корзины переезжают командой rebalance_shards, id постов при этом
+не меняются. Новые id получают только посты, созданные до шардирования;
+их старые адреса перенаправляются по PostRedirect, а счётчик сдвигается
+так, чтобы старый id не достался другому посту.
+
+Каскад удаления пользователя работает только в default, поэтому его
+посты и комментарии в шардах удаляет delete_user_rows.
+
+ShardRouter выбирает базу по подсказке instance: сохранение, удаление
+и связанные менеджеры (author.posts, post.comments) сами попадают
+в нужный шард, а автор и группа поста читаются из default. JOIN между
+базами невозможен, поэтому связанные объекты загружаются
+prefetch_related (with_related). Ленты из нескольких шардов собирает
+ShardedPosts: каждый шард отдаёт свои первые посты, страница
+получается слиянием по (pub_date, id).
+
+Материализованные ленты подписок (FOLLOW_FEED_BACKEND 'timeline'
+и 'merge') ссылаются на посты в default и при шардировании отключаются.
+"""
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import prefetch_related_objects
+
+from core.routers import mark_written
+
+from .paginators import seek
+
+
+SHARDED_MODELS = {'posts.post', 'posts.comment'}
+
+
+def enabled():
+    return bool(settings.POST_SHARDS)
+
+
+def bucket_of(author_id):
+    return author_id % settings.POST_SHARD_BUCKETS
+
+
+def shard_for_bucket(bucket):
+    shards = settings.POST_SHARDS
+    return shards[bucket % len(shards)]
+
+
+def shard_for_author(author_id):
+    """Шард постов автора или None без шардирования."""
+    if not enabled():
+        return None
+    return shard_for_bucket(bucket_of(author_id))
+
+
+def shard_for_post(post_id):
+    """Шард поста по корзине из его id или None без шардирования."""
+    if not enabled():
+        return None
+    return shard_for_bucket(post_id % settings.POST_SHARD_BUCKETS)
+
+
+def shards_for_authors(author_ids):
+    shards = {shard_for_author(author_id) for author_id in author_ids}
+    return [alias for alias in settings.POST_SHARDS if alias in shards]
+
+
+def allocate_post_id(author_id):
+    """Новый id поста автора: номер из общего счётчика и корзина автора."""
+    from .models import PostIdSequence
+
+    number = PostIdSequence.objects.create().pk
+    return number * settings.POST_SHARD_BUCKETS + bucket_of(author_id)
+
+
+def reserve_post_ids(max_id):
+    """Сдвигает счётчик: новые id постов будут больше max_id."""
+    from .models import PostIdSequence
+
+    number = max_id // settings.POST_SHARD_BUCKETS + 1
+    if not PostIdSequence.objects.filter(pk__gte=number).exists():
+        PostIdSequence.objects.create(pk=number)
+
+
+def renumbered(post_id):
+    """Новый id поста, которому rebalance_shards сменил id, или None."""
+    from .models import PostRedirect
+
+    return PostRedirect.objects.filter(old_id=post_id).values_list(
+        'new_id', flat=True).first()
+
+
+def delete_user_rows(user_id):
+    """Удаляет посты и комментарии пользователя во всех шардах.
+
+    Удаление идёт через ORM: сигналы поправят счётчики и кэш, а
+    комментарии к постам пользователя удалятся каскадом в их шарде.
+    """
+    from .models import Comment, Post
+
+    for alias in settings.POST_SHARDS:
+        Comment.objects.using(alias).filter(author_id=user_id).delete()
+        Post.objects.using(alias).filter(author_id=user_id).delete()
+
+
+def with_related(queryset, *lookups, fields=()):
+    """Загружает связанные объекты: JOIN без шардов, prefetch в шардах.
+
+    fields ограничивают выбираемые поля (only) только без шардов: без
+    select_related поля связанных моделей в only не указываются.
+    """
+    if enabled():
+        return queryset.prefetch_related(*lookups)
+    queryset = queryset.select_related(*lookups)
+    if fields:
+        queryset = queryset.only(*fields)
+    return queryset
+
+
+def disable_foreign_keys(sender, connection, **kwargs):
+    """Отключает проверку внешних ключей в шардах.
+
+    Авторы и группы постов живут в default, и ссылки на них из шарда
+    SQLite счёл бы нарушенными.
+    """
+    if (
+        connection.vendor == 'sqlite'
+        and connection.alias != DEFAULT_DB_ALIAS
+        and connection.alias in settings.POST_SHARDS
+    ):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA foreign_keys = OFF')
+
+
+def _shard_of(instance):
+    if instance._meta.label_lower == 'posts.post':
+        if instance.pk is None:
+            return shard_for_author(instance.author_id)
+        return shard_for_post(instance.pk)
+    return shard_for_post(instance.post_id)
+
+
+class ShardRouter:
+
+    def _route(self, model, instance=None, **hints):
+        if not enabled() or instance is None:
+            return None
+        instance_label = instance._meta.label_lower
+        if model._meta.label_lower not in SHARDED_MODELS:
+            if instance_label in SHARDED_MODELS:
+                # Автор, группа и прочие связи поста живут в default.
+                return DEFAULT_DB_ALIAS
+            return None
+        if instance_label in SHARDED_MODELS:
+            return _shard_of(instance)
+        if (
+            model._meta.label_lower == 'posts.post'
+            and instance_label == settings.AUTH_USER_MODEL.lower()
+        ):
+            return shard_for_author(instance.pk)
+        return None
+
+    db_for_read = _route
+
+    def db_for_write(self, model, **hints):
+        alias = self._route(model, **hints)
+        if alias is not None:
+            # Ответ шарда Django берёт, не спрашивая ReplicaRouter.
+            mark_written()
+        return alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if enabled() and SHARDED_MODELS.intersection(
+                (obj1._meta.label_lower, obj2._meta.label_lower)):
+            return True
+        return None
+
+
+class ShardedPosts:
+    """Лента постов из нескольких шардов для пагинаторов.
+
+    queryset — фильтр ленты без привязки к базе, он выполняется в каждом
+    шарде из aliases (по умолчанию во всех). Страница собирается слиянием
+    первых постов каждого шарда; связанные объекты prefetch загружаются
+    одним запросом на страницу.
+    """
+    ordered = True
+
+    def __init__(self, queryset, aliases=None, prefetch=()):
+        self.queryset = queryset
+        self.aliases = (
+            settings.POST_SHARDS if aliases is None else list(aliases))
+        self.prefetch = prefetch
+
+    def count(self):
+        return sum(
+            self.queryset.using(alias).count() for alias in self.aliases)
+
+    def __getitem__(self, index):
+        return self.seek()[index]
+
+    def seek(self, pub_date=None, pk=None, descending=True):
+        return ShardedSlice(self, pub_date, pk, descending)
+
+
+class ShardedSlice:
+    """Посты ленты за позицией (pub_date, pk), выбираемые срезом."""
+
+    def __init__(self, posts, pub_date, pk, descending):
+        self.posts = posts
+        self.pub_date = pub_date
+        self.pk = pk
+        self.descending = descending
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        streams = [
+            seek(
+                self.posts.queryset.using(alias),
+                self.pub_date, self.pk, self.descending,
+            )[:index.stop]
+            for alias in self.posts.aliases
+        ]
+        merged = heapq.merge(
+            *streams, key=lambda post: (post.pub_date, post.pk),
+            reverse=self.descending)
+        posts = list(islice(merged, index.stop))[index]
+        prefetch_related_objects(posts, *self.posts.prefetch)
+        return posts
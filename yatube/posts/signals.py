@@ -0,0 +1,179 @@
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete)
+from django.dispatch import receiver
+
+from core.tasks import run_in_background
+
+from . import (
+    author_timelines, cache, counters, sharding, thumbnails, timeline)
+from .models import Comment, Follow, Group, Post, User
+
+
+@receiver(post_init, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    # Группа могла смениться при редактировании: лента старой группы
+    # тоже должна обновиться.
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+
+
+@receiver(post_init, sender=User)
+def remember_user_names(sender, instance, **kwargs):
+    instance._loaded_names = (
+        instance.__dict__.get('username'),
+        instance.__dict__.get('first_name'),
+        instance.__dict__.get('last_name'))
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_rows(sender, instance, **kwargs):
+    # Пока пользователь есть в default, обработчики удаления постов
+    # находят автора.
+    if sharding.enabled():
+        sharding.delete_user_rows(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, **kwargs):
+    if created:
+        counters.create_user_stats(instance.pk)
+
+
+# Счётчики подключаются раньше invalidate_post: тот запоминает
+# новую группу поста, а здесь нужна прежняя.
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    old_group_id = None
+    if created:
+        counters.change_user(instance.author_id, posts_count=1)
+    else:
+        old_group_id = instance._loaded_group_id
+    if instance.group_id != old_group_id:
+        if old_group_id is not None:
+            counters.change_group(old_group_id, posts_count=-1)
+        if instance.group_id is not None:
+            counters.change_group(instance.group_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, posts_count=-1)
+    if instance.group_id is not None:
+        counters.change_group(instance.group_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post(instance.post_id, comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change_post(instance.post_id, comments_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change_follow(instance.user_id, instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.change_follow(instance.user_id, instance.author_id, -1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, using, **kwargs):
+    scopes = [
+        cache.INDEX,
+        cache.profile_scope(instance.author.username),
+        cache.post_scope(instance.pk),
+    ]
+    group_ids = {instance.group_id, instance._loaded_group_id} - {None}
+    if group_ids:
+        slugs = Group.objects.filter(
+            id__in=group_ids).values_list('slug', flat=True)
+        scopes.extend(cache.group_scope(slug) for slug in slugs)
+    cache.bump_generations_on_commit(*scopes, using=using)
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, using, **kwargs):
+    cache.bump_generations_on_commit(
+        cache.post_scope(instance.post_id), using=using)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, using, **kwargs):
+    cache.bump_generations_on_commit(
+        cache.GROUPS, cache.INDEX, cache.group_scope(instance.slug),
+        using=using)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user(sender, instance, created, using, **kwargs):
+    names = (instance.username, instance.first_name, instance.last_name)
+    old_username = instance._loaded_names[0]
+    # Вход пользователя сохраняет только last_login: кэш не трогаем.
+    changed = not created and names != instance._loaded_names
+    instance._loaded_names = names
+    if not changed:
+        return
+    # Имя автора есть в карточках его постов во всех лентах.
+    cache.bump_generations_on_commit(
+        cache.GROUPS, cache.INDEX, cache.author_scope(instance.pk),
+        *{cache.profile_scope(username)
+          for username in (old_username, instance.username)},
+        using=using)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, using, **kwargs):
+    # Профили обоих показывают число подписчиков и подписок.
+    usernames = User.objects.filter(
+        pk__in=[instance.user_id, instance.author_id],
+    ).values_list('username', flat=True)
+    cache.bump_generations_on_commit(
+        cache.follower_scope(instance.user_id),
+        *(cache.profile_scope(username) for username in usernames),
+        using=using)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created and timeline.enabled():
+        run_in_background(timeline.fan_out, instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def generate_thumbnails(sender, instance, **kwargs):
+    if instance.image:
+        run_in_background(thumbnails.generate_for_post, instance.pk)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_author_timeline(sender, instance, using, **kwargs):
+    # Список автора не правим на месте: см. posts.author_timelines.
+    if kwargs.get('created', True) and author_timelines.enabled():
+        cache.bump_generations_on_commit(
+            cache.author_posts_scope(instance.author_id), using=using)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created and timeline.enabled():
+        run_in_background(
+            timeline.backfill, instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    if timeline.enabled():
+        timeline.drop(instance.user_id, instance.author_id)
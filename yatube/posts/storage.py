@@ -0,0 +1,79 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Файл называется SHA-256 своего содержимого и лежит в двух уровнях
+каталогов по первым символам хэша: posts/ab/cd/abcd….webp. Одинаковые
+картинки хранятся один раз, и миниатюры sorl у них общие. Содержимое по
+адресу никогда не меняется, поэтому такие URL отдаются с
+Cache-Control: immutable (core.views.serve_immutable).
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+HASHED_NAME = r'[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+'
+
+
+def content_hash(content):
+    sha256 = hashlib.sha256()
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def hashed_path(name, digest):
+    """posts/photo.JPG -> posts/ab/cd/abcd….jpg"""
+    directory, basename = posixpath.split(name)
+    extension = os.path.splitext(basename)[1].lower()
+    return posixpath.join(
+        directory, digest[:2], digest[2:4], f'{digest}{extension}')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, где имя файла выводится из его содержимого."""
+
+    def hashed_name(self, name, content):
+        """Имя, под которым будет сохранён content, загруженный как name."""
+        return hashed_path(name, content_hash(content))
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return super().save(
+            self.hashed_name(name, content), content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Файл с тем же именем — тот же файл: суффикс не нужен.
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            # Свежее время изменения защищает файл от collect_media, пока
+            # сохраняется ссылающийся на него пост.
+            os.utime(full_path)
+            return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Пишем во временный файл рядом и подменяем атомарно: параллельная
+        # загрузка той же картинки не увидит недописанный файл.
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return name
+
+
+image_storage = ContentAddressedStorage()
@@ -0,0 +1,52 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts import thumbnails
+from posts.cache import author_scope, get_generations
+
+register = template.Library()
+
+
+def card_key(post, author_generation):
+    group = post.group.slug if post.group_id else ''
+    # Имя картинки меняется без updated_at, когда rehash_images переносит
+    # её в хранилище по содержимому.
+    return (f'posts:card:{post.pk}:{post.updated_at.timestamp()}:{group}:'
+            f'{author_generation}:{post.image.name}')
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Собирает ленту из закэшированных карточек постов.
+
+    Карточки читаются одним get_many; заново рендерятся только те, которых
+    нет в кэше. Ключ карточки меняется при каждом сохранении поста, поэтому
+    правка одного поста перерисовывает только его карточку. Поколения
+    авторов (имя в карточке) читаются ещё одним get_many.
+
+    Миниатюры рендерящихся карточек находятся одним thumbnails.resolve.
+    Карточка, где вместо ещё не готовой миниатюры стоит исходная
+    картинка, не кэшируется.
+    """
+    posts = list(posts)
+    generations = get_generations(
+        list({author_scope(post.author_id) for post in posts}))
+    keys = [
+        card_key(post, generations[author_scope(post.author_id)])
+        for post in posts]
+    cards = cache.get_many(keys)
+    missing = [post for post, key in zip(posts, keys) if key not in cards]
+    fallbacks = {post.pk for post in thumbnails.resolve(missing)}
+    rendered = {}
+    for post, key in zip(posts, keys):
+        if key not in cards:
+            cards[key] = render_to_string(
+                'posts/includes/post_card.html', {'post': post})
+            if post.pk not in fallbacks:
+                rendered[key] = cards[key]
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_CACHE_TIMEOUT)
+    return mark_safe('<hr>'.join(cards[key] for key in keys))
@@ -0,0 +1,135 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import author_timelines
+from ..models import Follow, Post, User
+from .utils import bump_generations_now
+from yatube.settings import MAX_POST_ON_PAGE
+
+
+@override_settings(FOLLOW_FEED_BACKEND='merge')
+@bump_generations_now
+class MergedTimelineTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{index}')
+            for index in range(4)
+        ]
+        for author in cls.authors[:3]:
+            Follow.objects.create(user=cls.reader, author=author)
+        for index in range(MAX_POST_ON_PAGE * 3):
+            Post.objects.create(
+                author=cls.authors[index % len(cls.authors)],
+                text=f'Пост {index}')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed(self, url=None, **params):
+        response = self.client.get(
+            url or reverse('posts:follow_index'), params)
+        return response.context['page_obj']
+
+    def walk(self, url=None):
+        """Все посты ленты по страницам, затем ?before= с последней."""
+        with override_settings(POSTS_CURSOR_PAGINATION=True):
+            post_ids = []
+            page = self.feed(url)
+            while True:
+                post_ids.extend(post.id for post in page)
+                if not page.has_next():
+                    break
+                page = self.feed(url, after=page.next_cursor)
+            previous = []
+            if page.has_previous():
+                previous = [
+                    post.id for post in self.feed(
+                        url, before=page.previous_cursor)]
+        return post_ids, previous, len(page)
+
+    def expected(self, **filters):
+        return list(Post.objects.filter(**filters).order_by(
+            '-pub_date', '-id').values_list('id', flat=True))
+
+    def check_feed(self, url=None, **filters):
+        expected = self.expected(**filters)
+        pages = [
+            [post.id for post in self.feed(url, page=number)]
+            for number in range(1, 4)
+        ]
+        self.assertEqual(sum(pages, [])[:len(expected)], expected)
+
+        post_ids, previous, last_page = self.walk(url)
+        self.assertEqual(post_ids, expected)
+        self.assertEqual(
+            previous,
+            expected[-last_page - MAX_POST_ON_PAGE:-last_page])
+
+    def test_follow_feed_matches_join(self):
+        self.check_feed(author__following__user=self.reader)
+
+    @override_settings(AUTHOR_TIMELINE_LENGTH=3)
+    def test_short_author_lists_fall_back_to_database(self):
+        self.check_feed(author__following__user=self.reader)
+
+    @override_settings(AUTHOR_TIMELINE_LENGTH=3)
+    def test_profile_reads_author_list(self):
+        url = reverse('posts:profile', args=[self.authors[0].username])
+        self.check_feed(url, author=self.authors[0])
+
+    def test_lists_are_updated_on_save_and_delete(self):
+        self.feed()
+        post = Post.objects.create(author=self.authors[0], text='Новый пост')
+        self.assertEqual(self.feed()[0], post)
+        complete, entries = author_timelines.load([self.authors[0].id])[
+            self.authors[0].id]
+        self.assertTrue(complete)
+        self.assertEqual(entries[0], (post.pub_date, post.id))
+
+        post.delete()
+        self.assertNotEqual(self.feed()[0], post)
+
+    def test_post_saved_while_list_is_built_is_not_lost(self):
+        author_id = self.authors[0].id
+        build = author_timelines.build
+        created = []
+
+        def build_before_insert(author_ids):
+            # Читатель прочитал базу, затем писатель закоммитил пост.
+            timelines = build(author_ids)
+            created.append(
+                Post.objects.create(author_id=author_id, text='Новый пост'))
+            return timelines
+
+        with mock.patch.object(
+                author_timelines, 'build', side_effect=build_before_insert):
+            author_timelines.load([author_id])
+        _, entries = author_timelines.load([author_id])[author_id]
+        self.assertEqual(entries[0], (created[0].pub_date, created[0].id))
+
+    @override_settings(AUTHOR_TIMELINE_LENGTH=2)
+    def test_lists_are_built_in_one_query(self):
+        author_ids = [author.id for author in self.authors]
+        with CaptureQueriesContext(connection) as queries:
+            timelines = author_timelines.load(author_ids)
+        self.assertEqual(len(queries), 1)
+        for author_id in author_ids:
+            complete, entries = timelines[author_id]
+            self.assertFalse(complete)
+            self.assertEqual(
+                [post_id for _, post_id in entries],
+                self.expected(author_id=author_id)[:2])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(author_timelines.load(author_ids), timelines)
+        self.assertEqual(len(queries), 0)
@@ -1,13 +1,20 @@
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase, Client
 from django.urls import reverse
 
-from ..models import Post
+from ..models import Group, Post
+from ..templatetags import post_cards
+from .utils import bump_generations_now
+from yatube.settings import MAX_POST_ON_PAGE
 
 
 User = get_user_model()
 
 
+@bump_generations_now
 class TaskURLTests(TestCase):
 
     @classmethod
@@ -15,17 +22,102 @@ class TaskURLTests(TestCase):
         super().setUpClass()
 
         cls.no_user_name = 'noUserName'
+        cls.test_slug = 'test-slug'
         cls.user = User.objects.create_user(username=cls.no_user_name)
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug=cls.test_slug)
         cls.post = Post.objects.create(
             author=cls.user,
             text='Тестовый пост',
+            group=cls.group,
         )
+        cls.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': cls.test_slug}),
+            reverse('posts:profile', kwargs={'username': cls.no_user_name}),
+        ]
 
     def setUp(self):
         self.guest_client = Client()
+        cache.clear()
 
     def test_cache_index_page(self):
         content = self.guest_client.get(reverse('posts:index')).content
-        Post.objects.filter(id=self.post.id).delete()
+        # update() не шлёт сигналов: поколение не меняется.
+        Post.objects.filter(id=self.post.id).update(text='Изменённый текст')
         content_cache = self.guest_client.get(reverse('posts:index')).content
         self.assertEqual(content, content_cache, 'Не работает cache страницы')
+
+    def test_cache_invalidated_on_delete(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.guest_client.get(url)
+        Post.objects.filter(id=self.post.id).delete()
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertNotContains(response, 'Тестовый пост')
+
+    def test_cache_invalidated_on_create(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.guest_client.get(url)
+        Post.objects.create(
+            author=self.user, text='Новый пост', group=self.group)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'Новый пост')
+
+    def test_cache_invalidated_on_group_change(self):
+        other_group = Group.objects.create(title='Другая', slug='other')
+        url = reverse('posts:group_posts', kwargs={'slug': self.test_slug})
+        self.guest_client.get(url)
+        post = Post.objects.get(id=self.post.id)
+        post.group = other_group
+        post.save()
+        self.assertNotContains(self.guest_client.get(url), 'Тестовый пост')
+
+    def test_pages_cached_separately(self):
+        for index in range(MAX_POST_ON_PAGE):
+            Post.objects.create(author=self.user, text=f'Пост {index}')
+        page_1 = self.guest_client.get(reverse('posts:index'))
+        page_2 = self.guest_client.get(reverse('posts:index') + '?page=2')
+        self.assertNotContains(page_1, 'Тестовый пост')
+        self.assertContains(page_2, 'Тестовый пост')
+
+    def test_edit_rerenders_only_edited_card(self):
+        for index in range(3):
+            Post.objects.create(author=self.user, text=f'Пост {index}')
+        self.guest_client.get(reverse('posts:index'))
+
+        post = Post.objects.get(id=self.post.id)
+        post.text = 'Отредактированный пост'
+        post.save()
+        with mock.patch.object(
+                post_cards, 'render_to_string',
+                wraps=post_cards.render_to_string) as render:
+            response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Отредактированный пост')
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(render.call_args[0][1]['post'], post)
+
+    def test_author_rename_rerenders_cards(self):
+        for url in self.urls:
+            self.guest_client.get(url)
+        user = User.objects.get(id=self.user.id)
+        user.first_name = 'Новое'
+        user.last_name = 'Имя'
+        user.save()
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Новое Имя')
+
+    def test_login_keeps_cache(self):
+        self.guest_client.get(reverse('posts:index'))
+        Post.objects.filter(id=self.post.id).update(text='Изменённый текст')
+        self.user.set_password('password')
+        self.user.save()
+        self.client.login(username=self.no_user_name, password='password')
+        self.assertContains(
+            self.guest_client.get(reverse('posts:index')), 'Тестовый пост')
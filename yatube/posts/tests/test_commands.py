@@ -0,0 +1,109 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import F
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+
+class SeedYatubeCommandTest(TestCase):
+
+    def seed(self, **options):
+        options = {
+            'users': 20, 'groups': 3, 'posts': 100, 'follows': 60,
+            'comments': 80, 'batch_size': 30, **options}
+        call_command('seed_yatube', stdout=StringIO(), **options)
+
+    def test_seed_creates_requested_rows(self):
+        self.seed()
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 100)
+        self.assertEqual(Follow.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 80)
+
+    def test_seed_follows_are_unique_and_not_self(self):
+        self.seed(users=5, follows=1000)
+        self.assertEqual(Follow.objects.count(), 5 * 4)
+        self.assertFalse(
+            Follow.objects.filter(user=F('author')).exists())
+
+    def test_seed_follows_fill_all_pairs(self):
+        self.seed(users=40, follows=40 * 39, skew=5)
+        self.assertEqual(Follow.objects.count(), 40 * 39)
+
+    def test_seed_spreads_pub_dates(self):
+        self.seed()
+        self.assertGreater(
+            Post.objects.values('pub_date').distinct().count(), 1)
+
+    def seeded_posts(self):
+        first_user = User.objects.order_by('id').first().id
+        return [
+            (author_id - first_user, text)
+            for author_id, text in Post.objects.order_by('id').values_list(
+                'author_id', 'text')
+        ]
+
+    def test_seed_is_deterministic(self):
+        self.seed()
+        first = self.seeded_posts()
+        User.objects.all().delete()
+        self.seed()
+        self.assertEqual(self.seeded_posts(), first)
+
+
+class ImportFollowsCommandTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = [
+            User.objects.create_user(username=f'user{index}')
+            for index in range(4)
+        ]
+        Follow.objects.create(user=cls.users[0], author=cls.users[1])
+
+    def import_follows(self, lines, *args):
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.csv', delete=False) as source:
+            source.write('\n'.join(lines))
+        self.addCleanup(os.remove, source.name)
+        call_command(
+            'import_follows', source.name, *args, stdout=StringIO())
+
+    def follows(self):
+        return set(Follow.objects.values_list(
+            'user__username', 'author__username'))
+
+    def test_import_by_username(self):
+        self.import_follows([
+            'user0,user1',
+            'user0,user2',
+            'user2,user0',
+            'user2,user0',
+            'user3,user3',
+            'user3,nobody',
+        ], '--batch-size', '2')
+        self.assertEqual(self.follows(), {
+            ('user0', 'user1'), ('user0', 'user2'), ('user2', 'user0')})
+
+    def test_import_refreshes_cached_profiles(self):
+        cache.clear()
+        client = Client()
+        url = reverse('posts:profile', kwargs={'username': 'user3'})
+        self.assertContains(client.get(url), 'Подписчиков: 0, подписок: 0')
+        self.import_follows(['user0,user3', 'user1,user3', 'user3,user0'])
+        self.assertContains(client.get(url), 'Подписчиков: 2, подписок: 1')
+
+    def test_import_by_id(self):
+        first, second = self.users[2].id, self.users[3].id
+        self.import_follows(
+            [f'{first},{second}', f'{second},0', 'x,y'], '--ids')
+        self.assertEqual(self.follows(), {
+            ('user0', 'user1'), ('user2', 'user3')})
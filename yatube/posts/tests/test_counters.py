@@ -0,0 +1,96 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User, UserStats
+
+
+class CountersTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.groups = [
+            Group.objects.create(title=f'Группа {index}', slug=f'g{index}')
+            for index in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def assert_counters_match(self):
+        for user in User.objects.all():
+            stats = self.stats(user)
+            self.assertEqual(stats.posts_count, user.posts.count())
+            self.assertEqual(
+                stats.followers_count, user.following.count())
+            self.assertEqual(
+                stats.following_count, user.follower.count())
+        for post in Post.objects.all():
+            self.assertEqual(post.comments_count, post.comments.count())
+        for group in Group.objects.all():
+            self.assertEqual(group.posts_count, group.posts.count())
+
+    def test_counters_follow_writes(self):
+        post = Post.objects.create(
+            author=self.author, group=self.groups[0], text='Пост')
+        Post.objects.create(author=self.author, text='Пост без группы')
+        Comment.objects.create(post=post, author=self.reader, text='Ответ')
+        Follow.objects.follow(self.reader.id, self.author.id)
+        Follow.objects.follow(self.reader.id, self.author.id)
+        self.assert_counters_match()
+        self.assertEqual(self.stats(self.author).posts_count, 2)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+
+        post.group = self.groups[1]
+        post.save()
+        self.assert_counters_match()
+
+        Follow.objects.unfollow(self.reader.id, self.author.id)
+        post.delete()
+        self.assert_counters_match()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+
+    def test_pages_read_counters(self):
+        Post.objects.create(author=self.author, text='Пост')
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        url = reverse('posts:profile', args=[self.author.username])
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(url)
+        self.assertEqual(response.context['count_of_posts'], 7)
+        self.assertEqual(response.context['followers_count'], 1)
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] for query in queries))
+
+    def test_missing_stats_are_counted_on_read(self):
+        Post.objects.create(author=self.author, text='Пост')
+        UserStats.objects.filter(user=self.author).delete()
+        url = reverse('posts:profile', args=[self.author.username])
+        self.assertEqual(Client().get(url).context['count_of_posts'], 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+
+    def test_reconcile_counters_fixes_drift(self):
+        post = Post.objects.create(
+            author=self.author, group=self.groups[0], text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Ответ')
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.update(posts_count=5, followers_count=5)
+        Post.objects.update(comments_count=5)
+        Group.objects.update(posts_count=5)
+        UserStats.objects.filter(user=self.reader).delete()
+
+        output = StringIO()
+        call_command('reconcile_counters', stdout=output)
+        self.assert_counters_match()
+        self.assertIn('users: исправлено строк 2', output.getvalue())
@@ -98,8 +98,9 @@ class PostPageTest(TestCase):
             post.group.title, self.group.title, 'Неверная группа у поста')
         self.assertEqual(
             post.author.username, self.no_user_name, 'Неверный автор у поста')
-        self.assertEqual(
-            post.image, 'posts/test_gif.gif', 'Неверная картинка у поста')
+        self.assertRegex(
+            post.image.name, r'^posts/(\w\w)/(\w\w)/\1\2\w{60}\.webp$',
+            'Неверная картинка у поста')
 
     def test_form_post_edit_page(self):
         form_data = {
@@ -0,0 +1,42 @@
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from ..images import normalize
+
+
+def upload(name, size, mode='RGB', image_format='JPEG', **params):
+    content = BytesIO()
+    Image.new(mode, size).save(content, image_format, **params)
+    return SimpleUploadedFile(name, content.getvalue())
+
+
+@override_settings(POST_IMAGE_MAX_SIZE=1000)
+class NormalizeTest(SimpleTestCase):
+
+    def open(self, file):
+        return Image.open(BytesIO(file.read()))
+
+    def test_large_photo_is_resized_to_webp_without_metadata(self):
+        exif = Image.Exif()
+        exif[0x0110] = 'Camera'
+        # Поворот на 90°: ширина и высота меняются местами.
+        exif[0x0112] = 6
+        file = normalize(upload(
+            'photo.JPG', (4000, 3000), exif=exif.tobytes()))
+
+        self.assertEqual(file.name, 'photo.webp')
+        image = self.open(file)
+        self.assertEqual(image.format, 'WEBP')
+        self.assertEqual(image.size, (750, 1000))
+        self.assertFalse(image.getexif())
+        self.assertNotIn('icc_profile', image.info)
+
+    def test_small_image_keeps_size_and_transparency(self):
+        file = normalize(upload(
+            'icon.png', (40, 20), mode='RGBA', image_format='PNG'))
+        image = self.open(file)
+        self.assertEqual(image.size, (40, 20))
+        self.assertEqual(image.mode, 'RGBA')
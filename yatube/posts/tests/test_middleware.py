@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Group, Post
+from .utils import bump_generations_now
+
+
+User = get_user_model()
+
+
+@bump_generations_now
+class AnonymousPageCacheMiddlewareTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='noUserName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Тестовый пост', group=cls.group)
+        cls.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'noUserName'}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.id}),
+        ]
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_hit_does_not_touch_database(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.guest_client.get(url)
+                self.assertEqual(first['X-Page-Cache'], 'miss')
+                with self.assertNumQueries(0):
+                    second = self.guest_client.get(url)
+                self.assertEqual(second['X-Page-Cache'], 'hit')
+                self.assertEqual(first.content, second.content)
+
+    def test_query_string_is_part_of_key(self):
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        response = self.guest_client.get(url + '?page=2')
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+    def test_session_cookie_bypasses_cache(self):
+        client = Client()
+        client.force_login(self.user)
+        for _ in range(2):
+            response = client.get(reverse('posts:index'))
+            self.assertFalse(response.has_header('X-Page-Cache'))
+
+    def test_other_pages_are_not_cached(self):
+        response = self.guest_client.get(reverse('about:author'))
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+    def test_writes_invalidate_pages(self):
+        for url in self.urls:
+            self.guest_client.get(url)
+        Post.objects.create(
+            author=self.user, text='Новый пост', group=self.group)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response['X-Page-Cache'], 'miss')
+
+    def test_comment_invalidates_post_page(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        self.guest_client.get(url)
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Новый комментарий')
+        self.assertContains(self.guest_client.get(url), 'Новый комментарий')
+
+    def test_hit_answers_conditional_request(self):
+        url = reverse('posts:index')
+        etag = self.guest_client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
@@ -0,0 +1,109 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Post
+from ..paginators import (
+    CursorPaginator, WindowedPaginator, decode_cursor, encode_cursor)
+from yatube.settings import MAX_POST_ON_PAGE
+
+
+User = get_user_model()
+
+
+class CursorPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='noUserName')
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=f'Тестовый пост {i}')
+            for i in range(MAX_POST_ON_PAGE * 2 + 5)
+        ]
+        # Одинаковая дата у всех постов: порядок держится на id.
+        Post.objects.update(pub_date=cls.posts[0].pub_date)
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_cursor_round_trip(self):
+        post = Post.objects.first()
+        self.assertEqual(
+            decode_cursor(encode_cursor(post)), (post.pub_date, post.pk))
+
+    def test_walk_forward_and_back(self):
+        paginator = CursorPaginator(Post.objects.all(), MAX_POST_ON_PAGE)
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+
+        first = paginator.get_page()
+        self.assertEqual(list(first), expected[:MAX_POST_ON_PAGE])
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+        second = paginator.get_page(after=first.next_cursor)
+        self.assertEqual(
+            list(second), expected[MAX_POST_ON_PAGE:MAX_POST_ON_PAGE * 2])
+        third = paginator.get_page(after=second.next_cursor)
+        self.assertEqual(list(third), expected[MAX_POST_ON_PAGE * 2:])
+        self.assertFalse(third.has_next())
+
+        back = paginator.get_page(before=third.previous_cursor)
+        self.assertEqual(list(back), list(second))
+        back = paginator.get_page(before=back.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_invalid_cursor_returns_first_page(self):
+        paginator = CursorPaginator(Post.objects.all(), MAX_POST_ON_PAGE)
+        for token in ('', 'garbage', '!!!', encode_cursor(self.posts[0])[:5]):
+            with self.subTest(token=token):
+                page = paginator.get_page(after=token)
+                self.assertFalse(page.has_previous())
+
+    def test_no_count_query(self):
+        paginator = CursorPaginator(Post.objects.all(), MAX_POST_ON_PAGE)
+        first = paginator.get_page()
+        with CaptureQueriesContext(connection) as queries:
+            list(paginator.get_page(after=first.next_cursor))
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT(', queries[0]['sql'].upper())
+
+    @override_settings(POSTS_CURSOR_PAGINATION=True)
+    def test_index_view_uses_cursor(self):
+        response = self.guest_client.get(reverse('posts:index'))
+        page = response.context['page_obj']
+        self.assertTrue(page.paginator.is_cursor)
+        self.assertContains(response, f'?after={page.next_cursor}')
+
+        response = self.guest_client.get(
+            reverse('posts:index') + f'?after={page.next_cursor}')
+        self.assertEqual(
+            len(response.context['page_obj']), MAX_POST_ON_PAGE)
+
+
+class WindowedPaginatorTest(TestCase):
+
+    def test_elided_page_range(self):
+        paginator = WindowedPaginator(range(200_000 * 10), 10)
+        ellipsis = WindowedPaginator.ELLIPSIS
+        cases = {
+            1: [1, 2, 3, ellipsis, 200_000],
+            4: [1, 2, 3, 4, 5, 6, ellipsis, 200_000],
+            1000: [
+                1, ellipsis, 998, 999, 1000, 1001, 1002, ellipsis, 200_000],
+            200_000: [1, ellipsis, 199_998, 199_999, 200_000],
+        }
+        for number, window in cases.items():
+            with self.subTest(number=number):
+                page = paginator.get_page(number)
+                self.assertEqual(page.page_window, window)
+
+    def test_short_range_is_not_elided(self):
+        paginator = WindowedPaginator(range(30), 10)
+        self.assertEqual(paginator.get_page(2).page_window, [1, 2, 3])
@@ -0,0 +1,108 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+from yatube.settings import MAX_POST_ON_PAGE
+
+
+class QueryRecorder:
+    """Запоминает SQL и параметры запросов, выполненных соединением."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+@override_settings(BACKGROUND_TASKS_ASYNC=False)
+class QueryPlanTest(TestCase):
+    """Запросы лент читают строки по индексу и не сортируют их отдельно.
+
+    Лента подписок через JOIN (FOLLOW_FEED_BACKEND = 'join') сливает
+    диапазоны индекса по нескольким авторам и без сортировки обойтись
+    не может, поэтому проверяются режимы 'timeline' и 'merge'.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{index}')
+            for index in range(5)
+        ]
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        with override_settings(FOLLOW_FEED_BACKEND='timeline'):
+            for author in cls.authors[:3]:
+                Follow.objects.create(user=cls.reader, author=author)
+            for index in range(MAX_POST_ON_PAGE * 6):
+                cls.post = Post.objects.create(
+                    author=cls.authors[index % len(cls.authors)],
+                    group=cls.group if index % 2 else None,
+                    text=f'Пост {index}')
+        for index in range(5):
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text=f'Комментарий {index}')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def plan(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_plans_use_indexes(self, url, params=None):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        scans = [
+            ['SCAN', table]
+            for table in connection.introspection.table_names()
+        ]
+        for sql, query_params in recorder.queries:
+            if 'posts_' not in sql or not sql.startswith('SELECT'):
+                continue
+            for step in self.plan(sql, query_params):
+                with self.subTest(url=url, sql=sql, step=step):
+                    self.assertNotIn('TEMP B-TREE', step)
+                    # Полный просмотр таблицы, а не подзапроса.
+                    if step.replace('SCAN TABLE', 'SCAN').split()[:2] in scans:
+                        self.assertIn('INDEX', step)
+
+    def cursor(self, url):
+        with override_settings(POSTS_CURSOR_PAGINATION=True):
+            response = self.client.get(url)
+        return response.context['page_obj'].next_cursor
+
+    def test_feeds(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.authors[0].username]),
+        ]
+        for url in urls:
+            self.assert_plans_use_indexes(url)
+            self.assert_plans_use_indexes(url, {'page': 2})
+            self.assert_plans_use_indexes(url, {'after': self.cursor(url)})
+            self.assert_plans_use_indexes(url, {'before': self.cursor(url)})
+
+    def test_follow_feed(self):
+        url = reverse('posts:follow_index')
+        for backend in ('timeline', 'merge'):
+            with override_settings(FOLLOW_FEED_BACKEND=backend):
+                self.assert_plans_use_indexes(url)
+                self.assert_plans_use_indexes(url, {'page': 2})
+                self.assert_plans_use_indexes(
+                    url, {'after': self.cursor(url)})
+
+    def test_post_detail(self):
+        self.assert_plans_use_indexes(
+            reverse('posts:post_detail', args=[self.post.id]))
@@ -0,0 +1,242 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import counters, sharding
+from ..models import Comment, Follow, Group, Post, User
+from yatube.settings import MAX_POST_ON_PAGE
+
+
+SHARDS = ['shard_a', 'shard_b']
+BUCKETS = 4
+
+
+@override_settings(POST_SHARDS=SHARDS, POST_SHARD_BUCKETS=BUCKETS)
+class ShardingTest(TransactionTestCase):
+    """Два шарда в отдельных файлах SQLite рядом с тестовой default.
+
+    TransactionTestCase, а не TestCase: TestCase после каждого теста
+    проверяет внешние ключи, а ссылки из шардов на авторов в default
+    для SQLite всегда нарушены.
+    """
+    databases = {'default', *SHARDS}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        for alias in SHARDS:
+            connections.databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(cls.directory.name, f'{alias}.sqlite3'),
+            }
+            call_command('migrate', database=alias, verbosity=0)
+            # Миграции включают внешние ключи в своём соединении.
+            connections[alias].close()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in SHARDS:
+            connections[alias].close()
+            delattr(connections._connections, alias)
+            del connections.databases[alias]
+        cls.directory.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(title='Группа', slug='group')
+        users = [
+            User.objects.create_user(username=f'user{index}')
+            for index in range(BUCKETS)
+        ]
+        self.authors = {
+            sharding.shard_for_author(user.id): user for user in users}
+        self.reader = users[0]
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def create_posts(self, count):
+        return [
+            Post.objects.create(
+                author=self.authors[SHARDS[index % 2]], group=self.group,
+                text=f'Пост {index}')
+            for index in range(count)
+        ]
+
+    def shard_post_ids(self, alias):
+        return set(Post.objects.using(alias).values_list('id', flat=True))
+
+    def test_posts_are_stored_in_author_shard(self):
+        posts = self.create_posts(4)
+        for post in posts:
+            shard = sharding.shard_for_author(post.author_id)
+            self.assertEqual(post._state.db, shard)
+            self.assertEqual(sharding.shard_for_post(post.id), shard)
+            self.assertIn(post.id, self.shard_post_ids(shard))
+        self.assertFalse(Post.objects.using('default').exists())
+
+    def test_post_detail_and_comment_use_one_shard(self):
+        post = self.create_posts(2)[1]
+        shard = sharding.shard_for_post(post.id)
+        other = next(alias for alias in SHARDS if alias != shard)
+
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.id}),
+            {'text': 'Комментарий'})
+        with CaptureQueriesContext(connections[other]) as queries:
+            response = self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.id}))
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response.context['post'], post)
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            ['Комментарий'])
+        self.assertEqual(
+            response.context['comments'][0].author, self.reader)
+        self.assertEqual(response.context['post'].comments_count, 1)
+        self.assertTrue(
+            Comment.objects.using(shard).filter(post_id=post.id).exists())
+
+    def test_profile_reads_one_shard(self):
+        self.create_posts(4)
+        author = self.authors['shard_b']
+        with CaptureQueriesContext(connections['shard_a']) as queries:
+            response = self.client.get(
+                reverse('posts:profile', kwargs={'username': author}))
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(
+            {post.author for post in response.context['page_obj']}, {author})
+        self.assertEqual(response.context['count_of_posts'], 2)
+
+    def test_feeds_merge_shards(self):
+        posts = self.create_posts(MAX_POST_ON_PAGE + 3)
+        expected = [post.id for post in reversed(posts)]
+        feeds = {
+            'index': reverse('posts:index'),
+            'group': reverse(
+                'posts:group_posts', kwargs={'slug': self.group.slug}),
+        }
+        for name, url in feeds.items():
+            with self.subTest(name):
+                first = self.client.get(url).context['page_obj']
+                second = self.client.get(url, {'page': 2}).context['page_obj']
+                self.assertEqual(
+                    [post.id for post in first] + [post.id for post in second],
+                    expected)
+                self.assertEqual(first[0].author, posts[-1].author)
+                self.assertEqual(first[0].group, self.group)
+
+        with override_settings(POSTS_CURSOR_PAGINATION=True):
+            first = self.client.get(feeds['index']).context['page_obj']
+            second = self.client.get(
+                feeds['index'], {'after': first.next_cursor},
+            ).context['page_obj']
+        self.assertEqual(
+            [post.id for post in first] + [post.id for post in second],
+            expected)
+
+    def test_follow_index_reads_followed_shards(self):
+        self.create_posts(4)
+        author = self.authors['shard_b']
+        Follow.objects.create(user=self.reader, author=author)
+        with CaptureQueriesContext(connections['shard_a']) as queries:
+            response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(
+            [post.author for post in response.context['page_obj']],
+            [author, author])
+
+    def test_reconcile_counts_posts_in_all_shards(self):
+        self.create_posts(4)
+        Post.objects.using('shard_a').update(comments_count=5)
+        Group.objects.update(posts_count=0)
+
+        counters.reconcile()
+
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 4)
+        self.assertFalse(
+            Post.objects.using('shard_a').filter(comments_count=5).exists())
+        for author in self.authors.values():
+            self.assertEqual(counters.user_stats(author).posts_count, 2)
+
+    def test_rebalance_moves_posts_created_without_shards(self):
+        with override_settings(POST_SHARDS=[]):
+            posts = self.create_posts(4)
+            Comment.objects.create(
+                post=posts[1], author=self.reader, text='Комментарий')
+
+        call_command('rebalance_shards', stdout=StringIO())
+
+        self.assertFalse(Post.objects.using('default').exists())
+        self.assertFalse(Comment.objects.using('default').exists())
+        for alias in SHARDS:
+            moved = Post.objects.using(alias)
+            self.assertEqual(moved.count(), 2)
+            for post in moved:
+                self.assertEqual(sharding.shard_for_post(post.id), alias)
+                self.assertEqual(sharding.shard_for_author(post.author_id),
+                                 alias)
+        moved = Post.objects.for_author(posts[1].author_id).get(
+            text=posts[1].text)
+        self.assertEqual(moved.comments.get().text, 'Комментарий')
+
+        output = StringIO()
+        call_command('rebalance_shards', stdout=output)
+        self.assertIn('перенесено постов: 0', output.getvalue())
+
+    def test_rebalance_redirects_old_post_urls(self):
+        with override_settings(POST_SHARDS=[]):
+            posts = self.create_posts(4)
+
+        call_command('rebalance_shards', stdout=StringIO())
+
+        old = posts[1]
+        moved = Post.objects.for_author(old.author_id).get(text=old.text)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': old.id}))
+        self.assertRedirects(
+            response,
+            reverse('posts:post_detail', kwargs={'post_id': moved.id}),
+            status_code=301)
+        created = self.create_posts(1)[0]
+        self.assertGreater(created.id, max(post.id for post in posts))
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': 10 ** 9}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_deleting_user_deletes_shard_rows(self):
+        self.create_posts(4)
+        author = self.authors['shard_b']
+        post = Post.objects.for_author(self.authors['shard_a'].id).first()
+        Comment.objects.create(post=post, author=author, text='Комментарий')
+
+        author.delete()
+
+        self.assertFalse(Post.objects.using('shard_b').filter(
+            author_id=author.id).exists())
+        for alias in SHARDS:
+            self.assertFalse(Comment.objects.using(alias).filter(
+                author_id=author.id).exists())
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 2)
+
+    def test_rebalance_drains_removed_shard(self):
+        self.create_posts(4)
+        with override_settings(POST_SHARDS=['shard_a']):
+            call_command(
+                'rebalance_shards', source=['shard_b'], stdout=StringIO())
+            self.assertEqual(Post.objects.using('shard_a').count(), 4)
+            self.assertFalse(Post.objects.using('shard_b').exists())
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(len(response.context['page_obj']), 4)
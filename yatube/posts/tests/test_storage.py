@@ -0,0 +1,163 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+from sorl.thumbnail import default
+
+from core.views import serve_immutable
+from yatube.settings import BASE_DIR
+
+from ..models import Post, User
+from ..storage import image_storage
+from ..thumbnails import resolve
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=BASE_DIR)
+
+
+def jpeg(color=(200, 100, 50)):
+    content = BytesIO()
+    Image.new('RGB', (60, 40), color).save(content, 'JPEG')
+    return SimpleUploadedFile('photo.jpg', content.getvalue(), 'image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_same_image_is_stored_once(self):
+        first, second = [
+            Post.objects.create(author=self.author, text='Пост', image=jpeg())
+            for _ in range(2)]
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(
+            first.image.name, r'^posts/(\w\w)/(\w\w)/\1\2\w{60}\.webp$')
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(os.listdir(directory), [
+            os.path.basename(first.image.name)])
+
+    def test_hashed_files_are_served_as_immutable(self):
+        name = image_storage.save('posts/a.txt', ContentFile(b'content'))
+        response = serve_immutable(
+            RequestFactory().get('/media/' + name), name,
+            document_root=TEMP_MEDIA_ROOT)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_command_rehashes_and_dedupes_legacy_files(self):
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {index}')
+            for index in range(3)]
+        content = jpeg().read()
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        for index, post in enumerate(posts):
+            # Файлы, загруженные до хранилища по содержимому.
+            name = f'posts/old_{index}.jpg'
+            with open(os.path.join(TEMP_MEDIA_ROOT, name), 'wb') as file:
+                file.write(content)
+            Post.objects.filter(pk=post.pk).update(image=name)
+
+        output = StringIO()
+        call_command('rehash_images', stdout=output)
+
+        self.assertIn(
+            'Картинок: 3, дубликатов: 2, постов: 3, ошибок: 0',
+            output.getvalue())
+        names = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertRegex(name, r'^posts/\w\w/\w\w/\w{64}\.jpg$')
+        self.assertTrue(image_storage.exists(name))
+        for index in range(3):
+            self.assertFalse(image_storage.exists(f'posts/old_{index}.jpg'))
+
+        output = StringIO()
+        call_command('rehash_images', stdout=output)
+        self.assertIn('Картинок: 0', output.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_TASKS_ASYNC=False)
+class CollectMediaCommandTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.kept = Post.objects.create(
+            author=self.author, text='Пост', image=jpeg())
+        deleted = Post.objects.create(
+            author=self.author, text='Удалённый пост', image=jpeg((0, 0, 0)))
+        resolve([self.kept, deleted])
+        self.kept_thumbnail = self.kept.thumbnail.url
+        self.orphan = deleted.image.name
+        self.orphan_thumbnails = [
+            variant.split()[0]
+            for variant in deleted.thumbnail.srcset.split(', ')]
+        deleted.delete()
+        self.stray = default.storage.save(
+            'cache/00/00/stray.jpg', ContentFile(b'stray'))
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def collect(self, **options):
+        output = StringIO()
+        call_command('collect_media', min_age=0, stdout=output, **options)
+        return output.getvalue()
+
+    def media_exists(self, url):
+        return os.path.exists(
+            os.path.join(TEMP_MEDIA_ROOT, url[len('/media/'):]))
+
+    def test_dry_run_changes_nothing(self):
+        output = self.collect(dry_run=True)
+        self.assertIn('Картинки: просмотрено 2, найдено 1', output)
+        self.assertIn('Записи миниатюр: просмотрено 2, найдено 1', output)
+        self.assertIn('Файлы миниатюр: просмотрено 7, найдено 1', output)
+        self.assertTrue(image_storage.exists(self.orphan))
+        self.assertTrue(default.storage.exists(self.stray))
+
+    def test_orphans_are_quarantined_and_thumbnails_removed(self):
+        quarantine = os.path.join(TEMP_MEDIA_ROOT, 'quarantine')
+        output = self.collect(quarantine=quarantine)
+
+        self.assertIn('Картинки: просмотрено 2, убрано 1', output)
+        self.assertIn('Записи миниатюр: просмотрено 2, убрано 1', output)
+        self.assertIn('Файлы миниатюр: просмотрено 4, убрано 1', output)
+        self.assertFalse(image_storage.exists(self.orphan))
+        self.assertTrue(
+            os.path.exists(os.path.join(quarantine, self.orphan)))
+        self.assertTrue(image_storage.exists(self.kept.image.name))
+        self.assertTrue(self.media_exists(self.kept_thumbnail))
+        for url in self.orphan_thumbnails:
+            self.assertFalse(self.media_exists(url))
+        self.assertFalse(default.storage.exists(self.stray))
+
+        self.assertIn('убрано 0', self.collect())
@@ -0,0 +1,168 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
+
+from yatube.settings import BASE_DIR
+
+from .. import thumbnails
+from ..models import Post, User
+from ..thumbnails import BackgroundThumbnailBackend, generate_for_post
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=BASE_DIR)
+
+
+def jpeg(name='photo.jpg', size=(1200, 800)):
+    content = BytesIO()
+    Image.new('RGB', size, (200, 100, 50)).save(content, 'JPEG')
+    return SimpleUploadedFile(name, content.getvalue(), 'image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def create_post(self):
+        return Post.objects.create(
+            author=self.author, text='Пост', image=jpeg())
+
+    def thumbnail(self, post):
+        geometry, options = settings.POST_THUMBNAILS['card'][0]
+        return BackgroundThumbnailBackend().get_thumbnail(
+            post.image, geometry, **options)
+
+    @override_settings(BACKGROUND_TASKS_ASYNC=False)
+    def test_thumbnails_are_created_on_save(self):
+        post = self.create_post()
+        with mock.patch.object(default.engine, 'get_image') as get_image:
+            thumbnail = self.thumbnail(post)
+        get_image.assert_not_called()
+        self.assertNotEqual(thumbnail.name, post.image.name)
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+        self.assertTrue(thumbnail.exists())
+
+    def test_page_does_not_process_images(self):
+        # Фоновые задачи TestCase не выполняет: миниатюры ещё нет.
+        post = self.create_post()
+        with mock.patch.object(default.engine, 'get_image') as get_image:
+            response = Client().get(
+                reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        get_image.assert_not_called()
+        self.assertContains(response, post.image.url)
+
+    def test_command_generates_missing_thumbnails(self):
+        post = self.create_post()
+        self.assertEqual(self.thumbnail(post).name, post.image.name)
+
+        output = StringIO()
+        call_command('generate_thumbnails', workers=0, stdout=output)
+        self.assertIn('Готово картинок: 1, ошибок: 0', output.getvalue())
+        thumbnail = self.thumbnail(post)
+        self.assertNotEqual(thumbnail.name, post.image.name)
+
+        call_command(
+            'generate_thumbnails', workers=0, force=True, stdout=StringIO())
+        self.assertEqual(self.thumbnail(post).name, thumbnail.name)
+
+    def test_image_size_is_stored_on_save(self):
+        post = self.create_post()
+        self.assertEqual((post.image_width, post.image_height), (1200, 800))
+        post.image = None
+        post.save()
+        self.assertEqual((post.image_width, post.image_height), (None, None))
+
+    def test_feed_reads_thumbnails_in_one_query(self):
+        posts = [self.create_post() for _ in range(3)]
+        call_command('generate_thumbnails', workers=0, stdout=StringIO())
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            with mock.patch.object(default.engine, 'get_image') as get_image:
+                response = Client().get(reverse('posts:index'))
+        get_image.assert_not_called()
+        kvstore_queries = [
+            query for query in queries
+            if 'thumbnail_kvstore' in query['sql']]
+        self.assertEqual(len(kvstore_queries), 1)
+        for post in posts:
+            self.assertNotContains(response, post.image.url)
+        self.assertContains(
+            response, 'width="960" height="339"', count=len(posts))
+        thumbnail = self.thumbnail(posts[0])
+        self.assertContains(response, f'src="{thumbnail.url}"')
+        self.assertContains(response, f'{thumbnail.url} 960w')
+        self.assertContains(response, ' 480w, ', count=len(posts))
+        self.assertContains(response, ' 1440w"', count=len(posts))
+
+    def test_feed_shows_source_until_thumbnail_is_ready(self):
+        # Фоновые задачи TestCase не выполняет: миниатюры ещё нет.
+        post = self.create_post()
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(response, post.image.url)
+        self.assertContains(response, 'width="1200" height="800"')
+
+        generate_for_post(post.pk)
+        response = Client().get(reverse('posts:index'))
+        self.assertNotContains(response, post.image.url)
+        self.assertContains(response, 'width="960" height="339"')
+
+    def test_background_thumbnail_refreshes_cached_pages(self):
+        post = self.create_post()
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(response, post.image.url)
+
+        backend = BackgroundThumbnailBackend()
+        with override_settings(BACKGROUND_TASKS_ASYNC=False):
+            for geometry, options in settings.POST_THUMBNAILS['card']:
+                backend.get_thumbnail(post.image, geometry, **options)
+        response = Client().get(reverse('posts:index'))
+        self.assertNotContains(response, post.image.url)
+
+    def test_command_refreshes_cached_pages(self):
+        post = self.create_post()
+        url = reverse('posts:post_detail', kwargs={'post_id': post.id})
+        self.assertContains(Client().get(url), post.image.url)
+
+        call_command('generate_thumbnails', workers=0, stdout=StringIO())
+        self.assertNotContains(Client().get(url), post.image.url)
+
+    def test_schedule_waits_for_commit(self):
+        # TestCase не коммитит: задача не поставлена и не числится
+        # в очереди, после отката её можно поставить снова.
+        post = self.create_post()
+        with mock.patch.object(thumbnails, 'run_in_background') as run:
+            thumbnail = self.thumbnail(post)
+        run.assert_not_called()
+        self.assertEqual(thumbnail.name, post.image.name)
+        self.assertEqual(thumbnails._pending, set())
+
+    def test_command_stores_missing_image_size(self):
+        post = self.create_post()
+        Post.objects.update(image_width=None, image_height=None)
+        call_command('generate_thumbnails', workers=0, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (1200, 800))
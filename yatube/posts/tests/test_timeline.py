@@ -0,0 +1,162 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..cache import follower_scope, get_generations
+from ..models import Follow, Post, TimelineEntry, User
+from yatube.settings import MAX_POST_ON_PAGE
+
+
+@override_settings(
+    FOLLOW_FEED_BACKEND='timeline', BACKGROUND_TASKS_ASYNC=False)
+class TimelineTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{index}')
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def follow(self, author):
+        self.client.get(
+            reverse('posts:profile_follow', args=[author.username]))
+
+    def unfollow(self, author):
+        self.client.get(
+            reverse('posts:profile_unfollow', args=[author.username]))
+
+    def publish(self, count=1):
+        return [
+            Post.objects.create(
+                author=self.authors[index % len(self.authors)],
+                text=f'Пост {index}')
+            for index in range(count)
+        ]
+
+    def feed(self, **params):
+        response = self.client.get(reverse('posts:follow_index'), params)
+        return [post.id for post in response.context['page_obj']]
+
+    def expected_feed(self):
+        return list(Post.objects.filter(
+            author__following__user=self.reader,
+        ).order_by('-pub_date', '-id').values_list('id', flat=True))
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        self.follow(self.authors[0])
+        post = Post.objects.create(author=self.authors[0], text='Новый пост')
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post, pub_date=post.pub_date).exists())
+        self.assertEqual(self.feed(), [post.id])
+
+    def test_follow_backfills_and_unfollow_removes_posts(self):
+        self.publish(6)
+        self.follow(self.authors[1])
+        self.assertEqual(self.feed(), self.expected_feed())
+        self.assertEqual(len(self.feed()), 2)
+
+        self.unfollow(self.authors[1])
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_feed_matches_join_backend(self):
+        for author in self.authors[:2]:
+            self.follow(author)
+        self.publish(MAX_POST_ON_PAGE * 3)
+        expected = self.expected_feed()
+
+        pages = [self.feed(page=number) for number in range(1, 3)]
+        self.assertEqual(sum(pages, []), expected)
+
+        with override_settings(POSTS_CURSOR_PAGINATION=True):
+            feed = []
+            response = self.client.get(reverse('posts:follow_index'))
+            while True:
+                page = response.context['page_obj']
+                feed.extend(post.id for post in page)
+                if not page.has_next():
+                    break
+                response = self.client.get(
+                    reverse('posts:follow_index'),
+                    {'after': page.next_cursor})
+            self.assertEqual(feed, expected)
+            self.assertEqual(
+                self.feed(before=page.previous_cursor),
+                expected[-len(page) - MAX_POST_ON_PAGE:-len(page)])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=1)
+    def test_celebrity_posts_are_merged_at_read_time(self):
+        for author in self.authors:
+            self.follow(author)
+        # Ленты разложены до того, как авторы стали «знаменитостями».
+        for author in self.authors[:2]:
+            Post.objects.create(author=author, text='Старый пост')
+        Follow.objects.create(user=self.authors[0], author=self.authors[1])
+        cache.clear()
+        posts = self.publish(MAX_POST_ON_PAGE)
+
+        self.assertFalse(TimelineEntry.objects.filter(
+            post__in=posts, post__author=self.authors[1]).exists())
+        self.assertTrue(TimelineEntry.objects.filter(
+            post__in=posts, post__author=self.authors[0]).exists())
+        self.assertEqual(
+            self.feed() + self.feed(page=2), self.expected_feed())
+
+    @override_settings(TIMELINE_MAX_LENGTH=5)
+    def test_backfill_trims_timeline(self):
+        self.publish(9)
+        for author in self.authors:
+            self.follow(author)
+        self.assertEqual(
+            list(self.reader.timeline.order_by(
+                '-pub_date', '-post_id').values_list('post_id', flat=True)),
+            self.expected_feed()[:5])
+
+    @override_settings(TIMELINE_MAX_LENGTH=3)
+    def test_long_timeline_is_trimmed_when_read(self):
+        for author in self.authors:
+            self.follow(author)
+        self.publish(5)
+        # Публикация ленты не обрезает: это дорого на каждый пост.
+        self.assertEqual(self.reader.timeline.count(), 5)
+        self.feed()
+        self.assertEqual(
+            list(self.reader.timeline.order_by(
+                '-pub_date', '-post_id').values_list('post_id', flat=True)),
+            self.expected_feed()[:3])
+
+    def test_fan_out_refreshes_only_followers(self):
+        other = User.objects.create_user(username='other')
+        self.follow(self.authors[0])
+        scopes = [follower_scope(self.reader.id), follower_scope(other.id)]
+        before = get_generations(scopes)
+        self.publish(1)
+        after = get_generations(scopes)
+        self.assertNotEqual(after[scopes[0]], before[scopes[0]])
+        self.assertEqual(after[scopes[1]], before[scopes[1]])
+
+    def test_rebuild_timelines_command(self):
+        Follow.objects.create(user=self.reader, author=self.authors[2])
+        with override_settings(FOLLOW_FEED_BACKEND='join'):
+            self.publish(6)
+            orphan = User.objects.create_user(username='orphan')
+            TimelineEntry.objects.create(
+                user=orphan, post=Post.objects.first(),
+                pub_date=Post.objects.first().pub_date)
+        self.assertEqual(self.feed(), [])
+
+        call_command('rebuild_timelines', stdout=StringIO())
+        cache.clear()
+        self.assertEqual(self.feed(), self.expected_feed())
+        self.assertFalse(TimelineEntry.objects.filter(user=orphan).exists())
@@ -0,0 +1,232 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.core.management import call_command
+from django.template.defaultfilters import filesizeformat
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from yatube.settings import BASE_DIR
+
+from .. import uploads
+from ..models import ChunkedUpload, Post, User
+from ..uploads import ImageUploadHandler, StoredUpload
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=BASE_DIR)
+TEMP_UPLOAD_DIR = os.path.join(TEMP_MEDIA_ROOT, 'uploads')
+
+
+def png(size=(20, 10)):
+    content = BytesIO()
+    Image.new('RGB', size, (10, 20, 30)).save(content, 'PNG')
+    return content.getvalue()
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_UPLOAD_DIR=TEMP_UPLOAD_DIR,
+    POST_UPLOAD_CHUNK_SIZE=100)
+class UploadsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Файлы кусков не откатываются вместе с транзакцией теста.
+        shutil.rmtree(TEMP_UPLOAD_DIR, ignore_errors=True)
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create_post(self, **data):
+        return self.client.post(
+            reverse('posts:post_create'), {'text': 'Пост', **data})
+
+    def start(self, content):
+        response = self.client.post(
+            reverse('posts:uploads'),
+            {'file_name': 'photo.png', 'size': len(content)})
+        self.assertEqual(response.status_code, 201)
+        return response.json()['url']
+
+    def send(self, url, offset, chunk):
+        return self.client.patch(
+            url, chunk, content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_handler_hashes_upload_on_disk(self):
+        content = png()
+        handler = ImageUploadHandler()
+        handler.new_file('image', 'photo.png', 'image/png', None)
+        for start in range(0, len(content), 16):
+            handler.receive_data_chunk(content[start:start + 16], start)
+        file = handler.file_complete(len(content))
+
+        self.assertTrue(os.path.exists(file.temporary_file_path()))
+        self.assertEqual(file.read(), content)
+        self.assertEqual(file.sha256, hashlib.sha256(content).hexdigest())
+        file.close()
+
+    def test_handler_stops_reading_rejected_upload(self):
+        request = RequestFactory().post('/')
+        handler = ImageUploadHandler(request)
+        handler.new_file('image', 'photo.png', 'image/png', None)
+        with self.assertRaises(StopUpload) as stop:
+            handler.receive_data_chunk(b'%PDF-1.4 ', 0)
+        self.assertTrue(stop.exception.connection_reset)
+        field, rejected = request.rejected_upload
+        self.assertEqual(field, 'image')
+        self.assertEqual(
+            rejected.upload_error,
+            'Поддерживаются картинки GIF, JPEG, PNG, WEBP.')
+
+    def test_post_form_checks_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(reverse('posts:post_create'), {
+            'text': 'Пост',
+            'image': SimpleUploadedFile('photo.png', png(), 'image/png')})
+        self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertFalse(Post.objects.exists())
+
+    def test_form_rejects_unsupported_format(self):
+        response = self.create_post(image=SimpleUploadedFile(
+            'photo.png', b'%PDF-1.4 ' * 100, 'image/png'))
+        self.assertFormError(
+            response, 'form', 'image',
+            'Поддерживаются картинки GIF, JPEG, PNG, WEBP.')
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_UPLOAD_MAX_SIZE=100)
+    def test_form_rejects_large_file(self):
+        response = self.create_post(
+            image=SimpleUploadedFile('photo.png', png((200, 200))))
+        self.assertFormError(
+            response, 'form', 'image', f'Файл больше {filesizeformat(100)}.')
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_UPLOAD_MAX_PIXELS=100)
+    def test_form_rejects_too_many_pixels(self):
+        response = self.create_post(
+            image=SimpleUploadedFile('photo.png', png()))
+        self.assertFormError(
+            response, 'form', 'image', 'Слишком большая картинка.')
+
+    def test_chunked_upload_resumes_and_attaches_to_post(self):
+        content = png((40, 40))
+        url = self.start(content)
+        self.assertEqual(
+            [upload['url'] for upload in self.client.get(
+                reverse('posts:uploads')).json()['uploads']],
+            [url])
+
+        self.assertEqual(self.send(url, 0, content[:100]).json()['offset'],
+                         100)
+        # Повтор куска после обрыва: сервер сообщает, откуда продолжать.
+        response = self.send(url, 0, content[:100])
+        self.assertEqual(response.status_code, 409)
+        offset = self.client.get(url).json()['offset']
+        while offset < len(content):
+            offset = self.send(
+                url, offset, content[offset:offset + 100]).json()['offset']
+        state = self.client.get(url).json()
+        self.assertEqual(
+            self.client.get(reverse('posts:uploads')).json()['uploads'], [])
+        self.assertTrue(state['complete'])
+        self.assertEqual(state['sha256'], hashlib.sha256(content).hexdigest())
+
+        response = self.create_post(upload=state['id'])
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.endswith('.webp'))
+        self.assertEqual((post.image_width, post.image_height), (40, 40))
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(os.listdir(TEMP_UPLOAD_DIR), [])
+
+    def test_chunked_upload_rejects_unsupported_format(self):
+        url = self.start(b'x' * 50)
+        response = self.send(url, 0, b'x' * 50)
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_incomplete_or_foreign_upload_is_not_attached(self):
+        content = png()
+        url = self.start(content)
+        upload_id = url.rstrip('/').rsplit('/', 1)[1]
+        response = self.create_post(upload=upload_id)
+        self.assertFormError(
+            response, 'form', 'image',
+            'Загрузка не найдена или ещё не завершена.')
+
+        other = Client()
+        other.force_login(User.objects.create_user(username='other'))
+        self.assertEqual(other.get(url).status_code, 404)
+
+    def upload(self, content):
+        """Завершённая докачиваемая загрузка; возвращает её id."""
+        url = self.start(content)
+        for offset in range(0, len(content), 100):
+            self.send(url, offset, content[offset:offset + 100])
+        return url.rstrip('/').rsplit('/', 1)[1]
+
+    def test_attached_file_is_closed(self):
+        upload_id = self.upload(png())
+        for finish in (uploads.close, uploads.release):
+            with self.subTest(finish.__name__):
+                request = RequestFactory().post(
+                    reverse('posts:post_create'), {'upload': upload_id})
+                request.user = self.user
+                uploads.attach(request)
+                file = request.FILES['image']
+                self.assertIsInstance(file, StoredUpload)
+                finish(request)
+                self.assertTrue(file.closed)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    @override_settings(POST_UPLOAD_MAX_PENDING=2)
+    def test_pending_uploads_are_capped(self):
+        self.start(png())
+        self.start(png())
+        response = self.client.post(
+            reverse('posts:uploads'), {'file_name': 'photo.png', 'size': 10})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(ChunkedUpload.objects.count(), 2)
+
+    def test_collect_media_removes_abandoned_uploads(self):
+        self.upload(png())
+        abandoned = ChunkedUpload.objects.get()
+        ChunkedUpload.objects.update(
+            created=timezone.now() - timedelta(hours=2))
+        fresh = self.start(png())
+        stray = os.path.join(TEMP_UPLOAD_DIR, f'{uuid.uuid4()}.part')
+        open(stray, 'wb').close()
+        hour_ago = time.time() - 60 * 60
+        os.utime(stray, (hour_ago, hour_ago))
+
+        output = StringIO()
+        call_command('collect_media', min_age=0.5, stdout=output)
+
+        self.assertIn(
+            'Докачиваемые загрузки: просмотрено 3, убрано 2',
+            output.getvalue())
+        self.assertEqual(
+            [upload['url'] for upload in self.client.get(
+                reverse('posts:uploads')).json()['uploads']],
+            [fresh])
+        self.assertFalse(os.path.exists(abandoned.path))
+        self.assertFalse(os.path.exists(stray))
@@ -1,11 +1,14 @@
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
 
-from ..models import Comment, Group, Post
+from ..models import Comment, Follow, Group, Post
+from .utils import bump_generations_now
 from yatube.settings import MAX_POST_ON_PAGE
 
 
@@ -264,6 +267,7 @@ class PostPageWithImageAndCommentTest(TestCase):
         self.assertEqual(comment, self.comment)
 
 
+@bump_generations_now
 class PostsFollowTest(TestCase):
 
     @classmethod
@@ -330,3 +334,166 @@ class PostsFollowTest(TestCase):
             len(response.context['page_obj']),
             0,
             'Отписка не работает')
+
+    def test_follow_is_idempotent(self):
+        for _ in range(3):
+            self.client_follower.post(self.url_follow)
+        self.assertEqual(
+            Follow.objects.filter(
+                user=self.user_follower,
+                author=self.user_create_posts).count(),
+            1)
+
+    def test_follow_and_unfollow_write_once(self):
+        for url in (self.url_follow, self.url_unfollow):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client_follower.post(url)
+                writes = [
+                    query['sql'] for query in queries
+                    if query['sql'].startswith(('INSERT', 'DELETE'))
+                    and 'posts_follow' in query['sql']]
+                self.assertEqual(len(writes), 1, writes)
+
+    def test_follow_invalidates_feed_only_on_change(self):
+        follow_url = reverse('posts:follow_index')
+        etag = self.client_follower.get(follow_url)['ETag']
+        self.client_follower.post(self.url_follow)
+        followed_etag = self.client_follower.get(follow_url)['ETag']
+        self.assertNotEqual(followed_etag, etag)
+        self.client_follower.post(self.url_follow)
+        self.assertEqual(
+            self.client_follower.get(follow_url)['ETag'], followed_etag)
+        self.client_follower.post(self.url_unfollow)
+        self.assertNotEqual(
+            self.client_follower.get(follow_url)['ETag'], followed_etag)
+
+
+class PostQueryCountTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='noUserName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Тестовый пост', group=cls.group)
+        Comment.objects.create(
+            post=cls.post, author=cls.user, text='Тестовый комментарий')
+        cls.follower = User.objects.create_user(username='follower')
+        Follow.objects.create(user=cls.follower, author=cls.user)
+
+        cls.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'noUserName'}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.id}),
+        ]
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.follower)
+
+    def count_queries(self):
+        counts = {}
+        for url in self.urls:
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            counts[url] = len(queries)
+        return counts
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        before = self.count_queries()
+        for index in range(MAX_POST_ON_PAGE):
+            author = User.objects.create_user(username=f'author{index}')
+            group = Group.objects.create(
+                title=f'Группа {index}', slug=f'group-{index}')
+            Follow.objects.create(user=self.follower, author=author)
+            post = Post.objects.create(
+                author=author, group=group, text=f'Тестовый пост {index}')
+            Post.objects.create(
+                author=self.user, group=self.group, text=f'Пост {index}')
+            Comment.objects.create(
+                post=self.post, author=author, text=f'Комментарий {index}')
+            Comment.objects.create(
+                post=post, author=self.user, text=f'Комментарий {index}')
+        self.assertEqual(self.count_queries(), before)
+
+
+@bump_generations_now
+class PageConditionalGetTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='noUserName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Тестовый пост', group=cls.group)
+        cls.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'noUserName'}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.id}),
+        ]
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def test_not_modified_skips_main_query(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    not_modified = self.authorized_client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertFalse(any(
+                    'posts_post' in query['sql'] for query in queries))
+
+    def test_if_modified_since(self):
+        url = reverse('posts:index')
+        response = self.authorized_client.get(url)
+        not_modified = self.authorized_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_write_changes_validators(self):
+        etags = {
+            url: self.authorized_client.get(url)['ETag']
+            for url in self.urls
+        }
+        Post.objects.create(
+            author=self.user, text='Новый пост', group=self.group)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_relogin_changes_etag(self):
+        # Новый вход меняет секрет CSRF: старая страница с формой
+        # комментария не должна вернуться ответом 304.
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        etag = self.authorized_client.get(url)['ETag']
+        self.authorized_client.logout()
+        self.authorized_client.force_login(self.user)
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_user_and_page(self):
+        url = reverse('posts:index')
+        etag = self.authorized_client.get(url)['ETag']
+        self.assertNotEqual(Client().get(url)['ETag'], etag)
+        self.assertNotEqual(
+            self.authorized_client.get(url + '?page=2')['ETag'], etag)
@@ -0,0 +1,13 @@
+from unittest import mock
+
+from posts import cache
+
+
+def _bump_now(*scopes, using=None):
+    cache.bump_generations(*scopes)
+
+
+# TestCase не коммитит транзакцию теста, и колбэки on_commit в нём не
+# выполняются: тестам инвалидации кэша поколения нужны сразу.
+bump_generations_now = mock.patch.object(
+    cache, 'bump_generations_on_commit', _bump_now)
@@ -0,0 +1,272 @@
+"""Миниатюры картинок постов создаются вне запроса.
+
+Размеры из settings.POST_THUMBNAILS создаются фоновой задачей при
+сохранении поста (posts.signals), для уже загруженных картинок —
+командой generate_thumbnails. Шаблоны постов получают миниатюры через
+resolve: записи о них для всей страницы читаются из key-value store sorl
+одним запросом. BackgroundThumbnailBackend (THUMBNAIL_BACKEND) так же
+ведёт себя в теге {% thumbnail %}: если миниатюры ещё нет, её создание
+ставится в очередь после коммита, а шаблон получает исходную картинку.
+Появившиеся миниатюры сбрасывают кэш страниц с их постами
+(bump_image_pages).
+"""
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.engines import pil_engine
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from core.tasks import run_in_background
+
+from .cache import (
+    INDEX, bump_generations, group_scope, post_scope, profile_scope)
+from .models import Group, Post, User
+
+
+# Миниатюры, создание которых уже стоит в очереди этого процесса.
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def source_file(name):
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+class Thumbnail:
+    """Картинка поста для шаблона: адрес, размеры, если они известны,
+    и srcset из вариантов разной ширины.
+    """
+
+    def __init__(self, url, width=None, height=None, variants=()):
+        self.url = url
+        self.width = width
+        self.height = height
+        self.srcset = ', '.join(
+            f'{variant.url} {variant.width}w'
+            for variant in sorted(variants, key=lambda image: image.width))
+
+
+def create_thumbnail(name, geometry, options):
+    """Создаёт миниатюру, если её ещё нет, и записывает её в key-value store.
+
+    Возвращает True, если миниатюра создана сейчас.
+    """
+    source = source_file(name)
+    thumbnail = BackgroundThumbnailBackend()._thumbnail_file(
+        source, geometry, dict(options))
+    if default.kvstore.get(thumbnail):
+        return False
+    ThumbnailBackend().get_thumbnail(source, geometry, **options)
+    return True
+
+
+def generate(name, force=False):
+    """Создаёт все миниатюры POST_THUMBNAILS картинки name.
+
+    force удаляет существующие миниатюры картинки, чтобы создать их заново.
+    Возвращает True, если создана хотя бы одна миниатюра.
+    """
+    if force:
+        default.kvstore.delete_thumbnails(source_file(name))
+    created = False
+    for variants in settings.POST_THUMBNAILS.values():
+        for geometry, options in variants:
+            created |= create_thumbnail(name, geometry, options)
+    return created
+
+
+def bump_image_pages(names):
+    """Сбрасывает кэш страниц с постами, у которых картинка из names.
+
+    Пока миниатюр не было, эти страницы показывали исходную картинку.
+    """
+    posts = []
+    for alias in settings.POST_SHARDS or [None]:
+        posts.extend(Post.objects.using(alias).filter(
+            image__in=names).values_list('pk', 'author_id', 'group_id'))
+    if not posts:
+        return
+    usernames = User.objects.filter(
+        pk__in={author_id for _, author_id, _ in posts},
+    ).values_list('username', flat=True)
+    slugs = Group.objects.filter(
+        pk__in={group_id for _, _, group_id in posts},
+    ).values_list('slug', flat=True)
+    bump_generations(
+        INDEX,
+        *(post_scope(pk) for pk, _, _ in posts),
+        *(profile_scope(username) for username in usernames),
+        *(group_scope(slug) for slug in slugs))
+
+
+def generate_for_post(post_id):
+    """Создаёт миниатюры поста и сбрасывает кэш страниц с ним."""
+    post = Post.objects.for_post(post_id).first()
+    if post is not None and post.image and generate(post.image.name):
+        bump_image_pages([post.image.name])
+
+
+def source_size(name):
+    """Размеры картинки из key-value store sorl, без чтения файла.
+
+    Запись об исходнике появляется вместе с первой миниатюрой.
+    """
+    source = default.kvstore.get(source_file(name))
+    return source.size if source else None
+
+
+def get_many(image_files):
+    """Записи key-value store о файлах: {key: ImageFile} найденных.
+
+    Для cached_db (по умолчанию) — один get_many кэша и один запрос к базе
+    по промахам кэша; найденное и ненайденное кэшируется, как это делает
+    сам sorl.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, cached_db_kvstore.KVStore):
+        found = ((image_file.key, kvstore.get(image_file))
+                 for image_file in image_files)
+        return {key: value for key, value in found if value}
+    keys = {add_prefix(image_file.key): image_file.key
+            for image_file in image_files}
+    values = kvstore.cache.get_many(list(keys))
+    missing = [key for key in keys if key not in values]
+    if missing:
+        stored = dict(KVStore.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        fetched = {
+            key: stored.get(key, cached_db_kvstore.EMPTY_VALUE)
+            for key in missing}
+        kvstore.cache.set_many(
+            fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    return {
+        keys[key]: deserialize_image_file(value)
+        for key, value in values.items()
+        if value and value != cached_db_kvstore.EMPTY_VALUE
+    }
+
+
+def resolve(posts, size='card'):
+    """Присваивает каждому посту post.thumbnail размера POST_THUMBNAILS[size].
+
+    Записи о всех вариантах миниатюр всех постов читаются разом
+    (get_many), исходные файлы не открываются. Если хотя бы одного
+    варианта ещё нет, его создание ставится в очередь, а пост получает
+    исходную картинку с размерами из Post.image_width и image_height.
+    У постов без картинки thumbnail None. Возвращает посты, которые
+    показаны без миниатюры.
+    """
+    variants = settings.POST_THUMBNAILS[size]
+    backend = BackgroundThumbnailBackend()
+    wanted = []
+    for post in posts:
+        post.thumbnail = None
+        if post.image:
+            source = ImageFile(post.image)
+            wanted.append((post, source, [
+                backend._thumbnail_file(source, geometry, dict(options))
+                for geometry, options in variants]))
+    found = get_many([
+        thumbnail for _, _, thumbnails in wanted for thumbnail in thumbnails])
+    fallbacks = []
+    for post, source, thumbnails in wanted:
+        ready = [
+            found.get(thumbnail.key) or backend.schedule(
+                source, thumbnail, geometry, options)
+            for thumbnail, (geometry, options) in zip(thumbnails, variants)]
+        if all(ready):
+            post.thumbnail = Thumbnail(
+                ready[0].url, ready[0].width, ready[0].height, ready)
+        else:
+            post.thumbnail = Thumbnail(
+                post.image.url, post.image_width, post.image_height)
+            fallbacks.append(post)
+    return fallbacks
+
+
+def _enqueue(key, name, geometry, options):
+    # Вызывается после коммита: при откате транзакции ключ не попадёт
+    # в _pending и миниатюру можно будет поставить в очередь снова.
+    with _pending_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+    run_in_background(_create_pending, key, name, geometry, options)
+
+
+def _create_pending(key, name, geometry, options):
+    try:
+        if create_thumbnail(name, geometry, options):
+            bump_image_pages([name])
+    finally:
+        with _pending_lock:
+            _pending.discard(key)
+
+
+class BackgroundThumbnailBackend(ThumbnailBackend):
+    """Не обрабатывает картинки во время запроса.
+
+    Миниатюра, которой нет в key-value store, создаётся фоновой задачей,
+    а до тех пор вместо неё возвращается исходная картинка.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        source = ImageFile(file_)
+        thumbnail = self._thumbnail_file(
+            source, geometry_string, dict(options))
+        return (
+            default.kvstore.get(thumbnail)
+            or self.schedule(source, thumbnail, geometry_string, options)
+            or source)
+
+    def schedule(self, source, thumbnail, geometry_string, options):
+        """Ставит создание миниатюры в очередь, если её там ещё нет.
+
+        Возвращает миниатюру, если задача уже выполнилась (без
+        BACKGROUND_TASKS_ASYNC), иначе None.
+        """
+        with _pending_lock:
+            scheduled = thumbnail.key in _pending
+        if not scheduled:
+            enqueue = partial(
+                _enqueue, thumbnail.key, source.name, geometry_string,
+                options)
+            if settings.BACKGROUND_TASKS_ASYNC:
+                transaction.on_commit(enqueue)
+            else:
+                enqueue()
+        return default.kvstore.get(thumbnail)
+
+    def _thumbnail_file(self, source, geometry_string, options):
+        # Те же параметры, что добавляет ThumbnailBackend.get_thumbnail:
+        # от них зависит имя миниатюры.
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+
+class Engine(pil_engine.Engine):
+    """PIL-движок sorl для Pillow 10, где нет Image.ANTIALIAS."""
+
+    def _scale(self, image, width, height):
+        return image.resize((width, height), resample=Image.LANCZOS)
@@ -0,0 +1,216 @@
+"""Материализованные ленты подписок (FOLLOW_FEED_BACKEND = 'timeline').
+
+Новый пост раскладывается фоновой задачей по лентам подписчиков автора
+(fan-out on write), поэтому лента читается диапазоном индекса
+(user, pub_date, post) по одному пользователю. Посты авторов, у которых
+подписчиков больше TIMELINE_FANOUT_MAX_FOLLOWERS, в ленты не пишутся:
+их выбирают по индексу автора и сливают с лентой при чтении.
+
+Публикация не обрезает ленты: лишние старые записи не мешают чтению по
+индексу, а лента, ставшая длиннее TIMELINE_MAX_LENGTH, обрезается
+фоновой задачей, когда её владелец читает её (Timeline.count). Ленты
+тех, кто не заходит, обрезает rebuild_timelines --trim-only.
+"""
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils.functional import cached_property
+
+from core.tasks import run_in_background
+
+from . import sharding
+from .cache import bump_generations, follower_scope
+from .models import Follow, Post, TimelineEntry
+from .paginators import seek
+
+
+CELEBRITIES_KEY = 'posts:timeline:celebrities'
+CELEBRITIES_TIMEOUT = 60 * 10
+
+
+def enabled():
+    return (
+        settings.FOLLOW_FEED_BACKEND == 'timeline'
+        and not sharding.enabled())
+
+
+def celebrities():
+    """id авторов, чьи посты подмешиваются к лентам при чтении."""
+    author_ids = cache.get(CELEBRITIES_KEY)
+    if author_ids is None:
+        author_ids = set(
+            Follow.objects.values('author').annotate(
+                followers=Count('id'),
+            ).filter(
+                followers__gt=settings.TIMELINE_FANOUT_MAX_FOLLOWERS,
+            ).values_list('author', flat=True))
+        cache.set(CELEBRITIES_KEY, author_ids, CELEBRITIES_TIMEOUT)
+    return author_ids
+
+
+def followed_celebrities(user_id):
+    author_ids = celebrities()
+    if not author_ids:
+        return []
+    return list(Follow.objects.filter(
+        user_id=user_id, author_id__in=author_ids,
+    ).values_list('author_id', flat=True))
+
+
+def _insert(entries):
+    entries = iter(entries)
+    batch = list(islice(entries, settings.TIMELINE_BATCH_SIZE))
+    while batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        batch = list(islice(entries, settings.TIMELINE_BATCH_SIZE))
+
+
+def fan_out(post_id):
+    """Добавляет пост в ленты подписчиков автора.
+
+    Сбрасываются страницы ленты только тех, кому пост добавлен.
+    """
+    post = Post.objects.filter(pk=post_id).values(
+        'author_id', 'pub_date').first()
+    if post is None or post['author_id'] in celebrities():
+        return
+    followers = Follow.objects.filter(
+        author_id=post['author_id']).values_list('user_id', flat=True)
+    followers = followers.iterator()
+    batch = list(islice(followers, settings.TIMELINE_BATCH_SIZE))
+    while batch:
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(user_id=user_id, post_id=post_id,
+                          pub_date=post['pub_date'])
+            for user_id in batch], ignore_conflicts=True)
+        bump_generations(*(follower_scope(user_id) for user_id in batch))
+        batch = list(islice(followers, settings.TIMELINE_BATCH_SIZE))
+
+
+def trim(user_id):
+    """Оставляет в ленте TIMELINE_MAX_LENGTH последних постов."""
+    boundary = TimelineEntry.objects.filter(user_id=user_id).order_by(
+        '-pub_date', '-post_id',
+    ).values_list('pub_date', 'post_id')[
+        settings.TIMELINE_MAX_LENGTH:settings.TIMELINE_MAX_LENGTH + 1]
+    if boundary:
+        pub_date, post_id = boundary[0]
+        TimelineEntry.objects.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, post_id__lte=post_id),
+            user_id=user_id,
+        ).delete()
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки на него."""
+    if author_id not in celebrities():
+        posts = Post.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id',
+        ).values_list('id', 'pub_date')[:settings.TIMELINE_MAX_LENGTH]
+        _insert(
+            TimelineEntry(user_id=user_id, post_id=post_id,
+                          pub_date=pub_date)
+            for post_id, pub_date in posts)
+        trim(user_id)
+    bump_generations(follower_scope(user_id))
+
+
+def drop(user_id, author_id):
+    """Убирает из ленты посты автора после отписки от него."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def rebuild(user_id):
+    """Собирает ленту пользователя заново по его подпискам."""
+    posts = Post.objects.filter(
+        author__following__user=user_id,
+    ).exclude(
+        author_id__in=celebrities(),
+    ).order_by('-pub_date', '-id').values_list(
+        'id', 'pub_date')[:settings.TIMELINE_MAX_LENGTH]
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        _insert(
+            TimelineEntry(user_id=user_id, post_id=post_id,
+                          pub_date=pub_date)
+            for post_id, pub_date in posts)
+    bump_generations(follower_scope(user_id))
+
+
+class Timeline:
+    """Лента подписок пользователя для пагинаторов.
+
+    posts — QuerySet, которым загружаются посты выбранной страницы
+    (с нужными select_related и only). Поддерживает то, чем пользуются
+    пагинаторы: count(), срезы и seek() для keyset-пагинации.
+    """
+    ordered = True
+
+    def __init__(self, user_id, posts):
+        self.user_id = user_id
+        self.posts = posts
+
+    @cached_property
+    def celebrity_ids(self):
+        return followed_celebrities(self.user_id)
+
+    def count(self):
+        count = TimelineEntry.objects.filter(user_id=self.user_id).count()
+        if count > settings.TIMELINE_MAX_LENGTH:
+            run_in_background(trim, self.user_id)
+        if self.celebrity_ids:
+            count += Post.objects.filter(
+                author_id__in=self.celebrity_ids).count()
+        return count
+
+    def __getitem__(self, index):
+        return self.seek()[index]
+
+    def seek(self, pub_date=None, pk=None, descending=True):
+        return TimelineSlice(self, pub_date, pk, descending)
+
+
+class TimelineSlice:
+    """Посты ленты за позицией (pub_date, pk), выбираемые срезом."""
+
+    def __init__(self, timeline, pub_date, pk, descending):
+        self.timeline = timeline
+        self.pub_date = pub_date
+        self.pk = pk
+        self.descending = descending
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        timeline = self.timeline
+        sources = [
+            seek(TimelineEntry.objects.filter(user_id=timeline.user_id),
+                 self.pub_date, self.pk, self.descending, 'post_id'
+                 ).values_list('pub_date', 'post_id'),
+        ]
+        if timeline.celebrity_ids:
+            sources.append(seek(
+                Post.objects.filter(author_id__in=timeline.celebrity_ids),
+                self.pub_date, self.pk, self.descending,
+            ).values_list('pub_date', 'id'))
+        keys = heapq.merge(
+            *(list(source[:stop]) for source in sources),
+            reverse=self.descending)
+        # Пока автор становится «знаменитостью», его пост может оказаться
+        # и в ленте, и в выборке по автору: одинаковые ключи идут подряд.
+        post_ids = []
+        previous = None
+        for key in keys:
+            if key != previous:
+                post_ids.append(key[1])
+            previous = key
+        post_ids = post_ids[start:stop]
+        posts = timeline.posts.in_bulk(post_ids)
+        return [posts[post_id] for post_id in post_ids if post_id in posts]
@@ -0,0 +1,288 @@
+"""Загрузка картинок постов с ограниченной памятью.
+
+ImageUploadHandler пишет файл формы поста сразу на диск и считает его
+SHA-256; ставит его только форма поста (use_image_handler), остальные
+загрузки проекта идут обработчиками Django. На первом куске, показавшем,
+что файл больше POST_UPLOAD_MAX_SIZE или не в одном из
+POST_UPLOAD_FORMATS, разбор тела прекращается без чтения остатка,
+а форма получает RejectedUpload с текстом ошибки. Поля, стоящие в теле
+после файла, при этом не доходят до формы.
+
+Докачиваемая загрузка идёт мимо формы, кусками не больше
+POST_UPLOAD_CHUNK_SIZE:
+
+    POST  /uploads/                 file_name, size -> {id, url, offset}
+    GET   /uploads/                 незавершённые загрузки пользователя
+    PATCH /uploads/<id>/            заголовок Upload-Offset, тело — кусок
+    GET   /uploads/<id>/            {offset, size, complete, sha256}
+
+После обрыва клиент узнаёт offset и продолжает с него. id завершённой
+загрузки передаётся в поле upload формы поста вместо файла (attach).
+У пользователя не больше POST_UPLOAD_MAX_PENDING загрузок, ещё не
+прикреплённых к посту; брошенные удаляет команда collect_media.
+"""
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile, UploadedFile
+from django.core.files.uploadhandler import (
+    StopUpload, TemporaryFileUploadHandler)
+from django.template.defaultfilters import filesizeformat
+from django.urls import reverse
+
+from .models import ChunkedUpload
+
+
+# Читать тело запроса и файлы на диске блоками этого размера.
+BLOCK_SIZE = 64 * 1024
+
+SIGNATURES = {
+    'JPEG': (b'\xff\xd8\xff',),
+    'PNG': (b'\x89PNG\r\n\x1a\n',),
+    'GIF': (b'GIF87a', b'GIF89a'),
+}
+
+
+class UploadError(Exception):
+    """Загрузка отклонена; status — код ответа докачиваемой загрузки."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_format(head):
+    """Формат картинки по первым байтам файла или None."""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    for image_format, signatures in SIGNATURES.items():
+        if head.startswith(signatures):
+            return image_format
+    return None
+
+
+def check_format(head):
+    if sniff_format(head) not in settings.POST_UPLOAD_FORMATS:
+        raise UploadError(
+            'Поддерживаются картинки '
+            f'{", ".join(sorted(settings.POST_UPLOAD_FORMATS))}.', 415)
+
+
+def check_size(size):
+    if size > settings.POST_UPLOAD_MAX_SIZE:
+        raise UploadError(
+            'Файл больше '
+            f'{filesizeformat(settings.POST_UPLOAD_MAX_SIZE)}.', 413)
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class RejectedUpload(SimpleUploadedFile):
+    """Пустой файл вместо отклонённой загрузки: ошибку показывает форма."""
+
+    def __init__(self, name, error):
+        super().__init__(name or 'upload', b'')
+        self.upload_error = error
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл, проверяя её на каждом куске."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            if start == 0:
+                check_format(raw_data)
+            self.received += len(raw_data)
+            check_size(self.received)
+        except UploadError as error:
+            self.file.close()
+            # Остаток тела не читаем: воркер не должен принимать
+            # гигабайты ненужного файла. Ошибку форме передаёт attach.
+            if self.request is not None:
+                self.request.rejected_upload = (
+                    self.field_name,
+                    RejectedUpload(self.file_name, str(error)))
+            raise StopUpload(connection_reset=True)
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class StoredUpload(UploadedFile):
+    """Завершённая докачиваемая загрузка как файл формы."""
+
+    def __init__(self, upload):
+        super().__init__(
+            open(upload.path, 'rb'), upload.file_name, size=upload.size)
+        self.sha256 = upload.sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def state(upload):
+    return {
+        'id': str(upload.pk),
+        'url': reverse('posts:upload', kwargs={'upload_id': upload.pk}),
+        'offset': upload.offset,
+        'size': upload.size,
+        'complete': upload.complete,
+        'sha256': upload.sha256,
+    }
+
+
+def start(user, file_name, size):
+    """Создаёт докачиваемую загрузку и пустой файл для её кусков."""
+    if size <= 0:
+        raise UploadError('Пустой файл.')
+    check_size(size)
+    if ChunkedUpload.objects.filter(
+            user=user).count() >= settings.POST_UPLOAD_MAX_PENDING:
+        raise UploadError(
+            'Слишком много незавершённых загрузок: завершите или '
+            'дождитесь удаления старых.', 429)
+    upload = ChunkedUpload.objects.create(
+        user=user, file_name=os.path.basename(file_name)[-255:], size=size)
+    os.makedirs(settings.POST_UPLOAD_DIR, exist_ok=True)
+    open(upload.path, 'wb').close()
+    return upload
+
+
+def check_chunk(upload, offset, length):
+    if upload.complete:
+        raise UploadError('Загрузка уже завершена.', 409)
+    if offset != upload.offset:
+        raise UploadError('Кусок должен начинаться с offset.', 409)
+    if length > settings.POST_UPLOAD_CHUNK_SIZE:
+        raise UploadError(
+            'Кусок больше '
+            f'{filesizeformat(settings.POST_UPLOAD_CHUNK_SIZE)}.', 413)
+    if offset + length > upload.size:
+        raise UploadError('Кусок выходит за размер файла.', 413)
+
+
+def write_chunk(path, offset, stream, length):
+    """Копирует кусок в файл блоками; возвращает, сколько байт пришло."""
+    written = 0
+    with open(path, 'r+b') as file:
+        file.seek(offset)
+        while written < length:
+            try:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+            except OSError:
+                break
+            if not block:
+                break
+            if offset + written == 0:
+                check_format(block)
+            file.write(block)
+            written += len(block)
+    return written
+
+
+def append(upload, offset, stream, length):
+    """Дописывает кусок length байт из stream с позиции offset.
+
+    Если запрос оборвался, сохраняется то, что успело прийти: клиент
+    продолжит с нового offset. Завершённой загрузке записывается SHA-256.
+    Файл не в разрешённом формате удаляется вместе с загрузкой.
+    """
+    check_chunk(upload, offset, length)
+    try:
+        written = write_chunk(upload.path, offset, stream, length)
+    except UploadError:
+        discard(upload)
+        raise
+    # Параллельный запрос с тем же offset мог успеть раньше.
+    updated = ChunkedUpload.objects.filter(
+        pk=upload.pk, offset=offset).update(offset=offset + written)
+    if not updated:
+        upload.refresh_from_db()
+        raise UploadError('Кусок должен начинаться с offset.', 409)
+    upload.offset = offset + written
+    if upload.complete:
+        upload.sha256 = file_sha256(upload.path)
+        upload.save(update_fields=['sha256'])
+
+
+def discard(upload):
+    path = upload.path
+    upload.delete()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _attached(request):
+    try:
+        upload_id = uuid.UUID(request.POST.get('upload', ''))
+    except ValueError:
+        return None
+    return ChunkedUpload.objects.filter(
+        pk=upload_id, user=request.user).first()
+
+
+def use_image_handler(request):
+    """Ставит ImageUploadHandler на запрос формы поста.
+
+    Вызывается до первого чтения request.POST, поэтому view должна быть
+    csrf_exempt, а проверку CSRF делать сама (csrf_protect).
+    """
+    request.upload_handlers = [ImageUploadHandler(request)]
+
+
+def attach(request, field='image'):
+    """Подставляет в request.FILES[field] загрузку из поля upload формы.
+
+    Файл, пришедший в самой форме, важнее; отклонённый ImageUploadHandler
+    файл становится RejectedUpload. Незавершённая или чужая загрузка тоже
+    становится RejectedUpload.
+    """
+    upload_id = request.POST.get('upload')
+    rejected = getattr(request, 'rejected_upload', None)
+    if rejected is not None:
+        name, file = rejected
+        request.FILES[name] = file
+    if not upload_id or field in request.FILES:
+        return
+    upload = _attached(request)
+    if upload is None or not upload.complete:
+        request.FILES[field] = RejectedUpload(
+            None, 'Загрузка не найдена или ещё не завершена.')
+    else:
+        request.FILES[field] = StoredUpload(upload)
+
+
+def close(request, field='image'):
+    """Закрывает файл, который attach открыл для формы."""
+    file = request.FILES.get(field)
+    if isinstance(file, StoredUpload):
+        file.close()
+
+
+def release(request):
+    """Удаляет загрузку из поля upload, когда пост с ней сохранён."""
+    close(request)
+    upload = _attached(request)
+    if upload is not None:
+        discard(upload)
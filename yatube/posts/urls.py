@@ -17,6 +17,12 @@ urlpatterns = [
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/comment', views.add_comment, name='add_comment'),
+    path('uploads/', views.upload_list, name='uploads'),
+    path(
+        'uploads/<uuid:upload_id>/',
+        views.upload_chunk,
+        name='upload'
+    ),
     path('follow/', views.FollowIndexView.as_view(), name='follow_index'),
     path(
         'profile/<str:username>/follow/',
@@ -0,0 +1,13 @@
+"""Вспомогательные функции management-команд приложения posts."""
+
+
+def chunks(iterable, size):
+    """Пачки по size элементов из iterable; в памяти одна пачка."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -1,35 +1,171 @@
+import hashlib
+from datetime import datetime
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.translation import get_language
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import condition, require_http_methods
 from django.views.generic import ListView
 
+from core.write_queue import WriteTimeout, run_write
+
+from . import (
+    author_timelines, cache, counters, sharding, thumbnails, timeline,
+    uploads)
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import ChunkedUpload, Follow, Group, Post, User
+from .paginators import CursorPaginator, WindowedPaginator
 from yatube.settings import MAX_POST_ON_PAGE
 
 
+# Поля, которые читают карточки постов в лентах: всё остальное не грузим.
+FEED_FIELDS = (
+    'text', 'pub_date', 'updated_at', 'image', 'image_width', 'image_height',
+    'author__username', 'author__first_name', 'author__last_name',
+    'group__slug',
+)
+
+
+WRITE_TIMEOUT_MESSAGE = (
+    'Сервер сейчас перегружен, и запись не подтвердилась. Обновите '
+    'страницу: если изменения нет, повторите попытку.')
+
+
+def page_validators(request, **kwargs):
+    """ETag и Last-Modified страницы по поколениям её областей.
+
+    Считаются без рендеринга и до основного запроса к базе. Результат
+    запоминается в request, чтобы ETag и Last-Modified читали кэш один раз.
+    ETag вошедшего пользователя включает ключ сессии: после нового входа
+    Django меняет и его, и секрет CSRF, а страница со старым токеном
+    в форме комментария не должна браться из кэша браузера.
+    """
+    if not hasattr(request, '_page_validators'):
+        scopes = cache.page_scopes(request.resolver_match.view_name, kwargs)
+        user = request.user
+        session_key = ''
+        if user.is_authenticated:
+            scopes.append(cache.follower_scope(user.id))
+            session_key = request.session.session_key or ''
+        generations, modified = cache.get_scope_state(scopes)
+        tag = ';'.join([
+            f'{scope}={generation}'
+            for scope, generation in generations.items()
+        ] + [
+            str(sorted(request.GET.lists())),
+            str(user.pk),
+            session_key,
+            get_language(),
+            str(settings.PAGE_CACHE_VERSION),
+        ])
+        last_modified = datetime.fromtimestamp(
+            max(modified.values()), tz=timezone.utc)
+        if user.is_authenticated and user.last_login:
+            last_modified = max(last_modified, user.last_login)
+        request._page_validators = (
+            hashlib.md5(tag.encode()).hexdigest(), last_modified)
+    return request._page_validators
+
+
+def page_etag(request, *args, **kwargs):
+    return page_validators(request, **kwargs)[0]
+
+
+def page_last_modified(request, *args, **kwargs):
+    return page_validators(request, **kwargs)[1]
+
+
+page_condition = condition(
+    etag_func=page_etag, last_modified_func=page_last_modified)
+
+
+@method_decorator(page_condition, name='dispatch')
 class IndexView(ListView):
     template_name = 'posts/index.html'
     context_object_name = 'page_obj'
     post_list = Post.objects.all()
+    # Шарды, в которых лежат посты ленты (posts.sharding); None — все.
+    post_shards = None
 
     def get(self, request, *args, **kwargs):
         self.page_number = self.request.GET.get('page')
+        self.after = self.request.GET.get('after')
+        self.before = self.request.GET.get('before')
         return super().get(request, *args, **kwargs)
 
+    def use_cursor_pagination(self):
+        return bool(
+            settings.POSTS_CURSOR_PAGINATION or self.after or self.before)
+
+    def get_cache_scopes(self):
+        return [cache.GROUPS, cache.INDEX]
+
+    def get_page_key(self):
+        if self.after:
+            return f'after={self.after}'
+        if self.before:
+            return f'before={self.before}'
+        return f'page={self.page_number or 1}'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['feed_cache_timeout'] = settings.FEED_CACHE_TIMEOUT
+        context['feed_cache_key'] = cache.generations_key(
+            self.get_cache_scopes(), self.get_page_key(),
+            self.use_cursor_pagination())
+        return context
+
+    def get_post_list(self):
+        if sharding.enabled():
+            return sharding.ShardedPosts(
+                self.post_list, self.post_shards,
+                prefetch=('author', 'group'))
+        return self.post_list.select_related(
+            'author', 'group').only(*FEED_FIELDS)
+
+    def get_post_count(self):
+        """Число постов ленты из счётчика или None, если его нет."""
+        return None
+
     def get_queryset(self):
-        paginator = Paginator(self.post_list, MAX_POST_ON_PAGE)
+        post_list = self.get_post_list()
+        if self.use_cursor_pagination():
+            paginator = CursorPaginator(post_list, MAX_POST_ON_PAGE)
+            return paginator.get_page(after=self.after, before=self.before)
+        paginator = WindowedPaginator(
+            post_list, MAX_POST_ON_PAGE, count=self.get_post_count())
         return paginator.get_page(self.page_number)
 
 
 class FollowIndexView(LoginRequiredMixin, IndexView):
     template_name = 'posts/follow.html'
 
-    def get(self, request, *args, **kwargs):
-        self.post_list = Post.objects.filter(
-            author__following__user=request.user)
-        return super().get(request, *args, **kwargs)
+    def get_cache_scopes(self):
+        return super().get_cache_scopes() + [
+            cache.follower_scope(self.request.user.id)]
+
+    def get_post_list(self):
+        if sharding.enabled():
+            author_ids = list(Follow.objects.filter(
+                user=self.request.user).values_list('author_id', flat=True))
+            self.post_list = Post.objects.filter(author_id__in=author_ids)
+            self.post_shards = sharding.shards_for_authors(author_ids)
+            return super().get_post_list()
+        post_list = super().get_post_list()
+        if timeline.enabled():
+            return timeline.Timeline(self.request.user.id, post_list)
+        if author_timelines.enabled():
+            return author_timelines.MergedTimeline(
+                Follow.objects.filter(user=self.request.user).values_list(
+                    'author_id', flat=True),
+                post_list)
+        return post_list.filter(author__following__user=self.request.user)
 
 
 class GroupView(IndexView):
@@ -42,6 +178,12 @@ class GroupView(IndexView):
         self.title = f'Записи сообщества {self.group.title}'
         return super().get(request, *args, **kwargs)
 
+    def get_cache_scopes(self):
+        return [cache.GROUPS, cache.group_scope(self.group.slug)]
+
+    def get_post_count(self):
+        return self.group.posts_count
+
     def get_context_data(self, **kwargs):
         context = super(GroupView, self).get_context_data(**kwargs)
         context['title'] = self.title
@@ -54,31 +196,72 @@ class ProfileView(IndexView):
 
     def get(self, request, *args, **kwargs):
         author_username = kwargs['username']
-        self.author = get_object_or_404(User, username=author_username)
+        self.author = get_object_or_404(
+            User.objects.select_related('stats'), username=author_username)
+        self.stats = counters.user_stats(self.author)
         self.following = False
         if request.user.id is not None:
             if Follow.objects.filter(
                     user=request.user.id, author=self.author.id).exists():
                 self.following = True
 
-        self.post_list = self.author.posts.all()
+        self.post_list = Post.objects.for_author(self.author.id)
+        if sharding.enabled():
+            self.post_shards = [sharding.shard_for_author(self.author.id)]
         return super().get(request, *args, **kwargs)
 
+    def get_cache_scopes(self):
+        return [cache.GROUPS, cache.profile_scope(self.author.username)]
+
+    def get_post_list(self):
+        post_list = super().get_post_list()
+        if author_timelines.enabled():
+            return author_timelines.MergedTimeline([self.author.id], post_list)
+        return post_list
+
+    def get_post_count(self):
+        return self.stats.posts_count
+
     def get_context_data(self, **kwargs):
         context = super(ProfileView, self).get_context_data(**kwargs)
         title = f'Профайл пользователя {self.author.get_full_name()}'
         context['title'] = title
-        context['count_of_posts'] = self.post_list.count()
+        context['count_of_posts'] = self.stats.posts_count
+        context['followers_count'] = self.stats.followers_count
+        context['following_count'] = self.stats.following_count
         context['author'] = self.author
         context['following'] = self.following
         return context
 
 
+def redirect_renumbered(view_name, post_id):
+    """Постоянный редирект на пост, которому rebalance_shards сменил id."""
+    new_id = sharding.renumbered(post_id)
+    if new_id is None:
+        raise Http404
+    return redirect(view_name, post_id=new_id, permanent=True)
+
+
+def get_post(post_id):
+    """Пост со связями для страницы поста или None."""
+    return sharding.with_related(
+        Post.objects.for_post(post_id), 'author__stats', 'group').first()
+
+
+@page_condition
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comment_form = CommentForm(request.POST or None)
-    comments = post.comments.all()
-    count_of_posts = post.author.posts.all().count()
+    post = get_post(post_id)
+    if post is None:
+        return redirect_renumbered('posts:post_detail', post_id)
+    return render_post(request, post, CommentForm())
+
+
+def render_post(request, post, comment_form, status=200):
+    thumbnails.resolve([post])
+    comments = sharding.with_related(
+        post.comments.all(), 'author',
+        fields=('text', 'post', 'author__username'))
+    count_of_posts = counters.user_stats(post.author).posts_count
     title = f'Пост {post.text[:30]}'
     context = {
         'title': title,
@@ -87,43 +270,68 @@ def post_detail(request, post_id):
         'comment_form': comment_form,
         'comments': comments,
     }
-    return render(request, 'posts/post_detail.html', context)
+    return render(
+        request, 'posts/post_detail.html', context, status=status)
 
 
+# Обработчик загрузки ставится до разбора тела, а CsrfViewMiddleware
+# разобрало бы его раньше view: CSRF проверяется после use_image_handler.
+@csrf_exempt
 @login_required
 def post_create(request):
+    uploads.use_image_handler(request)
+    return _post_create(request)
+
+
+@csrf_protect
+def _post_create(request):
     template = 'posts/create_post.html'
     groups = Group.objects.all()
+    uploads.attach(request)
     form = PostForm(request.POST or None, files=request.FILES or None)
 
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        uploads.release(request)
         return redirect('posts:profile', username=request.user.username)
 
+    uploads.close(request)
     return render(
         request,
         template,
         {'form': form, 'is_edit': False, 'groups': groups})
 
 
+@csrf_exempt
 @login_required
 def post_edit(request, post_id):
+    uploads.use_image_handler(request)
+    return _post_edit(request, post_id)
+
+
+@csrf_protect
+def _post_edit(request, post_id):
     template = 'posts/create_post.html'
-    post = get_object_or_404(Post, pk=post_id)
+    post = Post.objects.for_post(post_id).first()
+    if post is None:
+        return redirect_renumbered('posts:post_edit', post_id)
     groups = Group.objects.all()
     if request.user != post.author:
         return redirect('posts:post_detail', post_id=post_id)
 
+    uploads.attach(request)
     form = PostForm(
         request.POST or None, files=request.FILES or None, instance=post)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        uploads.release(request)
         return redirect('posts:post_detail', post_id=post_id)
 
+    uploads.close(request)
     return render(
         request,
         template,
@@ -133,15 +341,66 @@ def post_edit(request, post_id):
             'is_edit': True})
 
 
+def upload_error(error):
+    return JsonResponse({'error': str(error)}, status=error.status)
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def upload_list(request):
+    if request.method == 'GET':
+        # Незавершённые загрузки: клиент может продолжить их после
+        # перезапуска.
+        pending = ChunkedUpload.objects.filter(
+            user=request.user, sha256='').order_by('created')
+        return JsonResponse(
+            {'uploads': [uploads.state(upload) for upload in pending]})
+    try:
+        upload = uploads.start(
+            request.user, request.POST['file_name'],
+            int(request.POST['size']))
+    except (KeyError, ValueError):
+        return JsonResponse(
+            {'error': 'Нужны file_name и size в байтах.'}, status=400)
+    except uploads.UploadError as error:
+        return upload_error(error)
+    return JsonResponse(uploads.state(upload), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PATCH'])
+def upload_chunk(request, upload_id):
+    upload = get_object_or_404(
+        ChunkedUpload, pk=upload_id, user=request.user)
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return JsonResponse(
+                {'error': 'Нужны заголовки Upload-Offset и Content-Length.'},
+                status=400)
+        try:
+            uploads.append(upload, offset, request, length)
+        except uploads.UploadError as error:
+            return upload_error(error)
+    return JsonResponse(uploads.state(upload))
+
+
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(Post.objects.for_post(post_id))
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        try:
+            run_write(comment.save)
+        except WriteTimeout:
+            # Текст остаётся в форме: пользователь отправит его ещё раз.
+            form.add_error(None, WRITE_TIMEOUT_MESSAGE)
+            return render_post(request, get_post(post_id), form, status=503)
     return redirect('posts:post_detail', post_id=post_id)
 
 
@@ -149,19 +408,17 @@ def add_comment(request, post_id):
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user.id != author.id:
-        current_follow = Follow.objects.filter(
-            user=request.user, author=author).all()
-        if current_follow.count() == 0:
-            follow = Follow()
-            follow.user = request.user
-            follow.author = author
-            follow.save()
+        try:
+            run_write(Follow.objects.follow, request.user.id, author.id)
+        except WriteTimeout:
+            return render(
+                request, 'core/503.html',
+                {'message': WRITE_TIMEOUT_MESSAGE}, status=503)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    follow = Follow.objects.filter(user=request.user, author=author)
-    follow.delete()
+    Follow.objects.unfollow(request.user.id, author.id)
     return redirect('posts:profile', username=username)
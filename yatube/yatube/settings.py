@@ -33,6 +33,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'posts.middleware.AnonymousPageCacheMiddleware',
+    'core.routers.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -72,9 +74,71 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живёт между запросами одного потока: прагмы из
+        # SQLITE_PRAGMAS выполняются раз в минуту, а не на каждый запрос.
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Реплика для чтения (core.routers): путь к копии базы, которую
+# обновляет manage.py sync_replica. None — все запросы идут в default.
+# Страницы, изменённые после последней копии, читаются из default,
+# поэтому чем короче интервал синхронизации, тем больше чтений с реплики.
+REPLICA_DATABASE = None
+REPLICA_DATABASE_ALIAS = None
+if REPLICA_DATABASE:
+    REPLICA_DATABASE_ALIAS = 'replica'
+    DATABASES[REPLICA_DATABASE_ALIAS] = {
+        **DATABASES['default'],
+        'NAME': REPLICA_DATABASE,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = [
+    'posts.sharding.ShardRouter',
+    'core.routers.ReplicaRouter',
+]
+# Страницы только для чтения, которые можно строить по реплике. Ленты
+# подписок здесь нет: её свежесть зависит от подписок пользователя.
+REPLICA_READ_VIEWS = {
+    'posts:index',
+    'posts:group_posts',
+    'posts:profile',
+    'posts:post_detail',
+    'about:author',
+    'about:tech',
+}
+# (view_name, kwargs) -> время последнего изменения данных страницы или
+# None, если они не меняются. Страница, изменённая после последнего
+# sync_replica, читается из default: с реплики она попала бы в кэш лент
+# и ETag устаревшей.
+REPLICA_PAGE_MODIFIED = 'posts.cache.page_modified'
+# После записи пользователь читает из default столько секунд.
+REPLICA_PIN_COOKIE = 'primary_pin'
+REPLICA_PIN_SECONDS = 10
+
+# Шарды постов и комментариев (posts.sharding): алиасы баз из DATABASES,
+# например ['default', 'posts_1']. Пустой список — всё хранится в default.
+# Автор попадает в корзину author_id % POST_SHARD_BUCKETS, корзина —
+# в шард с номером bucket % len(POST_SHARDS). После изменения списка
+# шардов посты раскладываются командой rebalance_shards.
+POST_SHARDS = []
+POST_SHARD_BUCKETS = 1024
+
+# Прагмы каждого нового соединения с SQLite (core.db). WAL позволяет
+# читать во время записи, busy_timeout (мс) заставляет писателя ждать
+# освободившейся блокировки вместо ошибки «database is locked»,
+# synchronous=NORMAL в режиме WAL не теряет целостность при сбое.
+# Сравнить с настройками по умолчанию: manage.py sqlite_benchmark.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — размер кэша страниц в килобайтах.
+    'cache_size': -20000,
+    'temp_store': 'memory',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -125,17 +189,132 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 MAX_POST_ON_PAGE = 10
 
+# Keyset-пагинация лент по ?after=/?before= вместо ?page=N.
+# Ссылки с курсором работают и при выключенном флаге.
+POSTS_CURSOR_PAGINATION = False
+
+# Время жизни фрагментов лент. Устаревшие фрагменты отсекаются
+# поколениями из posts.cache, поэтому TTL может быть большим, если кэш
+# общий для всех процессов (CACHES ниже).
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Карточки постов не устаревают: ключ меняется вместе с Post.updated_at.
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Страницы для анонимных читателей (posts.middleware) сбрасываются
+# поколениями так же, как фрагменты лент.
+ANONYMOUS_PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Входит в ключи страничного кэша и ETag: увеличьте при выкладке,
+# меняющей разметку страниц.
+PAGE_CACHE_VERSION = 1
+
+# Источник ленты подписок: 'join' — запрос через таблицу подписок,
+# 'timeline' — материализованные ленты posts.TimelineEntry (после
+# переключения их заполняет команда rebuild_timelines), 'merge' — слияние
+# кэшированных списков постов авторов (posts.author_timelines); при 'merge'
+# из тех же списков читается и профиль автора.
+FOLLOW_FEED_BACKEND = 'join'
+
+# Посты авторов, у которых подписчиков больше этого числа, не раскладываются
+# по лентам при публикации, а подмешиваются к ленте при чтении.
+TIMELINE_FANOUT_MAX_FOLLOWERS = 10000
+
+# Сколько последних постов хранится в ленте и сколько постов автора
+# добавляется в неё при подписке. Более длинная лента обрезается, когда её
+# читают, или командой rebuild_timelines --trim-only.
+TIMELINE_MAX_LENGTH = 1000
+
+TIMELINE_BATCH_SIZE = 1000
+
+# Длина и время жизни кэшированного списка последних постов автора.
+AUTHOR_TIMELINE_LENGTH = 200
+AUTHOR_TIMELINE_TIMEOUT = 60 * 60 * 24
+
+# Очередь записей (core.write_queue): комментарии и подписки
+# коммитятся пачками до WRITE_QUEUE_MAX_BATCH заданий, собранными
+# за WRITE_QUEUE_MAX_DELAY секунд. Запрос ждёт коммита своей пачки.
+WRITE_QUEUE_ENABLED = False
+WRITE_QUEUE_MAX_BATCH = 100
+WRITE_QUEUE_MAX_DELAY = 0.005
+# Сколько секунд запрос ждёт коммита своей пачки, прежде чем ответить
+# ошибкой.
+WRITE_QUEUE_TIMEOUT = 10
+
+# Фоновые задачи (core.tasks) выполняются в пуле потоков после коммита.
+# False — выполнять их сразу в текущем потоке.
+BACKGROUND_TASKS_ASYNC = True
+BACKGROUND_TASKS_WORKERS = 2
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+# Миниатюры картинок постов создаются в фоне (posts.thumbnails): при
+# сохранении поста и командой generate_thumbnails. Шаблоны получают их
+# через posts.thumbnails.resolve по имени размера. Размер — это варианты
+# одной миниатюры разной ширины для srcset; первый из них идёт в src.
+THUMBNAIL_BACKEND = 'posts.thumbnails.BackgroundThumbnailBackend'
+THUMBNAIL_ENGINE = 'posts.thumbnails.Engine'
+CARD_THUMBNAIL_OPTIONS = {
+    'crop': 'center', 'upscale': True, 'format': 'WEBP', 'quality': 80}
+POST_THUMBNAILS = {
+    'card': [
+        ('960x339', CARD_THUMBNAIL_OPTIONS),
+        ('480x170', CARD_THUMBNAIL_OPTIONS),
+        ('1440x508', CARD_THUMBNAIL_OPTIONS),
+    ],
 }
 
+# Загруженные картинки постов пересохраняются в WebP без метаданных и
+# уменьшаются до POST_IMAGE_MAX_SIZE пикселей по большей стороне
+# (posts.images).
+POST_IMAGE_MAX_SIZE = 2048
+POST_IMAGE_QUALITY = 80
+
+# Картинки постов (posts.uploads) сразу пишутся на диск; файл больше
+# POST_UPLOAD_MAX_SIZE байт или не в формате из POST_UPLOAD_FORMATS
+# отклоняется на первом куске, остаток тела не читается. Обработчик
+# ставят только view формы поста. Картинки больше POST_UPLOAD_MAX_PIXELS
+# отклоняет форма, не раскодируя их.
+POST_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+POST_UPLOAD_MAX_PIXELS = 40_000_000
+POST_UPLOAD_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+# Куски докачиваемых загрузок.
+POST_UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
+POST_UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+# Сколько загрузок, ещё не прикреплённых к посту, может держать один
+# пользователь. Брошенные загрузки старше --min-age часов удаляет
+# collect_media.
+POST_UPLOAD_MAX_PENDING = 5
+
+# Кэш общий для всех процессов сервера: поколения posts.cache и ETag
+# работают, только если увеличенный после записи счётчик видит каждый
+# воркер. YATUBE_CACHE_LOCATION — адреса memcached через запятую
+# (нужен python-memcached). Без неё используется LocMemCache: у каждого
+# процесса свой кэш, это годится только для разработки и тестов, поэтому
+# кэши лент тогда живут минуту — столько другой процесс может показывать
+# старую страницу.
+CACHE_LOCATION = os.environ.get('YATUBE_CACHE_LOCATION')
+if CACHE_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': CACHE_LOCATION.split(','),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    FEED_CACHE_TIMEOUT = 60
+    POST_CARD_CACHE_TIMEOUT = 60
+    ANONYMOUS_PAGE_CACHE_TIMEOUT = 60
+    AUTHOR_TIMELINE_TIMEOUT = 60
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
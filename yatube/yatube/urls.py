@@ -17,7 +17,10 @@ import debug_toolbar
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
+
+from core.views import serve_immutable
+from posts.storage import HASHED_NAME
 
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
@@ -32,6 +35,14 @@ handler403 = 'core.views.permission_denied'
 handler500 = 'core.views.server_error'
 
 if settings.DEBUG:
+    # Картинки постов называются хэшем содержимого (posts.storage). В
+    # продакшене веб-сервер должен отдавать их с тем же Cache-Control.
+    urlpatterns += [
+        re_path(
+            rf'^{settings.MEDIA_URL.lstrip("/")}'
+            rf'(?P<path>posts/{HASHED_NAME})$',
+            serve_immutable, {'document_root': settings.MEDIA_ROOT}),
+    ]
     urlpatterns += static(
         settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
     )